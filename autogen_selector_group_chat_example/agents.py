@@ -1,5 +1,7 @@
 import asyncio
-from typing import List
+import json
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.ui import Console
 from autogen_agentchat.conditions import TextMentionTermination, MaxMessageTermination
@@ -8,13 +10,21 @@ from autogen_ext.models.openai import (
     OpenAIChatCompletionClient,
     AzureOpenAIChatCompletionClient,
 )
-from autogen_ext.tools.mcp import mcp_server_tools, StdioMcpToolAdapter, StdioServerParams
+from autogen_ext.tools.mcp import StdioMcpToolAdapter, StdioServerParams
 from dotenv import load_dotenv
 import os
 import sys
 from pathlib import Path
 import httpx
 from rich.console import Console as RichConsole
+from http_pool import get_http_client, close_http_client
+from mcp_servers import McpServerPool
+from speaker_selection import PlanAssignmentSelector
+from tool_concurrency import limit_concurrency
+from context_compaction import CompactingChatCompletionContext, CompactionStats
+from llm_rate_limit import get_rate_limited_http_client
+from single_flight import single_flight
+from model_routing import ModelRouter
 
 def print_mcp_tools(tools: List[StdioMcpToolAdapter]) -> None:
     """Print available MCP tools and their parameters in a formatted way."""
@@ -42,10 +52,33 @@ def print_mcp_tools(tools: List[StdioMcpToolAdapter]) -> None:
         console.print("─" * 60 + "\n")
 
 
-def get_model_client():
-    return AzureOpenAIChatCompletionClient(
-        model=os.getenv("AZURE_OPENAI_MODEL_NAME"),
-        azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+def get_model_client(deployment: Optional[str] = None, model: Optional[str] = None):
+    temperature = float(os.getenv("AZURE_OPENAI_TEMPERATURE", "0"))
+    # the calls of every team go through the shared rate limiter (see llm_rate_limit.py)
+    http_client = get_rate_limited_http_client()
+    model_client = AzureOpenAIChatCompletionClient(
+        model=model or os.getenv("AZURE_OPENAI_MODEL_NAME"),
+        azure_deployment=deployment or os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"),
+        temperature=temperature,
+        http_client=http_client,
+        # the limiter retries the throttled calls, the SDK retrying them as well would multiply the attempts
+        **({"max_retries": 0} if http_client is not None else {}),
+    )
+    # identical calls the sessions make at the same time share one completion (see single_flight.py)
+    return single_flight(model_client, temperature)
+
+
+def get_model_router() -> ModelRouter:
+    # a model client per role, planning on the large deployment and selection and tool calls on a small one (see model_routing.py)
+    return ModelRouter(get_model_client)
+
+
+def get_model_context(compaction_stats: CompactionStats):
+    # keeps recent turns verbatim and compacts older tool outputs to fit the token budget
+    return CompactingChatCompletionContext(
+        token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000")),
+        keep_recent=int(os.getenv("CONTEXT_KEEP_RECENT_MESSAGES", "6")),
+        stats=compaction_stats,
     )
 
 
@@ -62,94 +95,147 @@ BASE_URL = "http://localhost"
 
 # Stores API Calls
 async def call_get_all_stores() -> str:
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{BASE_URL}:5000/stores/all")
-            response.raise_for_status()
-            return f"All Stores: {response.json()}"
-        except httpx.HTTPStatusError as e:
-            return f"Error getting all stores: {e.response.text}"
+    client = get_http_client()
+    try:
+        response = await client.get(f"{BASE_URL}:5000/stores/all")
+        response.raise_for_status()
+        return f"All Stores: {response.json()}"
+    except httpx.HTTPStatusError as e:
+        return f"Error getting all stores: {e.response.text}"
 
 
 async def call_find_store_by_id(store_id: str) -> str:
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{BASE_URL}:5000/stores/store/{store_id}")
-            response.raise_for_status()
-            return f"Store {store_id}: {response.json()}"
-        except httpx.HTTPStatusError as e:
-            return f"Error finding store by ID {store_id}: {e.response.text}"
+    client = get_http_client()
+    try:
+        response = await client.get(f"{BASE_URL}:5000/stores/store/{store_id}")
+        response.raise_for_status()
+        return f"Store {store_id}: {response.json()}"
+    except httpx.HTTPStatusError as e:
+        return f"Error finding store by ID {store_id}: {e.response.text}"
 
 
 async def call_find_closest_stores(location: str) -> str:
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(
-                f"{BASE_URL}:5000/stores/closest", params={"location": location}
-            )
-            response.raise_for_status()
-            return f"Closest Stores to {location}: {response.json()}"
-        except httpx.HTTPStatusError as e:
-            return f"Error finding closest stores: {e.response.text}"
+    client = get_http_client()
+    try:
+        response = await client.get(
+            f"{BASE_URL}:5000/stores/closest", params={"location": location}
+        )
+        response.raise_for_status()
+        return f"Closest Stores to {location}: {response.json()}"
+    except httpx.HTTPStatusError as e:
+        return f"Error finding closest stores: {e.response.text}"
 
 
 ## Catalog API Calls
 async def call_get_catalog() -> str:
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{BASE_URL}:5001/catalog/all")
-            response.raise_for_status()
-            return f"Catalog: {response.json()}"
-        except httpx.HTTPStatusError as e:
-            return f"Error getting catalog: {e.response.text}"
+    client = get_http_client()
+    try:
+        response = await client.get(f"{BASE_URL}:5001/catalog/all")
+        response.raise_for_status()
+        return f"Catalog: {response.json()}"
+    except httpx.HTTPStatusError as e:
+        return f"Error getting catalog: {e.response.text}"
 
 
 async def call_get_item_description(item_code: str) -> str:
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{BASE_URL}:5001/catalog/item/{item_code}")
-            response.raise_for_status()
-            return f"Item {item_code}: {response.json()}"
-        except httpx.HTTPStatusError as e:
-            return f"Error getting item description: {e.response.text}"
+    client = get_http_client()
+    try:
+        response = await client.get(f"{BASE_URL}:5001/catalog/item/{item_code}")
+        response.raise_for_status()
+        return f"Item {item_code}: {response.json()}"
+    except httpx.HTTPStatusError as e:
+        return f"Error getting item description: {e.response.text}"
 
 async def call_find_item(query: str) -> str:
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{BASE_URL}:5001/catalog/search/{query}")
-            response.raise_for_status()
-            return f"Results: {response.json()}"
-        except httpx.HTTPStatusError as e:
-            return f"Error finding item: {e.response.text}"
+    client = get_http_client()
+    try:
+        response = await client.get(f"{BASE_URL}:5001/catalog/search/{query}")
+        response.raise_for_status()
+        return f"Results: {response.json()}"
+    except httpx.HTTPStatusError as e:
+        return f"Error finding item: {e.response.text}"
 
 ## Stock API Calls
 async def call_get_stock_level(store_id: str, item_code: str) -> str:
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{BASE_URL}:5002/stock/qty/{store_id}/{item_code}")
-            response.raise_for_status()
-            return f"Stock at Store {store_id} for Item {item_code}: {response.json()}"
-        except httpx.HTTPStatusError as e:
-            return f"Error getting stock level: {e.response.text}"
+    client = get_http_client()
+    try:
+        response = await client.get(f"{BASE_URL}:5002/stock/qty/{store_id}/{item_code}")
+        response.raise_for_status()
+        return f"Stock at Store {store_id} for Item {item_code}: {response.json()}"
+    except httpx.HTTPStatusError as e:
+        return f"Error getting stock level: {e.response.text}"
 
 
 async def call_find_available_stock(item_code: str) -> str:
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(f"{BASE_URL}:5002/stock/available/{item_code}")
-            response.raise_for_status()
-            return f"Available Stock for Item {item_code}: {response.json()}"
-        except httpx.HTTPStatusError as e:
-            return f"Error finding available stock: {e.response.text}"
+    client = get_http_client()
+    try:
+        response = await client.get(f"{BASE_URL}:5002/stock/available/{item_code}")
+        response.raise_for_status()
+        return f"Available Stock for Item {item_code}: {response.json()}"
+    except httpx.HTTPStatusError as e:
+        return f"Error finding available stock: {e.response.text}"
+
+
+async def call_get_bulk_stock_levels(item_codes: List[str], store_ids: Optional[List[str]] = None) -> str:
+    client = get_http_client()
+    try:
+        response = await client.post(
+            f"{BASE_URL}:5002/stock/bulk", json={"item_codes": item_codes, "store_ids": store_ids}
+        )
+        response.raise_for_status()
+        # the bulk endpoint streams one JSON object per line
+        stock = [json.loads(line) for line in response.text.splitlines() if line]
+        return f"Stock levels for Items {item_codes}: {stock}"
+    except httpx.HTTPStatusError as e:
+        return f"Error getting bulk stock levels: {e.response.text}"
+
+
+@dataclass
+class AgentTeam:
+    team: SelectorGroupChat
+    compaction_stats: CompactionStats
+    speaker_selector: Optional[PlanAssignmentSelector]
+
+
+def get_mcp_server_params() -> Dict[str, StdioServerParams]:
+    ## MCP File System Agent
+    # https://github.com/microsoft/autogen/issues/5564
+    file_system_mcp_server = StdioServerParams(
+        command="npx",
+        args=[
+            "-y",
+            "@modelcontextprotocol/server-filesystem",
+            "/workspaces/llm-plan-and-execute-knowledge-provider-mesh/autogen_selector_group_chat_example/tools/file_agent_workdir/",
+        ],
+    )
 
+    ## MCP Jira Agent
+    jira_mcp_server = StdioServerParams(
+        command="/usr/local/share/nvm/versions/node/v22.14.0/bin/node",
+        args=["./tools/1broseidon_mcp-jira-server/build/index.js"],
+        env= {
+            "JIRA_EMAIL": os.getenv("JIRA_EMAIL"),
+            "JIRA_API_TOKEN": os.getenv("JIRA_API_TOKEN"),
+            "JIRA_DOMAIN": os.getenv("JIRA_DOMAIN")
+        }
+    )
 
-async def main() -> None:
+    return {"file_system": file_system_mcp_server, "jira": jira_mcp_server}
+
+
+def create_team(model_router: ModelRouter, mcp_tools: Dict[str, List[StdioMcpToolAdapter]]) -> AgentTeam:
+    """
+    Creates a new team with its own agents and message state. The model clients and MCP tools
+    can be shared between teams, i.e. one team per session in server.py.
+    """
+    compaction_stats = CompactionStats()
 
     # planning agent
     planning_agent = AssistantAgent(
         "PlanningAgent",
         description="An agent for planning tasks, this agent should be the first to engage when given a new task.",
-        model_client=get_model_client(),
+        model_client=model_router.client("planner"),
+        model_context=get_model_context(compaction_stats),
         system_message="""
         You are a planning agent.
         Your job is to break down complex tasks into smaller, manageable subtasks.
@@ -170,92 +256,79 @@ async def main() -> None:
         """,
     )
 
+    # the tool agents share the model client of the tool role
+    tool_model_client = model_router.client("tool")
+
     # Define an tool agent
     weather_agent = AssistantAgent(
         name="weather_agent",
-        model_client=get_model_client(),
-        tools=[get_weather],
+        model_client=tool_model_client,
+        model_context=get_model_context(compaction_stats),
+        tools=limit_concurrency([get_weather]),
         system_message="""
             You are a weather agent.
             You provide weather information for a given city using the weather tool.
-            You can only make one request at a time.
+            When you need the weather for several cities, request all of the tool calls at once in a single response so they run in parallel.
             You only have the weather tool.
             """,
     )
 
     stores_agent = AssistantAgent(
         name="stores_agent",
-        model_client=get_model_client(),
-        tools=[call_get_all_stores, call_find_store_by_id, call_find_closest_stores],
+        model_client=tool_model_client,
+        model_context=get_model_context(compaction_stats),
+        tools=limit_concurrency([call_get_all_stores, call_find_store_by_id, call_find_closest_stores]),
         system_message="""
             You are a stores agent.
             You provide store information using the tools specified below.
-            You can only make one request at a time.
+            When you need several independent lookups (i.e. the details of multiple stores), request all of the tool calls at once in a single response so they run in parallel.
             You only have the get_all_stores, find_store_by_id and call_find_closest_stores tools.
             """,
     )
 
     catalog_agent = AssistantAgent(
         name="catalog_agent",
-        model_client=get_model_client(),
-        tools=[call_get_catalog, call_get_item_description, call_find_item],
+        model_client=tool_model_client,
+        model_context=get_model_context(compaction_stats),
+        tools=limit_concurrency([call_get_catalog, call_get_item_description, call_find_item]),
         system_message="""
             You are a catalog agent.
             You provide catalog information using the tools specified below.
-            You can only make one request at a time.
+            When you need several independent lookups (i.e. the descriptions of multiple items), request all of the tool calls at once in a single response so they run in parallel.
             You only have the get_catalog, get_item_description, find_item tools.
             """,
     )
 
     stock_agent = AssistantAgent(
         name="stock_agent",
-        model_client=get_model_client(),
-        tools=[call_get_stock_level, call_find_available_stock],
+        model_client=tool_model_client,
+        model_context=get_model_context(compaction_stats),
+        tools=limit_concurrency([call_get_stock_level, call_find_available_stock, call_get_bulk_stock_levels]),
         system_message="""
             You are a stock agent.
             You provide stock information using the tools specified below.
-            You can only make one request at a time.
-            You only have the get_stock_level and find_available_stock tools.
+            Use get_bulk_stock_levels when you need the stock level for multiple stores or items, it answers them all in one request.
+            When you need several independent lookups, request all of the tool calls at once in a single response so they run in parallel.
+            You only have the get_stock_level, find_available_stock and get_bulk_stock_levels tools.
             """,
     )
 
-    ## MCP File System Agent
-    # https://github.com/microsoft/autogen/issues/5564
-    file_system_mcp_server = StdioServerParams(
-        command="npx",
-        args=[
-            "-y",
-            "@modelcontextprotocol/server-filesystem",
-            "/workspaces/llm-plan-and-execute-knowledge-provider-mesh/autogen_selector_group_chat_example/tools/file_agent_workdir/",
-        ],
-    )
-
-    file_system_tools = await mcp_server_tools(file_system_mcp_server)
-    print_mcp_tools(file_system_tools)
+    file_system_tools = mcp_tools["file_system"]
     file_system_agent = AssistantAgent(
         name="file_system_agent",
-        model_client=get_model_client(),
+        model_client=tool_model_client,
+        model_context=get_model_context(compaction_stats),
         tools=file_system_tools,
         system_message="""
             You are a file system agent.
             """,
     )
 
-    ## MCP Jira Agent
-    jira_mcp_server = StdioServerParams(
-        command="/usr/local/share/nvm/versions/node/v22.14.0/bin/node",
-        args=["./tools/1broseidon_mcp-jira-server/build/index.js"],
-        env= {
-            "JIRA_EMAIL": os.getenv("JIRA_EMAIL"),
-            "JIRA_API_TOKEN": os.getenv("JIRA_API_TOKEN"),
-            "JIRA_DOMAIN": os.getenv("JIRA_DOMAIN")
-        }
-    )
-    jira_tools = await mcp_server_tools(jira_mcp_server)
-    print_mcp_tools(jira_tools)
+    jira_tools = mcp_tools["jira"]
     jira_agent = AssistantAgent(
         name="jira_agent",
-        model_client=get_model_client(),
+        model_client=tool_model_client,
+        model_context=get_model_context(compaction_stats),
         tools=jira_tools,
         system_message="""
             You are a Jira agent.
@@ -271,26 +344,79 @@ async def main() -> None:
     # Define a team
     # https://microsoft.github.io/autogen/0.2/docs/tutorial/conversation-patterns
     # https://microsoft.github.io/autogen/dev/user-guide/agentchat-user-guide/tutorial/selector-group-chat.html
+    participants = [planning_agent, stores_agent, catalog_agent, stock_agent, weather_agent, file_system_agent, jira_agent]
+
+    # "rules" routes turns from the planner's assignments or a keyword match and only asks the LLM when ambiguous,
+    # "llm" uses the default LLM based speaker selection for every turn
+    speaker_selector = None
+    if os.getenv("SPEAKER_SELECTION_MODE", "rules").lower() == "rules":
+        speaker_selector = PlanAssignmentSelector(
+            [agent.name for agent in participants],
+            planner_name=planning_agent.name,
+            keywords={
+                "weather_agent": ["weather", "forecast", "temperature"],
+                "stores_agent": ["store address", "store name", "closest store", "nearest store", "stores near"],
+                "catalog_agent": ["item code", "catalog", "item description", "product"],
+                "stock_agent": ["stock", "qty", "quantity", "availability", "available"],
+                "file_system_agent": ["file", "directory", "folder", "write to"],
+                "jira_agent": ["jira", "issue", "ticket"],
+            },
+        )
+
     agent_team = SelectorGroupChat(
-        [planning_agent, stores_agent, catalog_agent, stock_agent, weather_agent, file_system_agent, jira_agent],
-        model_client=get_model_client(),
+        participants,
+        model_client=model_router.client("selector"),
         termination_condition=termination,
+        selector_func=speaker_selector,
     )
 
-    # Run the team and stream messages to the console
-    while True:
-        user_input = await asyncio.get_event_loop().run_in_executor(
-            None, input, "Enter a message for the agent: "
-        )  # Unless you do input this way, message processing is blocked while waiting for input
+    return AgentTeam(team=agent_team, compaction_stats=compaction_stats, speaker_selector=speaker_selector)
 
-        if not user_input or user_input.lower() == "exit":
-            break
 
-        stream = agent_team.run_stream(
-            task=user_input
-        )  # find the stores with the ryobi drill in stock and write that information to a file called stock.txt and then create a jira issue to summarize the findings.
-        await Console(stream)
+async def main() -> None:
+    model_router = get_model_router()
+
+    # load the tool schemas for all MCP servers concurrently (from the on-disk cache when possible).
+    # servers are only launched the first time one of their tools is called and then stay warm.
+    mcp_pool = McpServerPool()
+    for name, params in get_mcp_server_params().items():
+        mcp_pool.add(name, params)
+    mcp_tools = await mcp_pool.load_tools()
+    if os.getenv("MCP_LAZY_START", "true").lower() != "true":
+        await mcp_pool.start_all()
 
+    for tools in mcp_tools.values():
+        print_mcp_tools(tools)
+
+    agent_team = create_team(model_router, mcp_tools)
+
+    # Run the team and stream messages to the console
+    try:
+        while True:
+            user_input = await asyncio.get_event_loop().run_in_executor(
+                None, input, "Enter a message for the agent: "
+            )  # Unless you do input this way, message processing is blocked while waiting for input
+
+            if not user_input or user_input.lower() == "exit":
+                break
+
+            agent_team.compaction_stats.reset()
+            stream = agent_team.team.run_stream(
+                task=user_input
+            )  # find the stores with the ryobi drill in stock and write that information to a file called stock.txt and then create a jira issue to summarize the findings.
+            await Console(stream)
+
+            print(f"Context compaction: {agent_team.compaction_stats.as_dict()}")
+            if agent_team.speaker_selector is not None:
+                print(f"Speaker selection: {agent_team.speaker_selector.get_stats()}")
+            print(f"Model routing: {model_router.get_stats()}")
+    finally:
+        # the tools share one pooled http client and warm MCP server sessions, close them once we're done
+        await close_http_client()
+        await mcp_pool.aclose()
+
+
+if __name__ == "__main__":
+    load_dotenv(dotenv_path=".env", override=True)
+    asyncio.run(main())
 
-load_dotenv(dotenv_path=".env", override=True)
-asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Micro-benchmark comparing a fresh httpx.AsyncClient per call (what the tools used to do)
+against the shared pooled client from http_pool.py.
+
+Start the knowledge providers first (`cd tools && python3 ./run_tools.py`) then run
+`python3 benchmark_http_client.py [iterations]`.
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+from http_pool import close_http_client, get_http_client
+
+BASE_URL = "http://localhost"
+URLS = [
+    f"{BASE_URL}:5000/stores/all",
+    f"{BASE_URL}:5001/catalog/item/RYB-DRILL",
+    f"{BASE_URL}:5002/stock/available/RYB-DRILL",
+]
+
+
+async def fresh_client_call(url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        response = await client.get(url)
+        response.raise_for_status()
+
+
+async def pooled_client_call(url: str) -> None:
+    response = await get_http_client().get(url)
+    response.raise_for_status()
+
+
+async def measure(call, iterations: int) -> list:
+    latencies = []
+    for i in range(iterations):
+        url = URLS[i % len(URLS)]
+        start = time.perf_counter()
+        await call(url)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(name: str, latencies: list) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(
+        f"{name:<14} mean {statistics.mean(ordered):7.2f} ms | "
+        f"p50 {statistics.median(ordered):7.2f} ms | p95 {p95:7.2f} ms"
+    )
+
+
+async def main(iterations: int) -> None:
+    # warm up both paths so the first request doesn't skew the numbers
+    await fresh_client_call(URLS[0])
+    await pooled_client_call(URLS[0])
+
+    fresh = await measure(fresh_client_call, iterations)
+    pooled = await measure(pooled_client_call, iterations)
+    await close_http_client()
+
+    print(f"{iterations} sequential GET requests against the local FastAPI services\n")
+    report("fresh client", fresh)
+    report("pooled client", pooled)
+    print(f"\nper-call latency reduction: {statistics.mean(fresh) - statistics.mean(pooled):.2f} ms "
+          f"({(1 - statistics.mean(pooled) / statistics.mean(fresh)) * 100:.1f}%)")
+
+
+if __name__ == "__main__":
+    load_dotenv(dotenv_path=".env", override=True)
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
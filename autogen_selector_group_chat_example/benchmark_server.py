@@ -0,0 +1,205 @@
+"""
+Load test of the server mode (server.py) against a scripted model.
+
+Serves server.py's app from this process, with every model client replaced by a scripted one that
+answers after `--llm-latency` seconds and without the MCP servers, then opens `--sessions`
+WebSocket sessions at once. Each session asks for the weather of its own city `--runs` times in
+a row: the planner assigns it to the weather agent, which calls the weather tool, and the planner
+summarises. Reports how many sessions the process admitted and turned away, and the latency of
+the runs, at the AGENT_SERVER_MAX_SESSIONS and AGENT_SERVER_MAX_CONCURRENT_RUNS it was started with:
+
+    AGENT_SERVER_MAX_SESSIONS=20 AGENT_SERVER_MAX_CONCURRENT_RUNS=10 python3 benchmark_server.py --sessions 30
+
+No knowledge providers, MCP servers or Azure OpenAI are needed.
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import time
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Optional, Sequence, Union
+
+import httpx
+import uvicorn
+import websockets
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import (
+    ChatCompletionClient,
+    CreateResult,
+    LLMMessage,
+    ModelCapabilities,
+    ModelInfo,
+    RequestUsage,
+)
+from autogen_core.tools import Tool, ToolSchema
+from dotenv import load_dotenv
+
+import server
+from agents import create_team
+from model_routing import ModelRouter, percentile
+from single_flight import single_flight
+
+TASK_PREFIX = "What is the weather in"
+CITY_PATTERN = re.compile(r"weather in (\w+)")
+
+
+class ScriptedChatCompletionClient(ChatCompletionClient):
+    """Plays the planner, the weather agent and the speaker selection of a weather task."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        text = "\n".join(message.content for message in messages if isinstance(getattr(message, "content", None), str))
+        # a session's earlier runs are in the history too, only what followed its latest task counts
+        text = text[max(0, text.rfind(TASK_PREFIX)):]
+        city = (CITY_PATTERN.findall(text) or ["Seattle"])[0]
+        if tools:
+            content: Union[str, List[FunctionCall]] = [
+                FunctionCall(id=f"call-{self.calls}", name="get_weather", arguments=json.dumps({"city": city}))
+            ]
+        elif "role play game" in text:
+            content = "PlanningAgent"
+        elif "degrees" in text:
+            content = f"The weather in {city} is 73 degrees and Sunny. TERMINATE"
+        else:
+            content = f"1. weather_agent : get the weather in {city}"
+        return CreateResult(
+            finish_reason="function_calls" if isinstance(content, list) else "stop",
+            content=content,
+            usage=RequestUsage(prompt_tokens=len(text) // 4, completion_tokens=10),
+            cached=False,
+        )
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        async def stream():
+            yield await self.create(messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args)
+
+        return stream()
+
+    def actual_usage(self) -> RequestUsage:
+        return RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    def total_usage(self) -> RequestUsage:
+        return RequestUsage(prompt_tokens=0, completion_tokens=0)
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return 0
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return 128000
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self.model_info  # type: ignore
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return ModelInfo(vision=False, function_calling=True, json_output=False, family="unknown")
+
+
+def install_scripted_model(latency: float) -> None:
+    """Points server.py's lifespan at the scripted model and leaves the MCP servers out."""
+    server.get_model_router = lambda: ModelRouter(lambda deployment, model: single_flight(ScriptedChatCompletionClient(latency), 0.0))
+    server.get_mcp_server_params = lambda: {}
+    server.create_team = lambda model_router, mcp_tools: create_team(model_router, {"file_system": [], "jira": []})
+
+
+async def run_session(url: str, city: str, runs: int, results: Dict[str, list]) -> None:
+    try:
+        async with websockets.connect(url) as websocket:
+            for _ in range(runs):
+                started = time.perf_counter()
+                queued = False
+                await websocket.send(json.dumps({"task": f"{TASK_PREFIX} {city}?"}))
+                while True:
+                    message = json.loads(await websocket.recv())
+                    if message.get("type") == "queued":
+                        queued = True
+                    elif message.get("type") == "error":
+                        results["errors"].append(message["content"])
+                        break
+                    elif message.get("type") == "TaskResult":
+                        results["latencies"].append(time.perf_counter() - started)
+                        results["run_latencies"].append(message["latency_s"])
+                        results["queued"].append(queued)
+                        break
+            results["admitted"].append(city)
+    except websockets.ConnectionClosed as e:
+        if e.rcvd is not None and e.rcvd.code == server.TRY_AGAIN_LATER:
+            results["rejected"].append(city)
+        else:
+            results["errors"].append(str(e))
+
+
+def report(name: str, latencies: list) -> None:
+    if not latencies:
+        return
+    print(
+        f"{name:<20} mean {statistics.mean(latencies) * 1000:8.1f} ms | "
+        f"p50 {percentile(latencies, 0.5) * 1000:8.1f} ms | p95 {percentile(latencies, 0.95) * 1000:8.1f} ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    install_scripted_model(args.llm_latency)
+    uvicorn_server = uvicorn.Server(uvicorn.Config(server.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    serving = asyncio.create_task(uvicorn_server.serve())
+    while not uvicorn_server.started:
+        await asyncio.sleep(0.05)
+
+    results: Dict[str, list] = {"admitted": [], "rejected": [], "errors": [], "latencies": [], "run_latencies": [], "queued": []}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_session(f"ws://127.0.0.1:{args.port}/ws", f"City{index}", args.runs, results) for index in range(args.sessions)
+    ))
+    elapsed = time.perf_counter() - started
+
+    async with httpx.AsyncClient() as client:
+        stats = (await client.get(f"http://127.0.0.1:{args.port}/stats")).json()
+    uvicorn_server.should_exit = True
+    await serving
+
+    print(
+        f"{args.sessions} sessions of {args.runs} run(s), model calls of {args.llm_latency}s, "
+        f"{stats['max_sessions']} sessions and {stats['max_concurrent_runs']} concurrent runs per process\n"
+    )
+    print(f"sessions admitted    {len(results['admitted'])}, turned away {len(results['rejected'])}, errors {len(results['errors'])}")
+    print(f"runs completed       {len(results['latencies'])} in {elapsed:.2f}s, {len(results['latencies']) / elapsed:.2f}/s, "
+          f"{sum(results['queued'])} waited for a run slot")
+    report("run latency", results["latencies"])
+    report("  of which running", results["run_latencies"])
+    print(f"\n/stats: {json.dumps({key: stats[key] for key in ('total_sessions', 'rejected_sessions', 'completed_runs', 'failed_runs', 'mean_run_latency_s')})}")
+    for error in results["errors"][:5]:
+        print(f"error: {error}")
+
+
+if __name__ == "__main__":
+    load_dotenv(dotenv_path=".env", override=True)
+    parser = argparse.ArgumentParser(description="Open concurrent WebSocket sessions against server.py with a scripted model.")
+    parser.add_argument("--sessions", type=int, default=30, help="sessions opened at once")
+    parser.add_argument("--runs", type=int, default=2, help="tasks each session runs, one after the other")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds every model call takes")
+    parser.add_argument("--port", type=int, default=8765, help="local port to serve the app on")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,190 @@
+"""
+Token budgeted history for long SelectorGroupChat conversations.
+
+Every agent call re-sends the whole shared history, so prompt size grows with every turn.
+CompactingChatCompletionContext keeps the most recent messages verbatim and, for anything older:
+
+- replaces tool outputs and JSON blobs that have already been consumed with a compact extract
+  of the fields the agents actually use (store_id, item_code, qty, ...)
+- drops the oldest messages (a tool call and its result together) until the token budget is met
+
+Token counts are estimated at ~4 characters per token, which is close enough for budgeting.
+
+Usage:
+    stats = CompactionStats()
+    AssistantAgent(..., model_context=CompactingChatCompletionContext(token_budget=6000, stats=stats))
+    ...
+    print(stats.tokens_saved)
+"""
+
+import re
+from typing import List, Optional
+
+from autogen_core import Component
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import (
+    AssistantMessage,
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    UserMessage,
+)
+from pydantic import BaseModel
+from typing_extensions import Self
+
+# the fields worth keeping from the knowledge provider responses
+EXTRACT_FIELDS = ["store_id", "store_name", "item_code", "item_description", "qty", "address"]
+
+# innermost {...} objects, python repr or JSON
+OBJECT_PATTERN = re.compile(r"\{[^{}]*\}")
+FIELD_PATTERN = re.compile(r"['\"]?(\w+)['\"]?\s*:\s*(?:'([^']*)'|\"([^\"]*)\"|([^,}\s]+))")
+
+# only bother compacting content bigger than this
+MIN_COMPACT_CHARS = 300
+
+# source of the task messages, these are never dropped
+USER_SOURCE = "user"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def message_tokens(message: LLMMessage) -> int:
+    if isinstance(message, FunctionExecutionResultMessage):
+        return sum(estimate_tokens(result.content) for result in message.content)
+    if isinstance(message.content, str):
+        return estimate_tokens(message.content)
+    # function calls or multimodal content
+    return estimate_tokens(str(message.content))
+
+
+def compact_text(text: str) -> str:
+    """
+    Replaces the JSON objects in a tool output with `field=value` extracts of the EXTRACT_FIELDS,
+    i.e. "Stock: [{'store_id': '101', 'item_code': 'RYB-DRILL', 'qty': 10}]" becomes
+    "Stock: [store_id=101 item_code=RYB-DRILL qty=10]".
+    """
+    if len(text) < MIN_COMPACT_CHARS:
+        return text
+
+    def extract(match: re.Match) -> str:
+        fields = []
+        for key, single_quoted, double_quoted, bare in FIELD_PATTERN.findall(match.group(0)):
+            if key in EXTRACT_FIELDS:
+                fields.append(f"{key}={single_quoted or double_quoted or bare}")
+        return " ".join(fields) if fields else f"<{len(match.group(0))} chars omitted>"
+
+    compacted = OBJECT_PATTERN.sub(extract, text)
+    return compacted if len(compacted) < len(text) else text
+
+
+class CompactionStats:
+    """Token savings shared by all the contexts of a team, reset per run."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.calls = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def as_dict(self) -> dict:
+        return {
+            "llm_calls": self.calls,
+            "prompt_tokens_before": self.tokens_before,
+            "prompt_tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+        }
+
+
+class CompactingChatCompletionContextConfig(BaseModel):
+    token_budget: int
+    keep_recent: int
+    initial_messages: List[LLMMessage] | None = None
+
+
+class CompactingChatCompletionContext(ChatCompletionContext, Component[CompactingChatCompletionContextConfig]):
+    """
+    A chat completion context that keeps the last keep_recent messages verbatim, compacts older
+    tool outputs and drops the oldest messages until the history fits in token_budget.
+    The full history is still stored, only the view sent to the model is compacted.
+    """
+
+    component_config_schema = CompactingChatCompletionContextConfig
+
+    def __init__(
+        self,
+        token_budget: int = 6000,
+        keep_recent: int = 6,
+        initial_messages: List[LLMMessage] | None = None,
+        stats: Optional[CompactionStats] = None,
+    ) -> None:
+        super().__init__(initial_messages)
+        if keep_recent <= 0:
+            raise ValueError("keep_recent must be greater than 0.")
+        self._token_budget = token_budget
+        self._keep_recent = keep_recent
+        self.stats = stats or CompactionStats()
+
+    async def get_messages(self) -> List[LLMMessage]:
+        messages = list(self._messages)
+
+        # don't split a tool call from its result at the boundary of the verbatim window
+        split = max(0, len(messages) - self._keep_recent)
+        while split > 0 and isinstance(messages[split], FunctionExecutionResultMessage):
+            split -= 1
+
+        older = [self._compact(message) for message in messages[:split]]
+        recent = messages[split:]
+
+        # drop the oldest messages until the budget is met, a function call goes together with its result.
+        # the user's task messages are kept so the agents don't lose track of what they're working on.
+        total = sum(message_tokens(message) for message in older + recent)
+        index = 0
+        while index < len(older) and total > self._token_budget:
+            if isinstance(older[index], UserMessage) and older[index].source == USER_SOURCE:
+                index += 1
+                continue
+            dropped = [older.pop(index)]
+            if index < len(older) and isinstance(older[index], FunctionExecutionResultMessage):
+                dropped.append(older.pop(index))
+            total -= sum(message_tokens(message) for message in dropped)
+
+        compacted = older + recent
+        # the history can't start with a function result without its call
+        while compacted and isinstance(compacted[0], FunctionExecutionResultMessage):
+            total -= message_tokens(compacted.pop(0))
+
+        self.stats.calls += 1
+        self.stats.tokens_before += sum(message_tokens(message) for message in messages)
+        self.stats.tokens_after += total
+        return compacted
+
+    def _compact(self, message: LLMMessage) -> LLMMessage:
+        if isinstance(message, FunctionExecutionResultMessage):
+            return message.model_copy(
+                update={
+                    "content": [
+                        result.model_copy(update={"content": compact_text(result.content)})
+                        for result in message.content
+                    ]
+                }
+            )
+        if isinstance(message, (UserMessage, AssistantMessage)) and isinstance(message.content, str):
+            # includes messages from other agents and their tool call summaries
+            return message.model_copy(update={"content": compact_text(message.content)})
+        return message
+
+    def _to_config(self) -> CompactingChatCompletionContextConfig:
+        return CompactingChatCompletionContextConfig(
+            token_budget=self._token_budget, keep_recent=self._keep_recent, initial_messages=self._messages
+        )
+
+    @classmethod
+    def _from_config(cls, config: CompactingChatCompletionContextConfig) -> Self:
+        return cls(**config.model_dump())
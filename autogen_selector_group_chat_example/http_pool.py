@@ -0,0 +1,146 @@
+"""
+Shared pooled async HTTP client used by the agent tool functions.
+
+Creating a new httpx.AsyncClient per tool call rebuilds the connection pool and does a fresh
+TCP (and TLS) handshake every time. This module keeps a single client for the lifetime of the
+app with keep-alive, optional HTTP/2, per-host connection limits, timeouts and retries.
+
+Usage:
+    client = get_http_client()
+    response = await client.get("http://localhost:5000/stores/all")
+    ...
+    await close_http_client()  # on shutdown
+"""
+
+import asyncio
+import importlib.util
+import os
+import random
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+RETRY_STATUS_CODES = {502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class PooledHttpClient:
+    """
+    Thin wrapper around a single httpx.AsyncClient that adds per-host concurrency limits and
+    retries with exponential backoff for transient failures.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        max_connections_per_host: int = 10,
+        timeout: float = 10.0,
+        connect_timeout: float = 2.0,
+        retries: int = 2,
+        backoff_factor: float = 0.2,
+        http2: bool = False,
+    ):
+        # http2 needs the optional h2 package, fall back to http/1.1 keep-alive without it
+        if http2 and importlib.util.find_spec("h2") is None:
+            print("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1.")
+            http2 = False
+
+        self.http2 = http2
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.max_connections_per_host = max_connections_per_host
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            # httpx ignores the client's limits when it's given a transport, they go on the transport.
+            # No transport level retries, request() retries failed connection attempts with backoff
+            transport=httpx.AsyncHTTPTransport(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=max_connections,
+                    max_keepalive_connections=max_keepalive_connections,
+                    keepalive_expiry=keepalive_expiry,
+                ),
+            ),
+        )
+
+    @property
+    def is_closed(self) -> bool:
+        return self._client.is_closed
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        method = method.upper()
+        attempt = 0
+
+        async with self._host_semaphore(url):
+            while True:
+                try:
+                    response = await self._client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    # only replay requests that may have reached the server when it is safe to do so
+                    if attempt >= self.retries or (
+                        method not in IDEMPOTENT_METHODS and not isinstance(e, httpx.ConnectError)
+                    ):
+                        raise
+                else:
+                    if (
+                        response.status_code not in RETRY_STATUS_CODES
+                        or method not in IDEMPOTENT_METHODS
+                        or attempt >= self.retries
+                    ):
+                        return response
+                    await response.aclose()
+
+                attempt += 1
+                await asyncio.sleep(self.backoff_factor * (2 ** (attempt - 1)) * (1 + random.random()))
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def _host_semaphore(self, url: str) -> asyncio.Semaphore:
+        parts = urlsplit(url)
+        host = f"{parts.hostname}:{parts.port}"
+        if host not in self._host_semaphores:
+            self._host_semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_semaphores[host]
+
+
+_http_client: Optional[PooledHttpClient] = None
+
+
+def create_http_client_from_env() -> PooledHttpClient:
+    return PooledHttpClient(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+        max_connections_per_host=int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10")),
+        timeout=float(os.getenv("HTTP_TIMEOUT", "10")),
+        connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "2")),
+        retries=int(os.getenv("HTTP_RETRIES", "2")),
+        http2=os.getenv("HTTP2_ENABLED", "false").lower() == "true",
+    )
+
+
+def get_http_client() -> PooledHttpClient:
+    """Returns the shared client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client_from_env()
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -0,0 +1,338 @@
+"""
+Client-side rate limiting of the Azure OpenAI calls the agent teams make.
+
+Azure OpenAI limits each deployment to a number of requests and tokens per minute, evaluated
+over short windows, and answers calls over the limit with a 429 and a `retry-after`. Without a
+limiter every caller finds out by being rejected, retries on its own schedule and is rejected
+again. The limiter keeps the calls of this process under the deployment's limits instead:
+
+- two token buckets per deployment, requests per minute (`LLM_RATE_LIMIT_RPM`) and tokens per
+  minute (`LLM_RATE_LIMIT_TPM`), each holding a 5 second burst. A call takes one request and
+  its estimated tokens, the prompt's characters / 4 plus its `max_tokens`, which is how Azure
+  counts a call against the limit
+- calls waiting for a deployment are granted round-robin across sessions (the key set with
+  llm_session, server.py sets one per websocket session), so one busy team can't starve the rest
+- a 429 pauses the deployment for its `retry-after-ms` / `retry-after` (an exponential backoff
+  without one) and retries the call, up to `LLM_RATE_LIMIT_MAX_RETRIES` times, which is why the
+  model client's own retries are turned off while the limiter is on. Another 429
+  within two bursts of the last one means the limits are set too high or the deployment is
+  shared, and halves the rate the buckets refill at. Every successful call wins back 5% of the
+  rate, and the `x-ratelimit-remaining-*` headers of a response cap what the buckets hold
+
+`LLM_RATE_LIMITS` sets the limits of individual deployments, `gpt4o:300:50000,gpt-4o-mini:600:200000`
+(deployment:rpm:tpm), and `LLM_RATE_LIMIT_ENABLED=false` turns the limiter off.
+
+Usage:
+    model_client = AzureOpenAIChatCompletionClient(..., http_client=get_rate_limited_http_client())
+
+    with llm_session(session_id):
+        await team.run(task=task)
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, Iterator, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+BURST_SECONDS = 5
+MIN_RATE_FACTOR = 0.1
+RATE_RECOVERY_STEP = 0.05
+MIN_POLL_SECONDS = 0.01
+DEPLOYMENT_PATTERN = re.compile(r"/deployments/([^/]+)/")
+
+current_session: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("llm_session", default=None)
+
+
+@contextlib.contextmanager
+def llm_session(key: str) -> Iterator[None]:
+    """Calls made in the block, and the tasks it starts, queue as the session key, for fairness between sessions."""
+    token = current_session.set(key)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
+
+
+def session_key() -> str:
+    return current_session.get() or "default"
+
+
+class TokenBucket:
+    """Refills at a per-minute rate and holds BURST_SECONDS of it, it can go into debt."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float, factor: float) -> None:
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate * factor)
+            self.updated = now
+
+    def delay(self, amount: float, factor: float) -> float:
+        """Seconds until amount can be taken, a call larger than the burst waits for a full bucket."""
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / (self.rate * factor))
+
+    def pause_until(self, until: float) -> None:
+        # the deployment's window has turned over by then, start it with a full burst
+        self.level = self.capacity
+        self.updated = max(self.updated, until)
+
+
+class Ticket:
+    def __init__(self, session: str, tokens: int):
+        self.session = session
+        self.tokens = tokens
+
+
+class DeploymentLimiter:
+    """The buckets and the queue of one deployment, shared by every team of the process."""
+
+    def __init__(self, name: str, rpm: float, tpm: float):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        # share of the configured rate the buckets refill at, lowered by 429s
+        self.rate_factor = 1.0
+        self.paused_until = 0.0
+        self.throttled_at = float("-inf")
+        # queued tickets by session, the first session's first ticket goes next
+        self.sessions: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "tokens": 0, "throttled": 0, "retried": 0, "wait_seconds": 0.0}
+
+    def enqueue(self, session: str, tokens: int) -> Ticket:
+        ticket = Ticket(session, tokens)
+        with self._lock:
+            self.sessions.setdefault(session, deque()).append(ticket)
+        return ticket
+
+    def cancel(self, ticket: Ticket) -> None:
+        with self._lock:
+            self.remove(ticket)
+
+    def remove(self, ticket: Ticket) -> None:
+        queue = self.sessions.get(ticket.session)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self.sessions[ticket.session]
+
+    def head(self) -> Optional[Ticket]:
+        for queue in self.sessions.values():
+            return queue[0]
+        return None
+
+    def delay(self, now: float, tokens: int) -> float:
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.requests.refill(now, self.rate_factor)
+        self.tokens.refill(now, self.rate_factor)
+        return max(self.requests.delay(1, self.rate_factor), self.tokens.delay(tokens, self.rate_factor))
+
+    def try_acquire(self, ticket: Ticket) -> float:
+        """Takes the ticket's request and tokens and returns 0, or the seconds to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            head = self.head()
+            if head is not ticket:
+                # behind another session's call, try again when that one can go
+                return max(self.delay(now, head.tokens) if head else 0.0, MIN_POLL_SECONDS)
+            delay = self.delay(now, ticket.tokens)
+            if delay > 0:
+                return delay
+            self.requests.level -= 1
+            self.tokens.level -= ticket.tokens
+            self.remove(ticket)
+            if ticket.session in self.sessions:
+                # round-robin, the session's next call goes after the other sessions'
+                self.sessions.move_to_end(ticket.session)
+            self.stats["calls"] += 1
+            self.stats["tokens"] += ticket.tokens
+            return 0.0
+
+    async def acquire(self, ticket: Ticket) -> None:
+        started = time.monotonic()
+        try:
+            while (delay := self.try_acquire(ticket)) > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        with self._lock:
+            self.stats["wait_seconds"] += time.monotonic() - started
+
+    def on_response(self, status_code: int, headers: httpx.Headers, attempt: int) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if status_code == 429:
+                pause = retry_after(headers)
+                if pause is None:
+                    pause = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+                self.paused_until = max(self.paused_until, now + pause)
+                self.requests.pause_until(self.paused_until)
+                self.tokens.pause_until(self.paused_until)
+                if now - self.throttled_at < 2 * BURST_SECONDS:
+                    self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor / 2)
+                self.throttled_at = now
+                self.stats["throttled"] += 1
+                logger.warning(f"Deployment {self.name} throttled, pausing it for {pause:.1f}s at {self.rate_factor:.0%} of its rate")
+                return
+            if status_code < 400:
+                self.rate_factor = min(1.0, self.rate_factor + RATE_RECOVERY_STEP)
+            for bucket, header in ((self.requests, "x-ratelimit-remaining-requests"), (self.tokens, "x-ratelimit-remaining-tokens")):
+                try:
+                    bucket.level = min(bucket.level, float(headers[header]))
+                except (KeyError, ValueError):
+                    pass
+
+    def count(self, counter: str) -> None:
+        with self._lock:
+            self.stats[counter] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "wait_seconds": round(self.stats["wait_seconds"], 3),
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "rate_factor": round(self.rate_factor, 2),
+                "queued": sum(len(queue) for queue in self.sessions.values()),
+            }
+
+
+def retry_after(headers: httpx.Headers) -> Optional[float]:
+    for header, scale in (("retry-after-ms", 0.001), ("x-ms-retry-after-ms", 0.001), ("retry-after", 1.0)):
+        try:
+            return float(headers[header]) * scale
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def estimate_call(path: str, body: bytes, completion_tokens: int) -> Tuple[str, int]:
+    """The deployment a chat completion goes to and the tokens Azure counts for it."""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        payload = {}
+    match = DEPLOYMENT_PATTERN.search(path)
+    deployment = match.group(1) if match else payload.get("model", "default")
+    prompt = sum(len(json.dumps(message.get("content") or "")) + 16 for message in payload.get("messages", []))
+    prompt += len(json.dumps(payload.get("tools") or payload.get("functions") or ""))
+    max_tokens = payload.get("max_tokens") or payload.get("max_completion_tokens") or completion_tokens
+    return deployment, prompt // 4 + max_tokens
+
+
+def parse_deployment_limits(value: str) -> Dict[str, Tuple[float, float]]:
+    limits = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        name, rpm, tpm = entry.rsplit(":", 2)
+        limits[name] = (float(rpm), float(tpm))
+    return limits
+
+
+class RateLimiter:
+    """A DeploymentLimiter per deployment, created with the configured limits on first use."""
+
+    def __init__(self, rpm: float, tpm: float, deployment_limits: Dict[str, Tuple[float, float]], max_retries: int, completion_tokens: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.deployment_limits = deployment_limits
+        self.max_retries = max_retries
+        self.completion_tokens = completion_tokens
+        self._deployments: Dict[str, DeploymentLimiter] = {}
+        self._lock = threading.Lock()
+
+    def deployment(self, name: str) -> DeploymentLimiter:
+        with self._lock:
+            if name not in self._deployments:
+                rpm, tpm = self.deployment_limits.get(name, (self.rpm, self.tpm))
+                self._deployments[name] = DeploymentLimiter(name, rpm, tpm)
+            return self._deployments[name]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            deployments = dict(self._deployments)
+        return {name: limiter.get_stats() for name, limiter in deployments.items()}
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Queues the POSTs of an async httpx client on the limiter and retries the throttled ones."""
+
+    def __init__(self, limiter: RateLimiter, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.limiter = limiter
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST":
+            return await self.transport.handle_async_request(request)
+        name, tokens = estimate_call(request.url.path, await request.aread(), self.limiter.completion_tokens)
+        deployment = self.limiter.deployment(name)
+        attempt = 0
+        while True:
+            await deployment.acquire(deployment.enqueue(session_key(), tokens))
+            response = await self.transport.handle_async_request(request)
+            deployment.on_response(response.status_code, response.headers, attempt)
+            if response.status_code != 429 or attempt >= self.limiter.max_retries:
+                return response
+            await response.aclose()
+            attempt += 1
+            deployment.count("retried")
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def create_rate_limiter_from_env() -> RateLimiter:
+    tpm = float(os.getenv("LLM_RATE_LIMIT_TPM", "30000"))
+    return RateLimiter(
+        # Azure grants 6 requests per minute for every 1000 tokens per minute
+        rpm=float(os.getenv("LLM_RATE_LIMIT_RPM", str(tpm * 6 / 1000))),
+        tpm=tpm,
+        deployment_limits=parse_deployment_limits(os.getenv("LLM_RATE_LIMITS", "")),
+        max_retries=int(os.getenv("LLM_RATE_LIMIT_MAX_RETRIES", "5")),
+        completion_tokens=int(os.getenv("LLM_RATE_LIMIT_COMPLETION_TOKENS", "1000")),
+    )
+
+
+def get_rate_limiter() -> RateLimiter:
+    """The process-wide limiter, every client of the process shares its buckets."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = create_rate_limiter_from_env()
+        return _rate_limiter
+
+
+def rate_limit_enabled() -> bool:
+    return os.getenv("LLM_RATE_LIMIT_ENABLED", "true").lower() == "true"
+
+
+def get_rate_limited_http_client() -> Optional[httpx.AsyncClient]:
+    """An http client for the model clients that goes through the shared limiter, None if it's turned off."""
+    if not rate_limit_enabled():
+        return None
+    return httpx.AsyncClient(transport=RateLimitedTransport(get_rate_limiter()), timeout=httpx.Timeout(600.0, connect=5.0))
@@ -0,0 +1,189 @@
+"""
+Concurrent and lazy startup of MCP servers.
+
+`mcp_server_tools` launches a server subprocess to list its tools and the stock
+StdioMcpToolAdapter launches yet another subprocess for every tool call. This module instead:
+
+- loads tool schemas for all servers concurrently, from an on-disk cache when available
+  (.mcp_cache/<server>-<hash>.json) so a warm start doesn't launch anything
+- starts each server lazily the first time one of its tools is called
+- keeps that server session warm between tasks until the pool is closed
+
+Usage:
+    mcp_pool = McpServerPool()
+    mcp_pool.add("file_system", StdioServerParams(...))
+    mcp_pool.add("jira", StdioServerParams(...))
+    tools = await mcp_pool.load_tools()  # {"file_system": [...], "jira": [...]}
+    ...
+    await mcp_pool.aclose()
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from autogen_core import CancellationToken
+from autogen_ext.tools.mcp import StdioMcpToolAdapter, StdioServerParams
+from autogen_ext.tools.mcp._session import create_mcp_server_session
+from mcp import Tool
+from pydantic import BaseModel
+
+DEFAULT_CACHE_DIR = Path(__file__).parent / ".mcp_cache"
+
+
+class McpServer:
+    """
+    A single MCP server whose session is owned by a background task, so the subprocess is started
+    once and reused by every tool call. The session has to be opened and closed in the same task,
+    which is why it isn't simply held open by whoever calls it first.
+    """
+
+    def __init__(self, name: str, params: StdioServerParams, cache_dir: Path = DEFAULT_CACHE_DIR):
+        self.name = name
+        self.params = params
+        self.cache_dir = cache_dir
+
+        self._session = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._start_lock = asyncio.Lock()
+        self._error: Optional[BaseException] = None
+
+    @property
+    def cache_path(self) -> Path:
+        # env values are left out of the key as they hold secrets and don't change the tool schemas
+        key = json.dumps([self.params.command, self.params.args], sort_keys=True)
+        return self.cache_dir / f"{self.name}-{hashlib.sha256(key.encode()).hexdigest()[:12]}.json"
+
+    @property
+    def is_running(self) -> bool:
+        return self._session is not None and self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        """Starts the server if it isn't already running and waits for the session to be ready."""
+        async with self._start_lock:
+            if self.is_running:
+                return
+
+            self._ready = asyncio.Event()
+            self._stop = asyncio.Event()
+            self._error = None
+
+            started_at = time.perf_counter()
+            self._task = asyncio.create_task(self._serve(), name=f"mcp-server-{self.name}")
+            await self._ready.wait()
+
+            if self._error is not None:
+                raise RuntimeError(f"MCP server '{self.name}' failed to start: {self._error}") from self._error
+
+            print(f"MCP server '{self.name}' started in {time.perf_counter() - started_at:.2f}s")
+
+    async def list_tools(self) -> List[Tool]:
+        """Returns the tool schemas from the disk cache, starting the server only on a cache miss."""
+        if os.getenv("MCP_REFRESH_TOOL_CACHE", "false").lower() != "true":
+            cached = self._read_cache()
+            if cached is not None:
+                return cached
+
+        await self.start()
+        return (await self._session.list_tools()).tools
+
+    async def call_tool(self, tool_name: str, arguments: Dict[str, Any]):
+        await self.start()
+        return await self._session.call_tool(tool_name, arguments)
+
+    async def get_tools(self) -> List["WarmMcpToolAdapter"]:
+        return [WarmMcpToolAdapter(self, tool) for tool in await self.list_tools()]
+
+    async def aclose(self) -> None:
+        if self._task is None:
+            return
+        self._stop.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _serve(self) -> None:
+        try:
+            async with create_mcp_server_session(self.params) as session:
+                await session.initialize()
+
+                # refresh the cache every time the server actually starts so it never goes stale for long
+                self._write_cache((await session.list_tools()).tools)
+
+                self._session = session
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self._error = e
+        finally:
+            self._session = None
+            self._ready.set()
+
+    def _read_cache(self) -> Optional[List[Tool]]:
+        try:
+            with open(self.cache_path, "r") as f:
+                return [Tool.model_validate(tool) for tool in json.load(f)]
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_cache(self, tools: List[Tool]) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_path, "w") as f:
+            json.dump([tool.model_dump(mode="json", by_alias=True, exclude_none=True) for tool in tools], f, indent=2)
+
+
+class WarmMcpToolAdapter(StdioMcpToolAdapter):
+    """
+    StdioMcpToolAdapter that calls the tool on the shared warm server session instead of
+    launching a new server subprocess for every call.
+    """
+
+    def __init__(self, server: McpServer, tool: Tool) -> None:
+        super().__init__(server_params=server.params, tool=tool)
+        self._server = server
+
+    async def run(self, args: BaseModel, cancellation_token: CancellationToken) -> Any:
+        kwargs = args.model_dump()
+
+        try:
+            if cancellation_token.is_cancelled():
+                raise Exception("Operation cancelled")
+
+            result = await self._server.call_tool(self._tool.name, kwargs)
+
+            if result.isError:
+                raise Exception(f"MCP tool execution failed: {result.content}")
+
+            return result.content
+        except Exception as e:
+            raise Exception(str(e)) from e
+
+
+class McpServerPool:
+    """Manages a set of MCP servers, loading and starting them concurrently."""
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.servers: Dict[str, McpServer] = {}
+
+    def add(self, name: str, params: StdioServerParams) -> McpServer:
+        self.servers[name] = McpServer(name, params, self.cache_dir)
+        return self.servers[name]
+
+    async def load_tools(self) -> Dict[str, List[WarmMcpToolAdapter]]:
+        started_at = time.perf_counter()
+        tools = await asyncio.gather(*(server.get_tools() for server in self.servers.values()))
+        print(f"Loaded tools for {len(self.servers)} MCP servers in {time.perf_counter() - started_at:.2f}s")
+        return dict(zip(self.servers.keys(), tools))
+
+    async def start_all(self) -> None:
+        """Eagerly starts every server concurrently, i.e. to keep them all warm from the beginning."""
+        await asyncio.gather(*(server.start() for server in self.servers.values()))
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(server.aclose() for server in self.servers.values()), return_exceptions=True)
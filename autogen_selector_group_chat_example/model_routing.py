@@ -0,0 +1,227 @@
+"""
+A deployment per role for the model calls of the team.
+
+Not every turn needs the large model. Picking the next speaker is a one-word answer and the tool
+agents mostly turn an assignment into tool arguments, while the plan and the final summary the
+planning agent writes are where a stronger model pays off. ModelRouter gives each role its own
+model client:
+
+- `planner`: the planning agent, which plans, delegates and summarises the findings
+- `selector`: the SelectorGroupChat's speaker selection, when the rules don't settle it
+- `tool`: the tool agents (weather, stores, catalog, stock, file system, Jira)
+
+`AZURE_OPENAI_DEPLOYMENT_NAME_<ROLE>` and `AZURE_OPENAI_MODEL_NAME_<ROLE>` set the deployment of
+a role (i.e. AZURE_OPENAI_DEPLOYMENT_NAME_SELECTOR=gpt-4o-mini), a role without one stays on
+AZURE_OPENAI_DEPLOYMENT_NAME, so nothing changes until a role is configured. The roles on one
+deployment share its client, and with it its single-flight.
+
+A call that fails on the deployment of its role, an error from the API once the client's own
+retries are spent or a tool call the model got wrong (a tool the agent doesn't have, arguments
+that aren't JSON), is made again on the escalation deployment, `AZURE_OPENAI_ESCALATION_DEPLOYMENT_NAME`
+(and `AZURE_OPENAI_ESCALATION_MODEL_NAME`) or else AZURE_OPENAI_DEPLOYMENT_NAME. A call already
+on that deployment isn't escalated. get_stats() returns, per role, the deployment, the calls,
+the escalations, the calls that failed after them and the latency percentiles of the last 500
+calls, server.py adds them to /stats. `MODEL_ROUTING_ENABLED=false` puts every role on the
+default client.
+
+Usage:
+    model_router = ModelRouter(get_model_client)
+    AssistantAgent("PlanningAgent", model_client=model_router.client("planner"), ...)
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Callable, Dict, Mapping, Optional, Sequence, Tuple, Union
+
+from autogen_core import CancellationToken, FunctionCall
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelCapabilities, ModelInfo, RequestUsage
+from autogen_core.tools import Tool, ToolSchema
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("planner", "selector", "tool")
+
+LATENCY_WINDOW = 500
+
+
+def model_routing_enabled() -> bool:
+    return os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+
+
+def percentile(values: list, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def tool_call_problem(result: CreateResult, tools: Sequence[Tool | ToolSchema]) -> Optional[str]:
+    """What is wrong with the tool calls of a result, None if they can be run."""
+    if not isinstance(result.content, list):
+        return None
+    names = {getattr(tool, "schema", tool)["name"] for tool in tools}
+    for call in result.content:
+        if not isinstance(call, FunctionCall):
+            continue
+        if call.name not in names:
+            return f"call of an unknown tool {call.name}"
+        try:
+            json.loads(call.arguments)
+        except json.JSONDecodeError:
+            return f"arguments of {call.name} aren't JSON: {call.arguments}"
+    return None
+
+
+class RoleMetrics:
+    """Calls, escalations and latencies of one role."""
+
+    def __init__(self, deployment: str):
+        self.deployment = deployment
+        self.calls = 0
+        self.escalations = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def record(self, seconds: float, escalated: bool, failed: bool) -> None:
+        self.calls += 1
+        self.escalations += escalated
+        self.failed += failed
+        self.latencies.append(seconds)
+
+    def get_stats(self) -> dict:
+        stats = {"deployment": self.deployment, "calls": self.calls, "escalations": self.escalations, "failed": self.failed}
+        for name, value in (("p50_ms", percentile(list(self.latencies), 0.5)), ("p95_ms", percentile(list(self.latencies), 0.95))):
+            stats[name] = round(value * 1000, 1) if value is not None else None
+        return stats
+
+
+class RoutedChatCompletionClient(ChatCompletionClient):
+    """The model client of one role, escalates a failed call to the escalation client."""
+
+    def __init__(self, role: str, client: ChatCompletionClient, escalation: Optional[ChatCompletionClient], metrics: RoleMetrics):
+        self._role = role
+        self._client = client
+        # None when the role is on the escalation deployment already
+        self._escalation = escalation
+        self._metrics = metrics
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        escalated = failed = False
+        started = time.perf_counter()
+        try:
+            try:
+                result = await self._client.create(
+                    messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+                )
+                problem = tool_call_problem(result, tools)
+                if problem is None or self._escalation is None:
+                    return result
+            except Exception as e:
+                if self._escalation is None:
+                    raise
+                problem = str(e)
+            logger.warning(f"The {self._role} call failed on {self._metrics.deployment}, escalating it: {problem}")
+            escalated = True
+            return await self._escalation.create(
+                messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._metrics.record(time.perf_counter() - started, escalated, failed)
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        # a stream that already yielded can't be made again elsewhere, it isn't escalated
+        return self._client.create_stream(
+            messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+        )
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self._client.capabilities  # type: ignore
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+
+class ModelRouter:
+    """The model client of every role, created with create_client(deployment, model) once per deployment."""
+
+    def __init__(self, create_client: Callable[[str, str], ChatCompletionClient]):
+        self._create_client = create_client
+        self.default = (os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"), os.getenv("AZURE_OPENAI_MODEL_NAME"))
+        self.escalation = (
+            os.getenv("AZURE_OPENAI_ESCALATION_DEPLOYMENT_NAME") or self.default[0],
+            os.getenv("AZURE_OPENAI_ESCALATION_MODEL_NAME") or self.default[1],
+        )
+        self.deployments = {
+            role: (
+                os.getenv(f"AZURE_OPENAI_DEPLOYMENT_NAME_{role.upper()}") or self.default[0],
+                os.getenv(f"AZURE_OPENAI_MODEL_NAME_{role.upper()}") or self.default[1],
+            )
+            for role in ROLES
+        }
+        self.enabled = model_routing_enabled()
+        self.metrics = {role: RoleMetrics(deployment) for role, (deployment, _) in self.deployments.items()}
+        self.clients: Dict[Tuple[str, str], ChatCompletionClient] = {}
+        self._routed: Dict[str, ChatCompletionClient] = {}
+
+    def deployment_client(self, deployment: Tuple[str, str]) -> ChatCompletionClient:
+        if deployment not in self.clients:
+            self.clients[deployment] = self._create_client(*deployment)
+        return self.clients[deployment]
+
+    def client(self, role: str) -> ChatCompletionClient:
+        """The model client of a role, the same one for every team."""
+        if not self.enabled:
+            return self.deployment_client(self.default)
+        if role not in self._routed:
+            deployment = self.deployments[role]
+            escalation = self.deployment_client(self.escalation) if deployment != self.escalation else None
+            self._routed[role] = RoutedChatCompletionClient(role, self.deployment_client(deployment), escalation, self.metrics[role])
+        return self._routed[role]
+
+    def get_stats(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "escalation_deployment": self.escalation[0],
+            "roles": {role: metrics.get_stats() for role, metrics in self.metrics.items()},
+        }
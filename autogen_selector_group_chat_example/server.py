@@ -0,0 +1,174 @@
+"""
+Multi-session server mode for the agent team.
+
+Each WebSocket connection gets its own SelectorGroupChat (agents and message state) while the
+model clients, the tool HTTP pool and the warm MCP servers are shared by every session in the
+process. Admission control caps the number of concurrent sessions and the number of team runs
+in progress at once.
+
+Run `python3 server.py` then connect to ws://localhost:8000/ws and send {"task": "..."}.
+Every agent message is streamed back as JSON followed by a {"type": "TaskResult", ...} message.
+Session and run counts are available at http://localhost:8000/stats.
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+import uvicorn
+from autogen_agentchat.base import TaskResult
+from autogen_core import CancellationToken
+from dotenv import load_dotenv
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+
+from agents import create_team, get_mcp_server_params, get_model_router
+from http_pool import close_http_client
+from llm_rate_limit import get_rate_limiter, llm_session, rate_limit_enabled
+from single_flight import SingleFlightChatCompletionClient
+from mcp_servers import McpServerPool
+
+# close code for "try again later" when the server is at capacity
+TRY_AGAIN_LATER = 1013
+
+
+class SessionStats:
+    def __init__(self, max_sessions: int, max_concurrent_runs: int):
+        self.max_sessions = max_sessions
+        self.max_concurrent_runs = max_concurrent_runs
+        self.active_sessions = 0
+        self.total_sessions = 0
+        self.rejected_sessions = 0
+        self.active_runs = 0
+        self.queued_runs = 0
+        self.completed_runs = 0
+        self.failed_runs = 0
+        self.run_latency_total = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "max_sessions": self.max_sessions,
+            "max_concurrent_runs": self.max_concurrent_runs,
+            "active_sessions": self.active_sessions,
+            "total_sessions": self.total_sessions,
+            "rejected_sessions": self.rejected_sessions,
+            "active_runs": self.active_runs,
+            "queued_runs": self.queued_runs,
+            "completed_runs": self.completed_runs,
+            "failed_runs": self.failed_runs,
+            "mean_run_latency_s": round(self.run_latency_total / self.completed_runs, 3) if self.completed_runs else None,
+        }
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_dotenv(dotenv_path=".env", override=True)
+
+    app.state.stats = SessionStats(
+        max_sessions=int(os.getenv("AGENT_SERVER_MAX_SESSIONS", "20")),
+        max_concurrent_runs=int(os.getenv("AGENT_SERVER_MAX_CONCURRENT_RUNS", "10")),
+    )
+    app.state.run_semaphore = asyncio.Semaphore(app.state.stats.max_concurrent_runs)
+
+    # shared by every session
+    app.state.model_router = get_model_router()
+    app.state.mcp_pool = McpServerPool()
+    for name, params in get_mcp_server_params().items():
+        app.state.mcp_pool.add(name, params)
+    app.state.mcp_tools = await app.state.mcp_pool.load_tools()
+
+    yield
+
+    await close_http_client()
+    await app.state.mcp_pool.aclose()
+
+
+app = FastAPI(title="Agent Team Server", lifespan=lifespan)
+
+
+@app.get("/stats")
+async def get_stats() -> dict:
+    stats = app.state.stats.as_dict()
+    if rate_limit_enabled():
+        stats["llm_rate_limit"] = get_rate_limiter().get_stats()
+    single_flight_stats = {
+        deployment: client.get_stats()
+        for (deployment, _), client in app.state.model_router.clients.items()
+        if isinstance(client, SingleFlightChatCompletionClient)
+    }
+    if single_flight_stats:
+        stats["llm_single_flight"] = single_flight_stats
+    stats["model_routing"] = app.state.model_router.get_stats()
+    return stats
+
+
+@app.websocket("/ws")
+async def run_session(websocket: WebSocket):
+    stats: SessionStats = app.state.stats
+
+    await websocket.accept()
+
+    # no await between the check and the increment, so this is race free on the event loop
+    if stats.active_sessions >= stats.max_sessions:
+        stats.rejected_sessions += 1
+        await websocket.close(code=TRY_AGAIN_LATER, reason="Server is at capacity, try again later")
+        return
+
+    stats.active_sessions += 1
+    stats.total_sessions += 1
+    session_id = stats.total_sessions
+    try:
+        agent_team = create_team(app.state.model_router, app.state.mcp_tools)
+
+        while True:
+            request = await websocket.receive_json()
+            task = request.get("task")
+            if not task:
+                await websocket.send_json({"type": "error", "content": "Expected {\"task\": \"...\"}"})
+                continue
+
+            if app.state.run_semaphore.locked():
+                await websocket.send_json({"type": "queued", "content": "Waiting for a free slot to run the task"})
+
+            stats.queued_runs += 1
+            async with app.state.run_semaphore:
+                stats.queued_runs -= 1
+                stats.active_runs += 1
+                started_at = time.perf_counter()
+                cancellation_token = CancellationToken()
+                try:
+                    agent_team.compaction_stats.reset()
+                    # the team's LLM calls take turns with the other sessions' at the rate limiter
+                    with llm_session(f"session-{session_id}"):
+                        async for message in agent_team.team.run_stream(task=task, cancellation_token=cancellation_token):
+                            if isinstance(message, TaskResult):
+                                await websocket.send_json({
+                                    "type": "TaskResult",
+                                    "stop_reason": message.stop_reason,
+                                    "latency_s": round(time.perf_counter() - started_at, 3),
+                                    "context_compaction": agent_team.compaction_stats.as_dict(),
+                                    "speaker_selection": agent_team.speaker_selector.get_stats()
+                                    if agent_team.speaker_selector is not None else None,
+                                })
+                            else:
+                                await websocket.send_json(message.model_dump(mode="json"))
+                    stats.completed_runs += 1
+                    stats.run_latency_total += time.perf_counter() - started_at
+                except WebSocketDisconnect:
+                    # stop the team rather than leaving it running for a client that has gone away
+                    cancellation_token.cancel()
+                    raise
+                except Exception as e:
+                    stats.failed_runs += 1
+                    await websocket.send_json({"type": "error", "content": str(e)})
+                finally:
+                    stats.active_runs -= 1
+    except WebSocketDisconnect:
+        pass
+    finally:
+        stats.active_sessions -= 1
+
+
+if __name__ == "__main__":
+    load_dotenv(dotenv_path=".env", override=True)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("AGENT_SERVER_PORT", "8000")))
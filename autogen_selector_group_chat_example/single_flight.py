@@ -0,0 +1,148 @@
+"""
+Single-flight for identical model calls made at the same time.
+
+When several sessions of the server get the same popular task, their planners make the same
+first call to the model at the same moment. SingleFlightChatCompletionClient wraps the model
+client so that concurrent calls with identical messages, tools and arguments share one
+completion:
+
+- the first call goes to the model, the calls with the same key that arrive while it is in
+  flight wait for it and get a copy of its result (marked `cached`), or its error
+- only calls at temperature 0 are shared, a sampled completion isn't a stand-in for another
+- a caller whose cancellation token fires stops waiting, the call itself is cancelled once
+  nobody is waiting for it
+- nothing is kept once the call completes, it's not a cache
+
+Streaming calls go to the model client unchanged. get_stats() returns the calls, the ones that
+went to the model and the ones that were coalesced, server.py adds them to /stats.
+
+Usage:
+    model_client = single_flight(AzureOpenAIChatCompletionClient(..., temperature=0), temperature=0)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, AsyncGenerator, Dict, Mapping, Optional, Sequence, Union
+
+from autogen_core import CancellationToken
+from autogen_core.models import ChatCompletionClient, CreateResult, LLMMessage, ModelCapabilities, ModelInfo, RequestUsage
+from autogen_core.tools import Tool, ToolSchema
+
+
+def call_key(messages: Sequence[LLMMessage], tools: Sequence[Tool | ToolSchema], json_output: Optional[bool], extra_create_args: Mapping[str, Any]) -> str:
+    payload = {
+        "messages": [message.model_dump(mode="json") for message in messages],
+        "tools": [getattr(tool, "schema", tool) for tool in tools],
+        "json_output": json_output,
+        "extra_create_args": dict(extra_create_args),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class InFlightCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlightChatCompletionClient(ChatCompletionClient):
+    """Shares one completion between the concurrent identical calls made through it."""
+
+    def __init__(self, client: ChatCompletionClient, temperature: Optional[float]):
+        self._client = client
+        # the temperature the client was created with, a call can override it in extra_create_args
+        self._temperature = temperature
+        self._in_flight: Dict[str, InFlightCall] = {}
+        self._stats = {"calls": 0, "model_calls": 0, "coalesced": 0, "not_deterministic": 0}
+
+    async def create(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> CreateResult:
+        self._stats["calls"] += 1
+        if extra_create_args.get("temperature", self._temperature) != 0:
+            self._stats["not_deterministic"] += 1
+            self._stats["model_calls"] += 1
+            return await self._client.create(
+                messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+            )
+
+        key = call_key(messages, tools, json_output, extra_create_args)
+        call = self._in_flight.get(key)
+        coalesced = call is not None
+        if coalesced:
+            self._stats["coalesced"] += 1
+        else:
+            self._stats["model_calls"] += 1
+            # the call belongs to every caller waiting for it, none of their tokens cancel it
+            call = InFlightCall(asyncio.ensure_future(
+                self._client.create(messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args)
+            ))
+            self._in_flight[key] = call
+            call.task.add_done_callback(lambda _: self._in_flight.pop(key, None) if self._in_flight.get(key) is call else None)
+
+        call.waiters += 1
+        waiter = asyncio.shield(call.task)
+        if cancellation_token is not None:
+            cancellation_token.link_future(waiter)
+        try:
+            result = await waiter
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+        return result.model_copy(update={"cached": True}, deep=True) if coalesced else result
+
+    def create_stream(
+        self,
+        messages: Sequence[LLMMessage],
+        *,
+        tools: Sequence[Tool | ToolSchema] = [],
+        json_output: Optional[bool] = None,
+        extra_create_args: Mapping[str, Any] = {},
+        cancellation_token: Optional[CancellationToken] = None,
+    ) -> AsyncGenerator[Union[str, CreateResult], None]:
+        self._stats["calls"] += 1
+        self._stats["model_calls"] += 1
+        return self._client.create_stream(
+            messages, tools=tools, json_output=json_output, extra_create_args=extra_create_args, cancellation_token=cancellation_token
+        )
+
+    def actual_usage(self) -> RequestUsage:
+        return self._client.actual_usage()
+
+    def total_usage(self) -> RequestUsage:
+        return self._client.total_usage()
+
+    def count_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.count_tokens(messages, tools=tools)
+
+    def remaining_tokens(self, messages: Sequence[LLMMessage], *, tools: Sequence[Tool | ToolSchema] = []) -> int:
+        return self._client.remaining_tokens(messages, tools=tools)
+
+    @property
+    def capabilities(self) -> ModelCapabilities:  # type: ignore
+        return self._client.capabilities  # type: ignore
+
+    @property
+    def model_info(self) -> ModelInfo:
+        return self._client.model_info
+
+    def get_stats(self) -> dict:
+        return {**self._stats, "in_flight": len(self._in_flight)}
+
+
+def single_flight_enabled() -> bool:
+    return os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+
+def single_flight(client: ChatCompletionClient, temperature: Optional[float]) -> ChatCompletionClient:
+    """Wraps the model client with single-flight, unless LLM_SINGLE_FLIGHT_ENABLED is false."""
+    return SingleFlightChatCompletionClient(client, temperature) if single_flight_enabled() else client
@@ -0,0 +1,146 @@
+"""
+Rule-based fast-path speaker selection for SelectorGroupChat.
+
+SelectorGroupChat makes an LLM call on every turn to pick the next speaker. The planning agent
+already assigns work explicitly (`1. <agent> : <task>`), so most turns can be routed without
+asking the model:
+
+1. a new user task goes to the planning agent
+2. the planner's latest assignments are walked in order and the first agent that hasn't
+   answered its assignment yet speaks next, once all of them have answered the planner summarises
+3. otherwise a cheap keyword match against the last message picks a single clear winner
+4. anything else is ambiguous and returns None so SelectorGroupChat falls back to the LLM selector
+
+Usage:
+    selector = PlanAssignmentSelector([agent.name for agent in agents], planner_name="PlanningAgent")
+    SelectorGroupChat(agents, model_client=..., selector_func=selector)
+"""
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from autogen_agentchat.messages import AgentEvent, BaseAgentEvent, ChatMessage
+
+# i.e. "1. stock agent : get the stock level" or "2. **Catalog Agent**: find the item code"
+ASSIGNMENT_PATTERN = re.compile(r"^\s*\d+\.\s*\**\s*([A-Za-z][\w \-]*?)\s*\**\s*:\s*(.+?)\s*$", re.MULTILINE)
+
+
+def normalize_agent_name(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+class PlanAssignmentSelector:
+    """
+    Callable for SelectorGroupChat's selector_func that routes turns deterministically from the
+    planner's assignments or a keyword match, and only defers to the LLM selector when ambiguous.
+    """
+
+    def __init__(
+        self,
+        participant_names: List[str],
+        planner_name: str = "PlanningAgent",
+        keywords: Optional[Dict[str, List[str]]] = None,
+        user_name: str = "user",
+    ):
+        self.participant_names = participant_names
+        self.planner_name = planner_name
+        self.keywords = {name: [word.lower() for word in words] for name, words in (keywords or {}).items()}
+        self.user_name = user_name
+        self.stats = {"user": 0, "plan": 0, "keyword": 0, "llm": 0}
+
+        # map normalized spellings ("stock agent", "Stock_Agent", "stock") to the participant name
+        self._names: Dict[str, str] = {}
+        for name in participant_names:
+            normalized = normalize_agent_name(name)
+            self._names[normalized] = name
+            if normalized.endswith("_agent"):
+                self._names[normalized[: -len("_agent")]] = name
+
+    def __call__(self, thread: Sequence[AgentEvent | ChatMessage]) -> Optional[str]:
+        messages = [message for message in thread if not isinstance(message, BaseAgentEvent)]
+        if not messages:
+            return self._fallback()
+
+        # a new task always starts with the planner
+        if messages[-1].source == self.user_name:
+            self.stats["user"] += 1
+            return self.planner_name
+
+        speaker = self._select_from_plan(messages)
+        if speaker is not None:
+            self.stats["plan"] += 1
+            return speaker
+
+        speaker = self._select_from_keywords(messages[-1])
+        if speaker is not None:
+            self.stats["keyword"] += 1
+            return speaker
+
+        return self._fallback()
+
+    def resolve_agent_name(self, name: str) -> Optional[str]:
+        return self._names.get(normalize_agent_name(name))
+
+    def parse_assignments(self, content: str) -> Optional[List[Tuple[str, str]]]:
+        """Returns [(agent name, task)] or None if any assigned agent can't be resolved to a participant."""
+        assignments = []
+        for agent, task in ASSIGNMENT_PATTERN.findall(content):
+            name = self.resolve_agent_name(agent)
+            if name is None:
+                return None
+            assignments.append((name, task))
+        return assignments or None
+
+    def get_stats(self) -> dict:
+        total = sum(self.stats.values())
+        fast_path = total - self.stats["llm"]
+        return {**self.stats, "total": total, "fast_path_ratio": round(fast_path / total, 2) if total else None}
+
+    def _select_from_plan(self, messages: List[ChatMessage]) -> Optional[str]:
+        # find the planner's latest assignments, but only within the current task
+        plan_index, assignments = None, None
+        for index in range(len(messages) - 1, -1, -1):
+            message = messages[index]
+            if message.source == self.user_name:
+                break
+            if message.source == self.planner_name and isinstance(message.content, str):
+                plan_index, assignments = index, self.parse_assignments(message.content)
+                break
+
+        if plan_index is None:
+            return None
+        if assignments is None:
+            # the planner spoke without a plan we can follow
+            return None
+
+        # an assignment is done once its agent has responded after the previous assignment was done
+        speakers = [message.source for message in messages[plan_index + 1:]]
+        position = 0
+        for agent, _ in assignments:
+            try:
+                position = speakers.index(agent, position) + 1
+            except ValueError:
+                return agent
+
+        # everything has been answered, hand back to the planner to summarise or re-plan
+        return self.planner_name
+
+    def _select_from_keywords(self, message: ChatMessage) -> Optional[str]:
+        if not self.keywords or not isinstance(message.content, str):
+            return None
+
+        content = message.content.lower()
+        scores = {name: sum(word in content for word in words) for name, words in self.keywords.items()}
+        scores = {name: score for name, score in scores.items() if score > 0 and name != message.source}
+        if not scores:
+            return None
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if len(ranked) > 1 and ranked[0][1] == ranked[1][1]:
+            # a tie is ambiguous
+            return None
+        return ranked[0][0]
+
+    def _fallback(self) -> None:
+        self.stats["llm"] += 1
+        return None
@@ -0,0 +1,45 @@
+"""
+Per-agent concurrency limit for tool calls.
+
+AssistantAgent already executes every tool call from a single model response concurrently with
+asyncio.gather and returns the results in the order of the calls. Wrapping an agent's tools with
+limit_concurrency caps how many of those calls are in flight at once, so a wide fan-out
+(i.e. the stock level for every store) doesn't flood a knowledge provider.
+
+Usage:
+    AssistantAgent(..., tools=limit_concurrency([call_get_stock_level, call_find_available_stock], 4))
+"""
+
+import asyncio
+import functools
+import os
+from typing import Any, Callable, List, Optional
+
+from autogen_core.tools import BaseTool
+
+
+def get_max_tool_concurrency() -> int:
+    return int(os.getenv("AGENT_MAX_TOOL_CONCURRENCY", "4"))
+
+
+def limit_concurrency(tools: List[Any], max_concurrency: Optional[int] = None) -> List[Any]:
+    """
+    Wraps async tool functions so that at most max_concurrency of them run at the same time.
+    The semaphore is shared by all the given tools, so pass one agent's tools per call.
+    BaseTool instances (i.e. MCP tools) are returned unchanged.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency or get_max_tool_concurrency())
+
+    def wrap(tool: Callable) -> Callable:
+        # functools.wraps keeps the name, docstring and signature AutoGen builds the tool schema from
+        @functools.wraps(tool)
+        async def limited(*args, **kwargs):
+            async with semaphore:
+                return await tool(*args, **kwargs)
+
+        return limited
+
+    return [
+        tool if isinstance(tool, BaseTool) or not asyncio.iscoroutinefunction(tool) else wrap(tool)
+        for tool in tools
+    ]
@@ -0,0 +1,125 @@
+"""
+Concurrency check for the agent tools: many simultaneous tasks calling the Stock agent's tools.
+
+Each simulated task runs the tools the Stock agent uses for a typical request (the stock level of
+an item across all stores, then the stock level at one store). Both ways run every task on a
+worker thread, the way ThreadedAgentActorMixin runs the agent (services/common/actor_thread.py),
+so they differ only in the tools:
+
+- requests: the old synchronous requests calls, a new connection for every request
+- async tools: the tools from services/stock/app.py, on the shared pooled async client
+
+A heartbeat on the event loop records the longest stall, which is how long the service's routes
+and pub/sub handlers would have been held up. The actor runtime gives the Stock actor one task at
+a time, so a single Stock service doesn't see this many tasks at once, the numbers are those of
+the tools' calls from that many threads.
+
+Start the knowledge providers first (`cd tools && python3 ./run_tools.py`) then run
+`python3 benchmark_tool_concurrency.py [tasks]`.
+"""
+
+import asyncio
+import importlib.util
+import os
+import statistics
+import sys
+import time
+from typing import Awaitable, Callable
+
+import requests
+from dotenv import load_dotenv
+
+BASE_URL = "http://localhost"
+STORE_IDS = ["101", "102", "103", "104", "105"]
+STOCK_SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "services", "stock")
+
+
+def load_stock_service():
+    # measure the tools themselves, the tool cache would need a Dapr sidecar and answer repeats from Redis
+    os.environ["TOOL_CACHE_ENABLED"] = "false"
+    sys.path.append(STOCK_SERVICE_DIR)
+    spec = importlib.util.spec_from_file_location("stock_service", os.path.join(STOCK_SERVICE_DIR, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def blocking_task(index: int) -> None:
+    requests.post(f"{BASE_URL}:5002/stock/bulk", json={"item_codes": ["RYB-DRILL"]})
+    requests.get(f"{BASE_URL}:5002/stock/qty/{STORE_IDS[index % len(STORE_IDS)]}/RYB-DRILL")
+
+
+def async_tools_task(stock_service, index: int) -> None:
+    stock_service.call_get_bulk_stock_levels(item_codes=["RYB-DRILL"])
+    stock_service.call_get_stock_level(store_id=STORE_IDS[index % len(STORE_IDS)], item_code="RYB-DRILL")
+
+
+async def heartbeat(stalls: list, interval: float = 0.005) -> None:
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def run_blocking(tasks: int) -> tuple:
+    latencies = []
+
+    def task(index: int) -> None:
+        start = time.perf_counter()
+        blocking_task(index)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return latencies, await measure(lambda: asyncio.gather(*(asyncio.to_thread(task, i) for i in range(tasks))))
+
+
+async def run_async_tools(stock_service, tasks: int) -> tuple:
+    latencies = []
+
+    def task(index: int) -> None:
+        start = time.perf_counter()
+        async_tools_task(stock_service, index)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return latencies, await measure(lambda: asyncio.gather(*(asyncio.to_thread(task, i) for i in range(tasks))))
+
+
+async def measure(workload: Callable[[], Awaitable]) -> tuple:
+    stalls = []
+    monitor = asyncio.create_task(heartbeat(stalls))
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await workload()
+    elapsed = time.perf_counter() - start
+    # let the heartbeat wake up once more to record a stall that lasted until the end
+    await asyncio.sleep(0.02)
+    monitor.cancel()
+    return elapsed, max(stalls, default=0.0)
+
+
+def report(name: str, tasks: int, latencies: list, elapsed: float, max_stall: float) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[max(0, int(len(ordered) * 0.95) - 1)]
+    print(
+        f"{name:<12} {tasks / elapsed:8.1f} tasks/s | total {elapsed * 1000:8.1f} ms | "
+        f"task p50 {statistics.median(ordered):7.2f} ms p95 {p95:7.2f} ms | "
+        f"max event loop stall {max_stall:8.2f} ms"
+    )
+
+
+async def main(tasks: int) -> None:
+    stock_service = load_stock_service()
+    # warm up both paths so connection setup doesn't skew the numbers
+    blocking_task(0)
+    async_tools_task(stock_service, 0)
+
+    blocking_latencies, (blocking_elapsed, blocking_stall) = await run_blocking(tasks)
+    async_latencies, (async_elapsed, async_stall) = await run_async_tools(stock_service, tasks)
+
+    print(f"{tasks} simultaneous tasks against the Stock agent's tools\n")
+    report("requests", tasks, blocking_latencies, blocking_elapsed, blocking_stall)
+    report("async tools", tasks, async_latencies, async_elapsed, async_stall)
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 50))
@@ -0,0 +1,78 @@
+"""
+The actor agents' runs on a worker thread.
+
+dapr-agents' AgentActorBase.invoke_task calls the agent's synchronous run() on the actor
+runtime's event loop. Everything the agent does during a task, the LLM calls, the rate limiter
+waiting for its turn, the tool calls waiting on the pooled http client and the DaprClient reads
+of the tool cache, then blocks the loop, and with it the service's other HTTP routes, its pub/sub
+handlers and the actor runtime's own calls, until the task is done.
+
+ThreadedAgentActorMixin registers an actor class that runs the agent with asyncio.to_thread and
+keeps the rest of invoke_task, the task history and the messages in the actor state, on the loop.
+The actor runtime still gives an actor one call at a time, so the agent never runs twice at once.
+ThreadedAgentActorBase.invoke_task is a copy of dapr-agents 0.2's, which requirements.txt pins.
+
+Usage:
+    class StockService(ThreadedAgentActorMixin, CachedActorAgentRegistryMixin, AgentActorService):
+        ...
+"""
+
+import asyncio
+import logging
+from typing import Any, Optional
+
+from dapr_agents.agent.actor.base import AgentActorBase
+from dapr_agents.types.agent import AgentActorMessage, AgentStatus, AgentTaskEntry, AgentTaskStatus
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadedAgentActorBase(AgentActorBase):
+    """AgentActorBase running the agent on a worker thread."""
+
+    async def invoke_task(self, task: Optional[str] = None) -> str:
+        # AgentActorBase.invoke_task, with the agent's run off the event loop
+        logger.info(f"Actor {self.actor_id} invoking a task")
+
+        messages = await self.get_messages()
+        default_task = messages[-1].get("content") if messages else None
+        task_entry_input = task or default_task or "Triggered without a specific task"
+
+        await self.set_status(AgentStatus.ACTIVE)
+
+        task_entry = AgentTaskEntry(input=task_entry_input, status=AgentTaskStatus.IN_PROGRESS)
+        self.state.task_history.append(task_entry)
+        await self._state_manager.set_state(self.agent_state_key, self.state.model_dump())
+        await self._state_manager.save_state()
+
+        try:
+            result = await asyncio.to_thread(self.agent.run, task) if task else await asyncio.to_thread(self.agent.run)
+
+            task_entry.output = result
+            task_entry.status = AgentTaskStatus.COMPLETE
+            await self.add_message(AgentActorMessage(role="assistant", content=result))
+            return result
+
+        except Exception as e:
+            logger.error(f"Error running task for actor {self.actor_id}: {str(e)}")
+            task_entry.status = AgentTaskStatus.FAILED
+            task_entry.output = str(e)
+            raise e
+
+        finally:
+            await self._state_manager.set_state(self.agent_state_key, self.state.model_dump())
+            await self._state_manager.save_state()
+            await self.set_status(AgentStatus.IDLE)
+
+
+class ThreadedAgentActorMixin(BaseModel):
+    """Hosts the agent in a ThreadedAgentActorBase actor, put it before AgentActorService in the bases."""
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        # the same actor type name as AgentActorService's, the orchestrator calls the agent by it
+        self.actor_class = type(self.actor_class.__name__, (ThreadedAgentActorBase,), {
+            "__init__": lambda actor, ctx, actor_id: ThreadedAgentActorBase.__init__(actor, ctx, actor_id),
+            "agent": self.agent,
+        })
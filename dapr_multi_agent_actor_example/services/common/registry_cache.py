@@ -0,0 +1,195 @@
+"""
+In-process cache of the agents registry.
+
+dapr-agents reads the `agents_registry` key from the registry state store every time a service
+looks up its peers: when the orchestrator lists the agents, every time it triggers an agent and
+every time an agent broadcasts or sends back a result. The registry only changes when a service
+starts and registers itself, so the mixins here answer those lookups from memory:
+
+- a registering service publishes an AgentRegistryChanged event on the `agent-registry` topic
+  after it saved its metadata, and every service drops its cached copy when the event arrives
+- the cached copy also expires after `AGENT_REGISTRY_CACHE_TTL` seconds, which covers a missed
+  event or an entry removed from the store by hand
+
+The services expose their lookup and store read counts on GET /GetRegistryStats.
+
+Usage:
+    class StockService(CachedAgentRegistryMixin, AssistantAgent):
+        ...
+
+    class StockService(CachedActorAgentRegistryMixin, AgentActorService):
+        ...
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from dapr.clients import DaprClient
+from dapr_agents.messaging import message_router
+from dapr_agents.types.message import EventMessageMetadata
+from fastapi import Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_TOPIC = "agent-registry"
+
+
+class AgentRegistryChanged(BaseModel):
+    name: str
+
+
+class AgentRegistryCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        # workflow activities look up agents from several threads
+        self._lock = threading.Lock()
+        self._registry: Optional[dict] = None
+        self._loaded_at = 0.0
+        self.lookups = 0
+        self.store_reads = 0
+        self.invalidations = 0
+        self.runs = 0
+
+    def get(self) -> Optional[dict]:
+        """A copy of the cached registry, or None when it has to be read from the store."""
+        with self._lock:
+            self.lookups += 1
+            if self._registry is None or time.monotonic() - self._loaded_at > self.ttl:
+                return None
+            return dict(self._registry)
+
+    def put(self, registry: Optional[dict]) -> None:
+        with self._lock:
+            self.store_reads += 1
+            # a failed read isn't cached, the next lookup tries the store again
+            if registry is not None:
+                self._registry = dict(registry)
+                self._loaded_at = time.monotonic()
+
+    def count_run(self) -> None:
+        with self._lock:
+            self.runs += 1
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.invalidations += 1
+            self._registry = None
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            runs = max(self.runs, 1)
+            return {
+                "lookups": self.lookups,
+                "store_reads": self.store_reads,
+                "invalidations": self.invalidations,
+                "runs": self.runs,
+                # every lookup was a store read before the cache
+                "store_reads_per_run_uncached": round(self.lookups / runs, 2),
+                "store_reads_per_run": round(self.store_reads / runs, 2),
+            }
+
+
+class AgentRegistryCacheBase(BaseModel):
+    registry_cache_ttl: float = Field(
+        default_factory=lambda: float(os.getenv("AGENT_REGISTRY_CACHE_TTL", "30")),
+        description="Seconds the agents registry is answered from memory before it is read again.",
+    )
+
+    _registry_cache: AgentRegistryCache = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        # the base classes register the agent at the end of their post init, which reads the registry
+        self._registry_cache = AgentRegistryCache(self.registry_cache_ttl)
+        super().model_post_init(__context)
+        self.app.add_api_route("/GetRegistryStats", self.get_registry_stats, methods=["GET"])
+
+    def is_registry_key(self, store_name: str, key: str) -> bool:
+        return store_name == self.agents_registry_store_name and key == self.agents_registry_key
+
+    @message_router(topic=REGISTRY_TOPIC)
+    async def process_agent_registry_changed(self, message: AgentRegistryChanged, metadata: EventMessageMetadata) -> Response:
+        """Drops the cached registry when a service registered itself."""
+        self._registry_cache.invalidate()
+        logger.debug(f"Agents registry changed by {message.name}, cache invalidated.")
+        return Response(status_code=200)
+
+    async def get_registry_stats(self) -> JSONResponse:
+        return JSONResponse(content=self._registry_cache.get_stats())
+
+
+class CachedAgentRegistryMixin(AgentRegistryCacheBase):
+    """
+    Registry cache for an AgenticWorkflowService (AssistantAgent or an orchestrator), put it first
+    in the bases. Runs are the workflows the service started.
+    """
+
+    def get_data_from_store(self, store_name: str, key: str) -> Optional[dict]:
+        if not self.is_registry_key(store_name, key):
+            return super().get_data_from_store(store_name, key)
+        registry = self._registry_cache.get()
+        if registry is None:
+            registry = super().get_data_from_store(store_name, key)
+            self._registry_cache.put(registry)
+        return registry
+
+    def register_agentic_system(self) -> None:
+        # read-modify-write of the registry, start from what is in the store
+        self._registry_cache.invalidate()
+        super().register_agentic_system()
+        self._registry_cache.invalidate()
+        try:
+            # registration runs during construction, before the service's event loop
+            with DaprClient(address=self.daprGrpcAddress) as client:
+                client.publish_event(
+                    pubsub_name=self.message_bus_name,
+                    topic_name=REGISTRY_TOPIC,
+                    data=AgentRegistryChanged(name=self.name).model_dump_json(),
+                    data_content_type="application/json",
+                    publish_metadata={"cloudevent.type": AgentRegistryChanged.__name__, "cloudevent.source": self.name},
+                )
+        except Exception as e:
+            logger.warning(f"Failed to publish the registry change for {self.name}, other services pick it up after {self.registry_cache_ttl}s: {e}")
+
+    def run_workflow(self, workflow, input=None) -> str:
+        self._registry_cache.count_run()
+        return super().run_workflow(workflow, input=input)
+
+
+class CachedActorAgentRegistryMixin(AgentRegistryCacheBase):
+    """
+    Registry cache for an AgentActorService, put it first in the bases. Runs are the tasks the
+    agent was triggered with.
+    """
+
+    async def get_data_from_store(self, store_name: str, key: str) -> Optional[dict]:
+        if not self.is_registry_key(store_name, key):
+            return await super().get_data_from_store(store_name, key)
+        registry = self._registry_cache.get()
+        if registry is None:
+            registry = await super().get_data_from_store(store_name, key)
+            self._registry_cache.put(registry)
+        return registry
+
+    async def register_agent_metadata(self) -> None:
+        # read-modify-write of the registry, start from what is in the store
+        self._registry_cache.invalidate()
+        await super().register_agent_metadata()
+        self._registry_cache.invalidate()
+        try:
+            await self.publish_event_message(
+                topic_name=REGISTRY_TOPIC,
+                pubsub_name=self.message_bus_name,
+                source=self.agent.name,
+                message=AgentRegistryChanged(name=self.agent.name),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to publish the registry change for {self.agent.name}, other services pick it up after {self.registry_cache_ttl}s: {e}")
+
+    async def invoke_task(self, task: Optional[str]) -> Response:
+        self._registry_cache.count_run()
+        return await super().invoke_task(task)
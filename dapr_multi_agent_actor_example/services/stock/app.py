@@ -1,53 +1,157 @@
 from dapr_agents import Agent, AgentActorService, tool
 from dapr_agents.llm.openai.chat import OpenAIChatClient
+from dapr_agents.messaging import message_router
+from dapr_agents.types.message import EventMessageMetadata
 from dotenv import load_dotenv
+from fastapi import Response
 import asyncio
 import logging
 import os
-import requests
+import sys
+import json
+import httpx
 from pydantic import BaseModel, Field
+from typing import List, Optional
+from stock_view import StockView
+
+# shared modules for the agent services live in services/common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.http_client import get_http_client, run_tool
+from common.tool_cache import get_tool_cache
+from common.registry_cache import CachedActorAgentRegistryMixin
+from common.llm_rate_limit import limit_llm_rate
+from common.model_routing import ModelRoutingMixin
+from common.actor_thread import ThreadedAgentActorMixin
 
 BASE_URL = "http://localhost"
 
+# availability kept up to date by the stock-changes topic, see process_stock_changed
+stock_view = StockView(ttl=float(os.getenv("STOCK_VIEW_TTL", "300")))
+# stock lookups shared by every agent, invalidated by the stock-changes topic, see services/common/tool_cache.py
+tool_cache = get_tool_cache()
+STOCK_CACHE_TTL = int(os.getenv("TOOL_CACHE_TTL_STOCK", "60"))
+
 
 # Stock API Calls
 class StockLevelSchema(BaseModel):
     store_id: str = Field(description="Store ID of the store to check stock")
     item_code: str = Field(description="Item Code of the item to check stock level for")
 
-@tool(args_model=StockLevelSchema)
-def call_get_stock_level(store_id: str, item_code: str) -> str:
-    """Get the stock level for a specific item at a specific store."""
+async def get_stock_level(store_id: str, item_code: str) -> str:
     try:
-        response = requests.get(f"{BASE_URL}:5002/stock/qty/{store_id}/{item_code}")
+        response = await get_http_client().get(f"{BASE_URL}:5002/stock/qty/{store_id}/{item_code}")
         response.raise_for_status()
         return f"Stock at Store {store_id} for Item {item_code}: {response.json()}"
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         return f"Error getting stock level: {e.response.text}"
 
+@tool(args_model=StockLevelSchema)
+@tool_cache.cached(ttl=STOCK_CACHE_TTL)
+def call_get_stock_level(store_id: str, item_code: str) -> str:
+    """Get the stock level for a specific item at a specific store."""
+    return run_tool(get_stock_level(store_id, item_code))
+
 
 class ItemCodeSchema(BaseModel):
     item_code: str = Field(description="Item Code of the item to find available stock for")
 
+async def get_item_stock(item_codes: List[str]) -> List[dict]:
+    """Every store's stock record for the items."""
+    response = await get_http_client().post(f"{BASE_URL}:5002/stock/bulk", json={"item_codes": item_codes})
+    response.raise_for_status()
+    # the bulk endpoint streams one JSON object per line
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+async def find_available_stock(item_code: str) -> str:
+    available_stock = stock_view.get_available(item_code)
+    if available_stock is None:
+        try:
+            # load every store's stock for the item, later changes arrive as events
+            stock = await get_item_stock([item_code])
+        except httpx.HTTPStatusError as e:
+            return f"Error finding available stock: {e.response.text}"
+        stock_view.load_item(item_code, stock)
+        available_stock = [record for record in stock if record["qty"] > 0]
+
+    if not available_stock:
+        return f"Error finding available stock: {json.dumps({'detail': 'No stock available'})}"
+    return f"Available Stock for Item {item_code}: {available_stock}"
+
 @tool(args_model=ItemCodeSchema)
 def call_find_available_stock(item_code: str) -> str:
     """Find available stock for a specific item across all stores."""
-    try:
-        response = requests.get(f"{BASE_URL}:5002/stock/available/{item_code}")
-        response.raise_for_status()
-        return f"Available Stock for Item {item_code}: {response.json()}"
-    except requests.HTTPError as e:
-        return f"Error finding available stock: {e.response.text}"
+    return run_tool(find_available_stock(item_code))
+
+
+class BulkStockLevelSchema(BaseModel):
+    item_codes: List[str] = Field(description="Item Codes of the items to check stock levels for")
+    store_ids: Optional[List[str]] = Field(default=None, description="Store IDs of the stores to check stock, all stores when omitted")
+
+def item_stock_key(item_code: str) -> str:
+    return tool_cache.key("item_stock", {"item_code": item_code})
+
+def stock_cache_keys(changes: List[dict]) -> List[str]:
+    """The cached results a change to these records makes stale."""
+    keys = set()
+    for change in changes:
+        keys.add(item_stock_key(change["item_code"]))
+        keys.add(tool_cache.key("call_get_stock_level", {"store_id": change["store_id"], "item_code": change["item_code"]}))
+    return sorted(keys)
+
+@tool(args_model=BulkStockLevelSchema)
+def call_get_bulk_stock_levels(item_codes: List[str], store_ids: Optional[List[str]] = None) -> str:
+    """Get the stock levels for multiple items across multiple stores in a single request."""
+    # every store's stock is cached per item, so overlapping bulk requests share the entries
+    keys = {item_code: item_stock_key(item_code) for item_code in item_codes}
+    cached = tool_cache.get_many(list(keys.values()))
+    stock_by_item = {item_code: cached[key] for item_code, key in keys.items() if key in cached}
+    missing = [item_code for item_code in keys if item_code not in stock_by_item]
+    if missing:
+        try:
+            records = run_tool(get_item_stock(missing))
+        except httpx.HTTPStatusError as e:
+            return f"Error getting bulk stock levels: {e.response.text}"
+        fetched = {item_code: [] for item_code in missing}
+        for record in records:
+            fetched.setdefault(record["item_code"], []).append(record)
+        tool_cache.set_many({keys[item_code]: fetched[item_code] for item_code in missing}, STOCK_CACHE_TTL)
+        stock_by_item.update(fetched)
+
+    stock = []
+    for item_code in item_codes:
+        records = {record["store_id"]: record for record in stock_by_item[item_code]}
+        if store_ids is None:
+            stock.extend(records.values())
+        else:
+            # the stock API answers a store without the item with an empty quantity
+            stock.extend(records.get(store_id, {"store_id": store_id, "item_code": item_code, "qty": None}) for store_id in store_ids)
+    return f"Stock levels for Items {item_codes}: {stock}"
+
+
+# Stock change feed
+class StockChanged(BaseModel):
+    changes: List[dict]
+    epoch: int = 0
+    version: int
+
+class StockService(ThreadedAgentActorMixin, ModelRoutingMixin, CachedActorAgentRegistryMixin, AgentActorService):
+    @message_router(topic="stock-changes")
+    async def process_stock_changed(self, message: StockChanged, metadata: EventMessageMetadata) -> Response:
+        """Applies the changes published by the stock API to the local availability view and drops the cached results they make stale."""
+        stock_view.apply_changes(message.changes, message.version, message.epoch)
+        await asyncio.to_thread(tool_cache.delete, stock_cache_keys(message.changes))
+        logging.debug(f"Applied stock changes version {message.version}: {stock_view.get_stats()}")
+        return Response(status_code=200)
 
 
 async def main():
     try:
-        llm = OpenAIChatClient(
+        llm = limit_llm_rate(OpenAIChatClient(
             api_key=os.getenv("AZURE_OPENAI_API_KEY"),
             azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
             azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
             api_version=os.getenv("AZURE_OPENAI_API_VERSION")
-        )
+        ))
         # Define Agent
         stock_agent = Agent(
             role="StockManager",
@@ -57,17 +161,19 @@ async def main():
                 "You are a stock agent.",
                 "You provide stock information using the tools specified below.",
                 "You can only make one request at a time.",
-                "You only have the get_stock_level and find_available_stock tools."
+                "Use get_bulk_stock_levels when you need the stock level for multiple stores or items, it answers them all in one request.",
+                "You only have the get_stock_level, find_available_stock and get_bulk_stock_levels tools."
             ],
             tools=[
                 call_get_stock_level,
-                call_find_available_stock
+                call_find_available_stock,
+                call_get_bulk_stock_levels
             ],
             llm=llm
         )
 
         # Expose Agent as an Actor over a Service
-        stock_service = AgentActorService(
+        stock_service = StockService(
             agent=stock_agent,
             message_bus_name="messagepubsub",
             agents_registry_store_name="agentstatestore",
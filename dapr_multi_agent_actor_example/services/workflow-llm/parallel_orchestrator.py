@@ -0,0 +1,297 @@
+"""
+Fan-out/fan-in variant of the LLM orchestrator.
+
+LLMOrchestrator assigns a single agent per iteration, so independent lookups (i.e. the product
+details from the catalog and the store list) run one after the other, each costing a full
+iteration. ParallelLLMOrchestrator asks the LLM for every step that can run now, triggers the
+agents for all of them at once over pub/sub and waits for all of their responses (or the
+timeout) before the next progress check and planning step.
+
+Each agent gets its own instruction in the TriggerAction rather than relying on the last
+broadcast message, as several instructions are broadcast in the same iteration.
+"""
+
+from dapr_agents import LLMOrchestrator
+from dapr_agents.types import DaprWorkflowContext
+from dapr_agents.workflow.decorators import task, workflow
+from dapr_agents.workflow.orchestrators.llm.schemas import NextStep, ProgressCheckOutput, TriggerAction, PLAN_SCHEMA, PROGRESS_CHECK_SCHEMA
+from dapr_agents.workflow.orchestrators.llm.state import LLMWorkflowEntry
+from dapr_agents.workflow.orchestrators.llm.utils import find_step_in_plan, update_step_statuses
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List
+from datetime import timedelta
+import asyncio
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ParallelNextSteps(BaseModel):
+    """The steps that can be worked on at the same time, one per agent."""
+    steps: List[NextStep] = Field(..., description="Independent steps to run in parallel, each assigned to a different agent.")
+
+PARALLEL_NEXT_STEPS_SCHEMA = json.dumps(ParallelNextSteps.model_json_schema())
+
+
+PARALLEL_NEXT_STEPS_PROMPT = """## Task Context
+
+The team is working on the following task:
+
+{task}
+
+### Team of Agents (ONLY these agents are available):
+{agents}
+
+### Current Execution Plan:
+{plan}
+
+### Next Steps:
+- **Select every step or substep that can be worked on right now**, up to {max_parallel_tasks} of them.
+- A step can only be selected if **it does not depend on the results of a step that is not `"completed"` yet**. If the remaining steps depend on each other, select only the next one.
+- **Assign each selected step to a different agent** from the team of agents list and **DO NOT select an agent that is not explicitly listed in `{agents}`**.
+- Provide a **clear, actionable instruction** for each agent that includes everything it needs from the previous results, as the agents work at the same time and can't see each other's answers.
+- **You must ONLY select step and substep IDs that EXIST in the plan.**
+  - **DO NOT select a `"completed"` step or substep.**
+  - **If the main step is `"not_started"` but has `"completed"` substeps, you must correctly identify the next `"not_started"` substep.**
+  - **DO NOT create or assume non-existent step/substep IDs.**
+
+### Expected Output Format (JSON Schema):
+{next_steps_schema}
+"""
+
+PARALLEL_PROGRESS_CHECK_PROMPT = """## Progress Check
+
+### Task Context
+The team is working on the following task:
+
+{task}
+
+### Current Execution Plan:
+
+{plan}
+
+### Latest Execution Context:
+Several agents worked on the following steps at the same time:
+
+{results}
+
+### Task Evaluation:
+Assess the task progress based on **conversation history**, the execution results of **every step above**, and the structured plan.
+
+1. **Determine Overall Task Verdict**
+   - `"continue"` → **Use this if there are `"not_started"` or `"in_progress"` steps that still require execution.**
+   - `"completed"` → The task is **done** (i.e., **all required steps and substeps have been completed**).
+   - `"failed"` → The task cannot be completed due to an unresolved issue.
+
+2. **Update Step & Sub-Step Status**
+   - **Update the status of every step above** based on its results. A step whose agent timed out goes back to `"not_started"`.
+   - If a **substep is completed**, check if **all** substeps are `"completed"` **before marking the parent step as "completed"**.
+   - **If a step is "completed" but has "not_started" substeps, DO NOT modify those substeps.**
+
+3. **Plan Adjustments (Only If Necessary)**
+   - If the step descriptions are **unclear or incomplete**, update `"plan_restructure"` with a **single modified step**.
+   - Do **not** introduce unnecessary modifications.
+
+### Important:
+- **Do NOT mark a step as `"completed"` unless explicitly confirmed based on execution results.**
+- **Always apply step/substep status updates, even if the task is `"completed"`**.
+
+### Expected Output Format (JSON Schema):
+{progress_check_schema}
+"""
+
+
+class ParallelLLMOrchestrator(LLMOrchestrator):
+    """
+    LLMOrchestrator that dispatches every independent step of an iteration to its agent at the
+    same time and waits for all the responses before checking progress.
+    """
+
+    max_parallel_tasks: int = Field(default=3, ge=1, description="Maximum number of agent tasks dispatched in a single iteration.")
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+
+        # /RunWorkflow starts the service's main workflow by name
+        self.workflow_name = "ParallelLLMWorkflow"
+
+    @workflow(name="ParallelLLMWorkflow")
+    def parallel_workflow(self, ctx: DaprWorkflowContext, input: TriggerAction):
+        """
+        Same loop as LLMWorkflow, except that each iteration fans out a task to every agent that
+        has an independent step to work on and fans the results back in.
+        """
+        task = input.get("task")
+        iteration = input.get("iteration")
+
+        instance_id = ctx.instance_id
+        self.state.setdefault("instances", {}).setdefault(instance_id, LLMWorkflowEntry(input=task).model_dump(mode="json"))
+        plan = self.state["instances"][instance_id].get("plan", [])
+
+        if not ctx.is_replaying:
+            logger.info(f"Parallel workflow iteration {iteration + 1} started (Instance ID: {instance_id}).")
+
+        agents = yield ctx.call_activity(self.get_agents_metadata_as_string)
+
+        if iteration == 0:
+            plan = yield ctx.call_activity(self.generate_plan, input={"task": task, "agents": agents, "plan_schema": PLAN_SCHEMA})
+            initial_message = yield ctx.call_activity(self.prepare_initial_message, input={"instance_id": instance_id, "task": task, "agents": agents, "plan": plan})
+            yield ctx.call_activity(self.broadcast_message_to_agents, input={"instance_id": instance_id, "task": initial_message})
+
+        # Fan out: every step that can run now, one per agent
+        next_steps = yield ctx.call_activity(self.generate_parallel_steps, input={"task": task, "agents": agents, "plan": plan, "max_parallel_tasks": self.max_parallel_tasks, "next_steps_schema": PARALLEL_NEXT_STEPS_SCHEMA})
+        steps = yield ctx.call_activity(self.validate_parallel_steps, input={"instance_id": instance_id, "plan": plan, "steps": next_steps["steps"]})
+
+        if steps:
+            yield ctx.call_activity(self.broadcast_message_to_agents, input={"instance_id": instance_id, "task": self.format_assignments(steps)})
+            plan = yield ctx.call_activity(self.trigger_agents, input={"instance_id": instance_id, "steps": steps})
+
+            if not ctx.is_replaying:
+                logger.info(f"Waiting for {', '.join(step['next_agent'] for step in steps)} to respond...")
+
+            # Fan in: responses arrive as AgentTaskResponse events in whatever order the agents finish
+            responses = [ctx.wait_for_external_event("AgentTaskResponse") for _ in steps]
+            all_responses = self.when_all(responses)
+            timeout_task = ctx.create_timer(timedelta(seconds=self.timeout))
+            winner = yield self.when_any([all_responses, timeout_task])
+
+            if winner == timeout_task:
+                logger.warning(f"Not every agent responded on time (Iteration: {iteration + 1}, Instance ID: {instance_id}).")
+                received = [response.get_result() for response in responses if response.is_complete]
+            else:
+                received = yield all_responses
+
+            step_results = self.match_responses(steps, received)
+
+            for step, results in step_results:
+                yield ctx.call_activity(self.update_task_history, input={"instance_id": instance_id, "agent": step["next_agent"], "step": step["step"], "substep": step.get("substep"), "results": results})
+
+            progress = yield ctx.call_activity(self.check_parallel_progress, input={"task": task, "plan": plan, "results": self.format_results(step_results), "progress_check_schema": PROGRESS_CHECK_SCHEMA})
+
+            if not ctx.is_replaying:
+                logger.info(f"Tracking Progress: {progress}")
+
+            verdict = progress["verdict"]
+            status_updates = progress.get("plan_status_update", [])
+            plan_updates = progress.get("plan_restructure", [])
+            last_step = step_results[-1][0]
+            task_results = {"name": self.name, "role": "user", "content": self.format_results(step_results)}
+        else:
+            logger.warning(f"None of the selected steps exist in the plan for instance {instance_id}. Recovering...")
+
+            verdict = "continue"
+            status_updates = []
+            plan_updates = []
+            last_step = {"next_agent": "orchestrator", "step": None, "substep": None}
+            task_results = {"name": "orchestrator", "role": "user", "content": "The selected steps do not exist in the plan. Adjusting workflow..."}
+
+        next_iteration_count = iteration + 1
+        if verdict != "continue" or next_iteration_count > self.max_iterations:
+            if next_iteration_count >= self.max_iterations:
+                verdict = "max_iterations_reached"
+
+            if not ctx.is_replaying:
+                logger.info(f"Workflow ending with verdict: {verdict}")
+
+            summary = yield ctx.call_activity(self.generate_summary, input={"task": task, "verdict": verdict, "plan": plan, "step": last_step["step"], "substep": last_step.get("substep"), "agent": last_step["next_agent"], "result": task_results["content"]})
+            yield ctx.call_activity(self.finish_workflow, input={"instance_id": instance_id, "plan": plan, "step": last_step["step"], "substep": last_step.get("substep"), "verdict": verdict, "summary": summary})
+
+            if not ctx.is_replaying:
+                logger.info(f"Workflow {instance_id} has been finalized with verdict: {verdict}")
+
+            return summary
+
+        if status_updates or plan_updates:
+            yield ctx.call_activity(self.update_plan, input={"instance_id": instance_id, "plan": plan, "status_updates": status_updates, "plan_updates": plan_updates})
+
+        input["task"] = task_results["content"]
+        input["iteration"] = next_iteration_count
+
+        ctx.continue_as_new(input)
+
+    @task(description=PARALLEL_NEXT_STEPS_PROMPT, include_chat_history=True)
+    async def generate_parallel_steps(self, task: str, agents: str, plan: str, max_parallel_tasks: int, next_steps_schema: str) -> ParallelNextSteps:
+        """
+        Selects the steps that can be worked on at the same time and an agent for each of them.
+        """
+        pass
+
+    @task
+    async def validate_parallel_steps(self, instance_id: str, plan: List[Dict[str, Any]], steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Keeps the steps that exist in the plan, one per agent and at most max_parallel_tasks.
+        An agent works on one task at a time, so a second step for the same agent waits for the next iteration.
+        """
+        valid_steps = []
+        agents = set()
+        for step in steps:
+            if not find_step_in_plan(plan, step["step"], step.get("substep")):
+                logger.error(f"Step {step['step']}, Substep {step.get('substep')} not found in plan for instance {instance_id}.")
+                continue
+            if step["next_agent"] in agents:
+                logger.info(f"Deferring step {step['step']}, substep {step.get('substep')} as {step['next_agent']} already has a task.")
+                continue
+            agents.add(step["next_agent"])
+            valid_steps.append(step)
+        return valid_steps[:self.max_parallel_tasks]
+
+    @task
+    async def trigger_agents(self, instance_id: str, steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Marks every step as in progress and sends each agent its own instruction.
+        """
+        workflow_entry = self.state["instances"].get(instance_id)
+        if not workflow_entry:
+            raise ValueError(f"No workflow entry found for instance_id: {instance_id}")
+
+        plan = workflow_entry["plan"]
+        for step in steps:
+            step_entry = find_step_in_plan(plan, step["step"], step.get("substep"))
+            if step_entry:
+                step_entry["status"] = "in_progress"
+
+        updated_plan = update_step_statuses(plan)
+        await self.update_workflow_state(instance_id=instance_id, plan=updated_plan)
+
+        logger.info(f"Triggering {len(steps)} agents in parallel (Instance ID: {instance_id})")
+        await asyncio.gather(*(
+            self.send_message_to_agent(name=step["next_agent"], message=TriggerAction(task=step["instruction"]), workflow_instance_id=instance_id)
+            for step in steps
+        ))
+
+        return updated_plan
+
+    @task(description=PARALLEL_PROGRESS_CHECK_PROMPT, include_chat_history=True)
+    async def check_parallel_progress(self, task: str, plan: str, results: str, progress_check_schema: str) -> ProgressCheckOutput:
+        """
+        Evaluates the plan's progress after a batch of parallel steps and determines the necessary updates.
+        """
+        pass
+
+    def match_responses(self, steps: List[Dict[str, Any]], responses: List[Dict[str, Any]]) -> List[tuple]:
+        """Pairs each step with its agent's response, or a timeout message if the agent didn't respond."""
+        by_agent = {response.get("name"): response for response in responses}
+        return [
+            (step, by_agent.get(step["next_agent"]) or {
+                "name": self.name,
+                "role": "user",
+                "content": f"Timeout occurred. {step['next_agent']} did not respond on time. We need to try again...",
+            })
+            for step in steps
+        ]
+
+    @staticmethod
+    def format_assignments(steps: List[Dict[str, Any]]) -> str:
+        assignments = "\n".join(
+            f"- {step['next_agent']} (step {step['step']}{', substep ' + str(step['substep']) if step.get('substep') else ''}): {step['instruction']}"
+            for step in steps
+        )
+        return f"The following tasks are being worked on in parallel:\n{assignments}"
+
+    @staticmethod
+    def format_results(step_results: List[tuple]) -> str:
+        return "\n\n".join(
+            f"### {step['next_agent']} (step {step['step']}{', substep ' + str(step['substep']) if step.get('substep') else ''})\n{results['content']}"
+            for step, results in step_results
+        )
@@ -2,6 +2,7 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List
 from data import catalog
+from coalescing import coalesce, get_stats
 
 class CatalogItem(BaseModel):
     item_description: str
@@ -10,10 +11,12 @@ class CatalogItem(BaseModel):
 catalog_app = FastAPI(title="Catalog API")
 
 @catalog_app.get("/catalog/all", response_model=List[CatalogItem])
+@coalesce("catalog_all", ttl=5)
 async def get_catalog() -> List[CatalogItem]:
     return catalog
 
 @catalog_app.get("/catalog/item/{item_code}", response_model=CatalogItem)
+@coalesce("catalog_item", ttl=5)
 async def get_item_description(item_code: str) -> CatalogItem:
     item = next((item for item in catalog if item["item_code"] == item_code), None)
     if not item:
@@ -21,9 +24,14 @@ async def get_item_description(item_code: str) -> CatalogItem:
     return item
 
 @catalog_app.get("/catalog/search/{query}", response_model=List[CatalogItem])
+@coalesce("catalog_search", ttl=5)
 async def find_item(query: str) -> List[CatalogItem]:
     results = [item for item in catalog if item["item_code"].lower() == query.lower() or
             any(word in item["item_description"].lower() for word in query.lower().split(" "))]
     if not results or len(results) == 0:
         raise HTTPException(status_code=404, detail="Item not found")
-    return results
\ No newline at end of file
+    return results
+
+@catalog_app.get("/catalog/coalescing/stats")
+async def get_coalescing_stats() -> dict:
+    return get_stats()
@@ -0,0 +1,147 @@
+"""
+Request coalescing and a micro-cache for the knowledge provider endpoints.
+
+Agents working on the same question ask a provider for the same result at about the same time,
+the full catalog, the store list, the availability of a popular item. An endpoint wrapped with
+coalesce(name, ttl) computes each distinct request once:
+
+- concurrent calls with the same arguments share one computation and all get its result, or its
+  error, a caller that goes away doesn't cancel it for the others
+- the result is then answered from memory for `ttl` seconds, the micro-cache window, errors
+  aren't kept
+- the window is set per endpoint with PROVIDER_CACHE_TTL_<NAME> (i.e. PROVIDER_CACHE_TTL_STOCK_AVAILABLE),
+  0 coalesces without caching, and PROVIDER_COALESCING_ENABLED=false turns it off everywhere
+- invalidate(name) drops what an endpoint has cached and stops later calls from joining a
+  computation already running, the stock API does it on every change so a write is never
+  followed by a stale read
+
+get_stats() returns the calls, computations, coalesced calls and cache hits of every endpoint.
+
+Usage:
+    @catalog_app.get("/catalog/all", response_model=List[CatalogItem])
+    @coalesce("catalog_all", ttl=5)
+    async def get_catalog() -> List[CatalogItem]:
+        ...
+"""
+
+import asyncio
+import functools
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+# distinct requests kept per endpoint, expired ones are dropped first
+MAX_ENTRIES = 1024
+
+
+def coalescing_enabled() -> bool:
+    return os.getenv("PROVIDER_COALESCING_ENABLED", "true").lower() == "true"
+
+
+def request_key(args: tuple, kwargs: dict) -> str:
+    def encode(value: Any) -> Any:
+        return value.model_dump() if hasattr(value, "model_dump") else str(value)
+
+    return json.dumps([args, kwargs], sort_keys=True, default=encode)
+
+
+class InFlightCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class EndpointCache:
+    """The computations in flight and the results cached for one endpoint."""
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.results: Dict[str, Tuple[float, Any]] = {}
+        self.in_flight: Dict[str, InFlightCall] = {}
+        # bumped by invalidate, a computation started before only answers its own waiters
+        self.generation = 0
+        self.stats = {"calls": 0, "computed": 0, "coalesced": 0, "cache_hits": 0}
+
+    async def get(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["calls"] += 1
+        cached = self.results.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self.stats["cache_hits"] += 1
+            return cached[1]
+        call = self.in_flight.get(key)
+        if call is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["computed"] += 1
+            # the computation belongs to every caller waiting for it, one giving up doesn't cancel it for the others
+            call = self.in_flight[key] = InFlightCall(asyncio.ensure_future(compute()))
+            call.task.add_done_callback(functools.partial(self.finished, key, call, self.generation))
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # nobody is left to answer, a later call starts over
+                call.task.cancel()
+                self.forget(key, call)
+
+    def finished(self, key: str, call: InFlightCall, generation: int, task: asyncio.Task) -> None:
+        self.forget(key, call)
+        # exception() retrieves the error, there may be no waiter left to retrieve it
+        if task.cancelled() or task.exception() is not None:
+            return
+        if self.ttl > 0 and generation == self.generation:
+            self.store(key, task.result())
+
+    def forget(self, key: str, call: InFlightCall) -> None:
+        if self.in_flight.get(key) is call:
+            del self.in_flight[key]
+
+    def store(self, key: str, result: Any) -> None:
+        now = time.monotonic()
+        if len(self.results) >= MAX_ENTRIES:
+            self.results = {k: entry for k, entry in self.results.items() if entry[0] > now}
+            if len(self.results) >= MAX_ENTRIES:
+                self.results.clear()
+        self.results[key] = (now + self.ttl, result)
+
+    def invalidate(self) -> None:
+        self.generation += 1
+        self.results.clear()
+        self.in_flight.clear()
+
+    def get_stats(self) -> dict:
+        return {**self.stats, "ttl": self.ttl, "cached": len(self.results), "in_flight": len(self.in_flight)}
+
+
+_endpoints: Dict[str, EndpointCache] = {}
+
+
+def coalesce(name: str, ttl: float) -> Callable:
+    """Coalesces the calls of an async endpoint and caches its results for PROVIDER_CACHE_TTL_<NAME> or ttl seconds."""
+    cache = _endpoints[name] = EndpointCache(name, float(os.getenv(f"PROVIDER_CACHE_TTL_{name.upper()}", str(ttl))))
+
+    def decorator(endpoint: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+        # functools.wraps keeps the signature FastAPI reads the parameters from
+        @functools.wraps(endpoint)
+        async def coalesced(*args, **kwargs):
+            if not coalescing_enabled():
+                return await endpoint(*args, **kwargs)
+            return await cache.get(request_key(args, kwargs), lambda: endpoint(*args, **kwargs))
+
+        return coalesced
+
+    return decorator
+
+
+def invalidate(*names: str) -> None:
+    for name in names:
+        _endpoints[name].invalidate()
+
+
+def get_stats() -> dict:
+    return {name: endpoint.get_stats() for name, endpoint in _endpoints.items()}
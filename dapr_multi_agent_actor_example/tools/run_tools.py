@@ -1,3 +1,4 @@
+import os
 import uvicorn
 from multiprocessing import Process
 
@@ -11,6 +12,9 @@ def run_stock_api():
     uvicorn.run("stock_api:stock_app", host="0.0.0.0", port=5002)
 
 if __name__ == "__main__":
+    # publish stock changes through the StockApp sidecar, see daprHTTPPort in dapr-llm.yaml
+    os.environ.setdefault("STOCK_EVENTS_DAPR_HTTP_PORT", "3502")
+
     p1 = Process(target=run_stores_api)
     p2 = Process(target=run_catalog_api)
     p3 = Process(target=run_stock_api)
@@ -1,25 +1,176 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Tuple
 from data import stock_qty
+from coalescing import coalesce, get_stats, invalidate
+import httpx
+import json
+import logging
+import os
+import time
 
 class StockItem(BaseModel):
     store_id: str
     item_code: str
-    qty: int
+    qty: int = Field(ge=0)
+
+class BulkStockRequest(BaseModel):
+    item_codes: List[str]
+    store_ids: Optional[List[str]] = None  # all stores stocking the item when omitted
+
+class StockQtyUpdate(BaseModel):
+    qty: int = Field(ge=0)
+
+class StockQtyAdjustment(BaseModel):
+    delta: int  # i.e. -1 for a sale, +20 for a delivery
+
+class StockIndex:
+    """
+    Stock records indexed by (store_id, item_code), by item and by the stores that have each item
+    in stock. Every change updates the indexes in O(1).
+
+    Records are replaced on write rather than mutated, and the handlers are async and never await
+    part way through an update, so a reader always sees a consistent snapshot without any locking.
+    """
+
+    def __init__(self, records: List[dict]):
+        # a change is (epoch, version): the version is incremented on every change so subscribers can
+        # discard stale events, the epoch is the start time so a restart doesn't count from 0 again
+        self.epoch = int(time.time() * 1000)
+        self.version = 0
+        self._records: Dict[Tuple[str, str], dict] = {}
+        self._by_item: Dict[str, Dict[str, dict]] = {}
+        self._available: Dict[str, Dict[str, dict]] = {}
+        self.import_records(records)
+
+    def get(self, store_id: str, item_code: str) -> Optional[dict]:
+        return self._records.get((store_id, item_code))
+
+    def get_item(self, item_code: str) -> List[dict]:
+        return list(self._by_item.get(item_code, {}).values())
+
+    def get_available(self, item_code: str) -> List[dict]:
+        return list(self._available.get(item_code, {}).values())
+
+    def set_qty(self, store_id: str, item_code: str, qty: int) -> dict:
+        if qty < 0:
+            raise ValueError(f"Stock can't go below zero, got {qty}")
+
+        record = {"store_id": store_id, "item_code": item_code, "qty": qty}
+        self.version += 1
+        self._records[(store_id, item_code)] = record
+        self._by_item.setdefault(item_code, {})[store_id] = record
+
+        available = self._available.setdefault(item_code, {})
+        if qty > 0:
+            available[store_id] = record
+        else:
+            available.pop(store_id, None)
+        return record
+
+    def adjust_qty(self, store_id: str, item_code: str, delta: int) -> dict:
+        current = self.get(store_id, item_code)
+        return self.set_qty(store_id, item_code, (current["qty"] if current else 0) + delta)
+
+    def import_records(self, records: List[dict]) -> int:
+        for record in records:
+            self.set_qty(record["store_id"], record["item_code"], record["qty"])
+        return len(records)
+
+stock_index = StockIndex(stock_qty)
+
+# the coalesced reads of the index, dropped on every change so a write is never followed by a stale read
+STOCK_READS = ("stock_qty", "stock_available", "stock_bulk")
+
+# Stock change feed, published through a Dapr sidecar when STOCK_EVENTS_DAPR_HTTP_PORT is set
+# so agent services can keep a local materialised view instead of polling this API.
+STOCK_EVENTS_PUBSUB = os.getenv("STOCK_EVENTS_PUBSUB", "messagepubsub")
+STOCK_EVENTS_TOPIC = os.getenv("STOCK_EVENTS_TOPIC", "stock-changes")
+stock_events_client = httpx.AsyncClient(timeout=2.0)
+
+async def publish_stock_changes(changes: List[dict]) -> None:
+    """Best effort, a failed publish never fails the stock update itself."""
+    dapr_http_port = os.getenv("STOCK_EVENTS_DAPR_HTTP_PORT")
+    if not dapr_http_port or not changes:
+        return
+
+    try:
+        response = await stock_events_client.post(
+            f"http://localhost:{dapr_http_port}/v1.0/publish/{STOCK_EVENTS_PUBSUB}/{STOCK_EVENTS_TOPIC}",
+            # the cloudevent type is what the agent services route on
+            params={"metadata.cloudevent.type": "StockChanged"},
+            json={"changes": changes, "epoch": stock_index.epoch, "version": stock_index.version},
+        )
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        logging.warning(f"Failed to publish stock changes: {e}")
 
 stock_app = FastAPI(title="Stock API")
 
 @stock_app.get("/stock/qty/{store_id}/{item_code}", response_model=StockItem)
+@coalesce("stock_qty", ttl=1)
 async def get_stock_level(store_id: str, item_code: str) -> StockItem:
-    stock = next((stock for stock in stock_qty if stock["store_id"] == store_id and stock["item_code"] == item_code), None)
+    stock = stock_index.get(store_id, item_code)
     if not stock:
         raise HTTPException(status_code=404, detail="Stock not found")
     return stock
 
 @stock_app.get("/stock/available/{item_code}", response_model=List[StockItem])
+@coalesce("stock_available", ttl=1)
 async def find_available_stock(item_code: str) -> List[StockItem]:
-    available_stock = [stock for stock in stock_qty if stock["item_code"] == item_code and stock["qty"] > 0]
+    available_stock = stock_index.get_available(item_code)
     if not available_stock:
         raise HTTPException(status_code=404, detail="No stock available")
-    return available_stock
\ No newline at end of file
+    return available_stock
+
+@stock_app.post("/stock/bulk")
+async def get_bulk_stock_levels(request: BulkStockRequest) -> StreamingResponse:
+    """
+    Stock levels for every store_id x item_code pair, streamed as newline delimited JSON.
+    Pairs without a stock record are returned with a null qty.
+    """
+    results = await bulk_stock_levels(request)
+    return StreamingResponse((json.dumps(result) + "\n" for result in results), media_type="application/x-ndjson")
+
+@coalesce("stock_bulk", ttl=1)
+async def bulk_stock_levels(request: BulkStockRequest) -> List[dict]:
+    # answer every pair from the index in one pass before streaming so the response is a consistent snapshot
+    results = []
+    for item_code in request.item_codes:
+        if request.store_ids is None:
+            results.extend(stock_index.get_item(item_code))
+            continue
+        for store_id in request.store_ids:
+            results.append(stock_index.get(store_id, item_code) or {"store_id": store_id, "item_code": item_code, "qty": None})
+    return results
+
+@stock_app.put("/stock/qty/{store_id}/{item_code}", response_model=StockItem)
+async def set_stock_level(store_id: str, item_code: str, update: StockQtyUpdate) -> StockItem:
+    record = stock_index.set_qty(store_id, item_code, update.qty)
+    invalidate(*STOCK_READS)
+    await publish_stock_changes([record])
+    return record
+
+@stock_app.post("/stock/adjust/{store_id}/{item_code}", response_model=StockItem)
+async def adjust_stock_level(store_id: str, item_code: str, adjustment: StockQtyAdjustment) -> StockItem:
+    try:
+        record = stock_index.adjust_qty(store_id, item_code, adjustment.delta)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    invalidate(*STOCK_READS)
+    await publish_stock_changes([record])
+    return record
+
+@stock_app.post("/stock/import")
+async def import_stock(stock: List[StockItem]) -> dict:
+    # applied in one go without awaiting, so readers see either none or all of the import
+    records = [item.model_dump() for item in stock]
+    imported = stock_index.import_records(records)
+    invalidate(*STOCK_READS)
+    await publish_stock_changes(records)
+    return {"imported": imported}
+
+@stock_app.get("/stock/coalescing/stats")
+async def get_coalescing_stats() -> dict:
+    return get_stats()
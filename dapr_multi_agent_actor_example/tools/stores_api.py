@@ -2,6 +2,7 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List, Dict
 from data import all_stores
+from coalescing import coalesce, get_stats
 
 class Store(BaseModel):
     store_id: str
@@ -11,10 +12,12 @@ class Store(BaseModel):
 stores_app = FastAPI(title="Stores API")
 
 @stores_app.get("/stores/all", response_model=List[Store])
+@coalesce("stores_all", ttl=5)
 async def get_all_stores() -> List[Store]:
     return all_stores
 
 @stores_app.get("/stores/store/{store_id}", response_model=Store)
+@coalesce("stores_store", ttl=5)
 async def find_store_by_id(store_id: str) -> Store:
     store = next((store for store in all_stores if store["store_id"] == store_id), None)
     if not store:
@@ -22,5 +25,10 @@ async def find_store_by_id(store_id: str) -> Store:
     return store
 
 @stores_app.get("/stores/closest", response_model=List[Store])
+@coalesce("stores_closest", ttl=5)
 async def find_closest_stores(location: str) -> List[Store]:
     return all_stores
+
+@stores_app.get("/stores/coalescing/stats")
+async def get_coalescing_stats() -> dict:
+    return get_stats()
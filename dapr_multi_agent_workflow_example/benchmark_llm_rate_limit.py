@@ -0,0 +1,135 @@
+"""
+Azure OpenAI calls with and without the client-side rate limiter, against mock_azure_openai.py.
+
+Several sessions make chat completions through the OpenAI client at once, each light session
+from one thread like a workflow activity, and one heavy session from `--heavy-threads` threads
+like a workflow fanning out. The run is made twice, each against a fresh mock deployment with
+the same limits:
+
+- unlimited: the OpenAI client's own retries, which wait for the `retry-after` of each 429
+- limited: the client over services/common/llm_rate_limit.py, configured with the deployment's
+  limits (`--limiter-rpm` / `--limiter-tpm` to get them wrong and watch it adapt)
+
+    python3 benchmark_llm_rate_limit.py --sessions 6 --calls 4 --heavy-calls 40
+
+The report has the calls that succeeded and failed, the 429s the mock sent, the latency
+percentiles and when the light sessions finished, on average, against the heavy one. Without
+the limiter the heavy session takes a share of the deployment for each of its threads, with it
+the sessions take turns.
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+import openai
+import uvicorn
+
+from mock_azure_openai import create_app
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "services"))
+from common.llm_rate_limit import RateLimitedTransport, RateLimiter, llm_session
+
+DEPLOYMENT = "gpt4o"
+PROMPT = "Which stores have the Ryobi One Plus 18V Drill in stock? " * 20
+
+
+def start_mock(args: argparse.Namespace, port: int):
+    app = create_app(args.rpm, args.tpm, args.latency)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="error"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, app
+
+
+def run_session(client: openai.AzureOpenAI, session: str, thread: str, calls: int, args: argparse.Namespace, started: float, results: dict) -> None:
+    latencies, failed = [], 0
+    with llm_session(session):
+        for _ in range(calls):
+            call_started = time.perf_counter()
+            try:
+                client.chat.completions.create(model=DEPLOYMENT, messages=[{"role": "user", "content": PROMPT}], max_tokens=args.max_tokens)
+                latencies.append(time.perf_counter() - call_started)
+            except openai.APIError:
+                failed += 1
+    results[thread] = {"latencies": latencies, "failed": failed, "finished": time.perf_counter() - started}
+
+
+def run(args: argparse.Namespace, port: int, limited: bool) -> dict:
+    server, app = start_mock(args, port)
+    http_client = None
+    if limited:
+        limiter = RateLimiter(args.limiter_rpm or args.rpm, args.limiter_tpm or args.tpm, {}, args.limiter_retries, completion_tokens=1000)
+        http_client = httpx.Client(transport=RateLimitedTransport(limiter))
+    client = openai.AzureOpenAI(
+        azure_endpoint=f"http://127.0.0.1:{port}", api_key="mock", api_version="2024-08-01-preview",
+        max_retries=args.client_retries, http_client=http_client,
+    )
+
+    results = {}
+    started = time.perf_counter()
+    sessions = [
+        threading.Thread(target=run_session, args=(client, "heavy", f"heavy-{index}", args.heavy_calls // args.heavy_threads, args, started, results))
+        for index in range(args.heavy_threads)
+    ]
+    sessions += [
+        threading.Thread(target=run_session, args=(client, f"light-{index}", f"light-{index}", args.calls, args, started, results))
+        for index in range(args.sessions - 1)
+    ]
+    for session in sessions:
+        session.start()
+    for session in sessions:
+        session.join()
+    elapsed = time.perf_counter() - started
+    server.should_exit = True
+
+    latencies = sorted(latency for result in results.values() for latency in result["latencies"])
+    light = [result["finished"] for thread, result in results.items() if thread.startswith("light")]
+    return {
+        "ok": len(latencies),
+        "failed": sum(result["failed"] for result in results.values()),
+        "throttled": app.state.limits.stats["throttled"],
+        "elapsed": elapsed,
+        "p50": latencies[len(latencies) // 2] if latencies else 0,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0,
+        "light_finished": statistics.mean(light) if light else 0,
+        "heavy_finished": max(result["finished"] for thread, result in results.items() if thread.startswith("heavy")),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare Azure OpenAI calls with and without the rate limiter against a mock deployment.")
+    parser.add_argument("--sessions", type=int, default=6, help="sessions calling at once, one of them heavy")
+    parser.add_argument("--calls", type=int, default=4, help="calls of every light session")
+    parser.add_argument("--heavy-calls", type=int, default=40, help="calls of the heavy session")
+    parser.add_argument("--heavy-threads", type=int, default=8, help="threads the heavy session calls from")
+    parser.add_argument("--rpm", type=int, default=120, help="requests per minute of the mock deployment")
+    parser.add_argument("--tpm", type=int, default=60000, help="tokens per minute of the mock deployment")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds every answered call takes")
+    parser.add_argument("--max-tokens", type=int, default=200, help="max_tokens of every call")
+    parser.add_argument("--client-retries", type=int, default=2, help="retries of the OpenAI client")
+    parser.add_argument("--limiter-rpm", type=int, default=None, help="requests per minute the limiter allows, the mock's if not set")
+    parser.add_argument("--limiter-tpm", type=int, default=None, help="tokens per minute the limiter allows, the mock's if not set")
+    parser.add_argument("--limiter-retries", type=int, default=5, help="retries of a throttled call by the limiter")
+    parser.add_argument("--port", type=int, default=5099, help="port of the first mock, the second gets the next one")
+    args = parser.parse_args()
+
+    calls = args.heavy_calls // args.heavy_threads * args.heavy_threads + args.calls * (args.sessions - 1)
+    print(f"{calls} calls from {args.sessions} sessions, deployment limited to {args.rpm} RPM / {args.tpm} TPM\n")
+    print(f"{'':<10} | {'ok':>4} | {'failed':>6} | {'429s':>5} | {'elapsed':>8} | {'p50':>7} | {'p95':>7} | light done | heavy done")
+    for index, (name, limited) in enumerate((("unlimited", False), ("limited", True))):
+        result = run(args, args.port + index, limited)
+        print(
+            f"{name:<10} | {result['ok']:>4} | {result['failed']:>6} | {result['throttled']:>5} | {result['elapsed']:>7.1f}s | "
+            f"{result['p50']:>6.2f}s | {result['p95']:>6.2f}s | {result['light_finished']:>9.1f}s | {result['heavy_finished']:>9.1f}s"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""
+Orchestration overhead benchmark on the in-process runtime.
+
+Runs the catalog, stores, stock and orchestrator services in this process on the stand-ins from
+local_runtime: in-memory state stores and pub/sub with the component names from components/, an
+in-memory workflow engine and a scripted LLM. No Dapr, Redis, tool servers or Azure OpenAI are
+needed, so what is measured is what the services themselves spend on messaging, state and
+workflow bookkeeping per workflow:
+
+    python3 benchmark_local_runtime.py --workflows 50 --concurrency 10
+
+Workflows are started through the orchestrator's /RunWorkflow, all scheduled at once with at
+most `--concurrency` in flight, and followed to completion. A workflow's latency counts from the
+start of the run, so its wait for a slot is part of it. The report has the throughput and
+latency percentiles, then per workflow the state store reads, writes and bytes written, the
+pub/sub messages and the LLM calls. `--llm-latency` gives every
+LLM call a fixed delay, `--mode` picks the parallel or the sequential orchestrator.
+
+`--replicas` runs each agent service as that many replicas, each handling its partition of the
+agent's topic (services/common/partitioning.py), and the report shows how the triggers were
+spread. Every service runs its activities on its own pool of `--activity-workers` threads, so
+with a slow agent LLM (`--agent-llm-latency`) the replicas add capacity, see
+benchmark_replicas.py.
+
+`--max-concurrent-tasks` and `--max-queued-tasks` set the work queue of each agent service
+(services/common/backpressure.py), and the report shows how many triggers were queued, waited
+and were shed. Starting a burst of workflows with and without a limit shows what it does to the
+latency percentiles:
+
+    python3 benchmark_local_runtime.py --workflows 48 --concurrency 48 --agent-llm-latency 0.5 --max-concurrent-tasks 1000
+    python3 benchmark_local_runtime.py --workflows 48 --concurrency 48 --agent-llm-latency 0.5 --max-concurrent-tasks 4
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+import local_runtime
+from local_runtime import scripted_llm
+
+SERVICES = ["catalog", "stores", "stock", "workflow-llm"]
+AGENTS = ["catalog", "stores", "stock"]
+ORCHESTRATOR = "LLMOrchestrator"
+DEFAULT_TASK = "Find information about the Ryobi One Plus 18V Drill and check which stores have it in stock."
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    return ordered[max(0, int(round(len(ordered) * fraction)) - 1)]
+
+
+async def run_workflow(sidecar, semaphore: asyncio.Semaphore, args: argparse.Namespace, scheduled_at: float, latencies: list, statuses: dict) -> None:
+    # the latency counts from when the workflow was scheduled, waiting for a concurrency slot included
+    async with semaphore:
+        response = await sidecar.get_app(ORCHESTRATOR).client.post("/RunWorkflow", json={"task": args.task})
+        if response.status_code != 202:
+            status = "START_FAILED"
+        else:
+            try:
+                instance = await asyncio.wait_for(sidecar.workflows.wait_for_completion(response.json()["workflow_instance_id"]), args.timeout)
+                status = instance.status.name
+            except asyncio.TimeoutError:
+                status = "TIMED_OUT"
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == "COMPLETED":
+            latencies.append((time.perf_counter() - scheduled_at) * 1000)
+
+
+def summary(workflows: int, replicas: int, elapsed: float, latencies: list, statuses: dict) -> dict:
+    ordered = sorted(latencies) or [0]
+    return {
+        "workflows": workflows,
+        "replicas": replicas,
+        "elapsed": round(elapsed, 3),
+        "completed_per_second": round(len(latencies) / elapsed, 2),
+        "statuses": statuses,
+        "p50_ms": round(percentile(ordered, 0.5)),
+        "p95_ms": round(percentile(ordered, 0.95)),
+        "p99_ms": round(percentile(ordered, 0.99)),
+    }
+
+
+async def get_app_stats(sidecar, path: str) -> dict:
+    """The stats the agents return on path, by app id."""
+    stats = {}
+    for app in sidecar.apps():
+        response = await app.client.get(path)
+        if response.status_code == 200:
+            stats[app.app_id] = response.json()
+    return stats
+
+
+def report(workflows: int, elapsed: float, latencies: list, statuses: dict, stats: dict, llm_calls: dict, partitions: dict, queues: dict) -> None:
+    print(f"\n{workflows} workflows in {elapsed:.2f}s, {len(latencies) / elapsed:.1f} completed/s")
+    print("  " + " | ".join(f"{status.lower()} {count}" for status, count in sorted(statuses.items())))
+    if latencies:
+        ordered = sorted(latencies)
+        print(
+            f"  latency: mean {statistics.mean(ordered):.0f} ms | p50 {percentile(ordered, 0.5):.0f} ms | "
+            f"p95 {percentile(ordered, 0.95):.0f} ms | p99 {percentile(ordered, 0.99):.0f} ms | max {ordered[-1]:.0f} ms"
+        )
+
+    print("\nper workflow:")
+    for name, store in stats["state"].items():
+        print(
+            f"  {name:<20} {store['reads'] / workflows:7.1f} reads | {store['writes'] / workflows:7.1f} writes | "
+            f"{store['bytes_written'] / workflows / 1024:8.1f} KiB written | {store['keys']} keys at the end"
+        )
+    for name, pubsub in stats["pubsub"].items():
+        print(f"  {name:<20} {pubsub['published'] / workflows:7.1f} published | {pubsub['delivered'] / workflows:7.1f} delivered | {pubsub['failed']} failed")
+        for topic, counts in pubsub["topics"].items():
+            print(f"    {topic:<18} {counts['published'] / workflows:7.1f} published | {counts['delivered'] / workflows:7.1f} delivered")
+    print(f"  {'activities':<20} {stats['workflows']['activities'] / workflows:7.1f}")
+    print(f"  {'llm calls':<20} {llm_calls['calls'] / workflows:7.1f} " + " ".join(f"({kind} {count / workflows:.1f})" for kind, count in llm_calls.items() if kind != "calls"))
+
+    if any(partition["replicas"] > 1 for partition in partitions.values()):
+        print("\nreplicas:")
+        for app_id, partition in sorted(partitions.items()):
+            print(f"  {app_id:<20} {partition['handled']:7d} handled | {partition['skipped']:7d} skipped | {partition['unpartitioned']:7d} unpartitioned")
+
+    print("\nwork queues:")
+    for app_id, queue in sorted(queues.items()):
+        mean_wait = queue["wait_seconds"] / queue["admitted"] * 1000 if queue["admitted"] else 0
+        print(
+            f"  {app_id:<20} {queue['admitted']:7d} admitted ({queue['reordered']} ahead of earlier triggers) | "
+            f"{queue['shed_full'] + queue['shed_timeout']:5d} shed | peak {queue['peak_queued']} queued | {mean_wait:.0f} ms mean wait"
+        )
+
+
+async def main(args: argparse.Namespace) -> int:
+    sidecar = local_runtime.install()
+    services = local_runtime.run_services(SERVICES, {name: args.replicas for name in AGENTS})
+    await sidecar.wait_for_apps(len(services))
+
+    # the services register themselves while they start, count from here on
+    baseline = sidecar.get_stats()
+    baseline_llm = scripted_llm.get_stats()
+    latencies, statuses = [], {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*(run_workflow(sidecar, semaphore, args, start, latencies, statuses) for _ in range(args.workflows)))
+    elapsed = time.perf_counter() - start
+    # let the last responses and broadcasts be delivered
+    await asyncio.sleep(0.2)
+
+    queues = await get_app_stats(sidecar, "/GetWorkQueueStats")
+    if args.json:
+        result = summary(args.workflows, args.replicas, elapsed, latencies, statuses)
+        result["shed"] = sum(queue["shed_full"] + queue["shed_timeout"] for queue in queues.values())
+        print(json.dumps(result))
+    else:
+        report(
+            args.workflows, elapsed, latencies, statuses, subtract(sidecar.get_stats(), baseline),
+            subtract(scripted_llm.get_stats(), baseline_llm), await get_app_stats(sidecar, "/GetPartitionStats"), queues,
+        )
+
+    sidecar.stop()
+    await asyncio.gather(*services, return_exceptions=True)
+    return 0 if statuses.get("COMPLETED", 0) == args.workflows else 1
+
+
+def subtract(after, before):
+    """The counters accumulated since the baseline, gauges such as the number of keys are kept."""
+    if isinstance(after, dict):
+        return {key: subtract(value, before.get(key, 0) if isinstance(before, dict) else 0) if key != "keys" else value for key, value in after.items()}
+    return after - before
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run workflows on the in-process runtime and report the messaging and state overhead.")
+    parser.add_argument("--workflows", type=int, default=20, help="number of workflows to run")
+    parser.add_argument("--concurrency", type=int, default=10, help="maximum workflows in flight")
+    parser.add_argument("--mode", choices=["parallel", "sequential"], default=os.getenv("ORCHESTRATOR_MODE", "sequential"), help="orchestrator to run")
+    parser.add_argument("--llm-latency", type=float, default=0, help="seconds every scripted LLM call takes")
+    parser.add_argument("--agent-llm-latency", type=float, default=None, help="seconds every scripted LLM call of an agent takes, --llm-latency if not set")
+    parser.add_argument("--replicas", type=int, default=1, help="replicas of each agent service")
+    parser.add_argument("--activity-workers", type=int, default=None, help="activity threads of each service, durabletask's default if not set")
+    parser.add_argument("--max-concurrent-tasks", type=int, default=None, help="agent workflows each agent service runs at once, AGENT_MAX_CONCURRENT_TASKS if not set")
+    parser.add_argument("--max-queued-tasks", type=int, default=None, help="triggers each agent service queues before shedding, AGENT_MAX_QUEUED_TASKS if not set")
+    parser.add_argument("--plan-steps", type=int, default=3, help="steps in every scripted plan")
+    parser.add_argument("--task", default=DEFAULT_TASK, help="task sent to every workflow")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for each workflow to finish")
+    parser.add_argument("--verbose", action="store_true", help="show the services' logs")
+    parser.add_argument("--json", action="store_true", help="print a one line JSON summary instead of the report")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.environ["ORCHESTRATOR_MODE"] = args.mode
+    os.environ["SCRIPTED_LLM_LATENCY"] = str(args.llm_latency)
+    os.environ["SCRIPTED_LLM_PLAN_STEPS"] = str(args.plan_steps)
+    if args.agent_llm_latency is not None:
+        os.environ["SCRIPTED_LLM_AGENT_LATENCY"] = str(args.agent_llm_latency)
+    if args.activity_workers is not None:
+        os.environ["LOCAL_WORKFLOW_ACTIVITY_WORKERS"] = str(args.activity_workers)
+    if args.max_concurrent_tasks is not None:
+        os.environ["AGENT_MAX_CONCURRENT_TASKS"] = str(args.max_concurrent_tasks)
+    if args.max_queued_tasks is not None:
+        os.environ["AGENT_MAX_QUEUED_TASKS"] = str(args.max_queued_tasks)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    sys.exit(asyncio.run(main(args)))
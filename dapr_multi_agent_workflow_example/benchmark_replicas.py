@@ -0,0 +1,96 @@
+"""
+Throughput of the workflows against the number of agent replicas, on the in-process runtime.
+
+Runs benchmark_local_runtime.py once per replica count, each in a fresh process, with the agents'
+LLM calls made slow enough that the agents' activity workers are what limits the throughput:
+
+    python3 benchmark_replicas.py --replicas 1 2
+
+Each replica handles the triggers of its partition of the orchestrator workflows (see
+services/common/partitioning.py) on its own activity workers, so the throughput should grow
+with the replicas until something else becomes the limit. Exits with 1 if a workflow didn't
+complete or a replica count didn't beat the throughput of the one before it by --min-gain.
+
+Past 2 replicas the gain drops below that (1.41x from 1 to 2 replicas, 1.12x from 2 to 4 on
+one CPU), for two reasons:
+
+- every service and replica runs in this one process under one GIL, and every replica handles
+  every broadcast, so the CPU a run costs grows with the replicas (11.5s, 15.4s and 23.6s for
+  1, 2 and 4) and the activities wait for it: with 4 replicas an agent's generate_response took
+  3.0s for 2s LLM calls and its get_response_message 0.9s, holding its activity worker twice
+  as long as the LLM call
+- the hash partitioning splits a burst unevenly, with 4 replicas the busiest one of each agent
+  got 21 of the 64 workflows and the quietest 11, and the run lasts as long as the busiest
+  replica, which was busy all the time while the quietest finished 8s earlier
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+EXAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run(args: argparse.Namespace, replicas: int) -> dict:
+    command = [
+        sys.executable, os.path.join(EXAMPLE_DIR, "benchmark_local_runtime.py"), "--json",
+        "--replicas", str(replicas),
+        "--workflows", str(args.workflows),
+        "--concurrency", str(args.workflows),
+        "--llm-latency", str(args.llm_latency),
+        "--agent-llm-latency", str(args.agent_llm_latency),
+        "--activity-workers", str(args.activity_workers),
+        # the agents work on the steps of a workflow at the same time
+        "--mode", "parallel",
+        # room in the agents' work queues for the whole burst, nothing is shed
+        "--max-queued-tasks", str(args.workflows),
+    ]
+    usage_before, started = resource.getrusage(resource.RUSAGE_CHILDREN), time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True, cwd=EXAMPLE_DIR)
+    usage_after, wall = resource.getrusage(resource.RUSAGE_CHILDREN), time.perf_counter() - started
+    lines = [line for line in result.stdout.splitlines() if line.startswith("{")]
+    if not lines:
+        raise RuntimeError(f"The benchmark with {replicas} replica(s) printed no summary:\n{result.stderr[-2000:]}")
+    summary = json.loads(lines[-1])
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    summary["cpu_seconds"] = round(cpu, 1)
+    summary["cpu_busy"] = cpu / wall
+    return summary
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare the workflow throughput for several numbers of agent replicas.")
+    parser.add_argument("--replicas", type=int, nargs="+", default=[1, 2], help="replica counts to run, in increasing order")
+    parser.add_argument("--workflows", type=int, default=64, help="workflows per run, all started at once")
+    parser.add_argument("--llm-latency", type=float, default=0.02, help="seconds every orchestrator LLM call takes")
+    parser.add_argument("--agent-llm-latency", type=float, default=2, help="seconds every agent LLM call takes")
+    parser.add_argument("--activity-workers", type=int, default=2, help="activity threads of each service and replica")
+    parser.add_argument("--min-gain", type=float, default=1.25, help="throughput ratio to the replica count before it every count has to reach")
+    args = parser.parse_args()
+
+    print(f"{args.workflows} workflows, agent LLM calls of {args.agent_llm_latency}s, {args.activity_workers} activity workers per replica\n")
+    print(f"{'replicas':>8} | {'completed/s':>11} | {'gain':>6} | {'p50 ms':>8} | {'p95 ms':>8} | {'cpu':>13} | statuses")
+    results, ok = [], True
+    for replicas in args.replicas:
+        summary = run(args, replicas)
+        gain = summary["completed_per_second"] / results[-1]["completed_per_second"] if results else 1.0
+        print(
+            f"{replicas:>8} | {summary['completed_per_second']:>11.2f} | {gain:>5.2f}x | {summary['p50_ms']:>8} | "
+            f"{summary['p95_ms']:>8} | {summary['cpu_seconds']:>6}s {summary['cpu_busy']:>4.0%} | "
+            + ", ".join(f"{status.lower()} {count}" for status, count in summary["statuses"].items())
+        )
+        if summary["statuses"].get("COMPLETED", 0) != args.workflows:
+            ok = False
+        if results and gain < args.min_gain:
+            print(f"{replicas} replicas didn't beat {results[-1]['replicas']} by {args.min_gain}x")
+            ok = False
+        results.append(summary)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
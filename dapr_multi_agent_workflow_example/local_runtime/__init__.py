@@ -0,0 +1,99 @@
+"""
+Runs the services of this example in one process without Dapr, Redis or an LLM.
+
+install() swaps the Dapr clients, the workflow runtime and client and the services' HTTP server
+for the in-process stand-ins in this package, and the Azure OpenAI client for the scripted one.
+It has to be called on the event loop the services run on, before their modules are imported.
+It patches internals of dapr-agents 0.2, which requirements.txt pins.
+run_services() then loads each services/<name>/app.py and runs its main() on that loop:
+
+    sidecar = local_runtime.install()
+    tasks = local_runtime.run_services(["catalog", "stores", "stock", "workflow-llm"])
+    await sidecar.wait_for_apps(len(tasks))
+
+See benchmark_local_runtime.py. The actor example isn't covered, its agents need the Dapr actor
+runtime and placement service.
+"""
+
+import asyncio
+import concurrent.futures
+import importlib.util
+import os
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .scripted_llm import ScriptedChatClient
+from .sidecar import LocalAsyncDaprClient, LocalDaprClient, LocalSidecar, get_sidecar, set_sidecar
+from .workflows import LocalWorkflowClient, LocalWorkflowRuntime
+
+EXAMPLE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPONENTS_DIR = os.path.join(EXAMPLE_DIR, "components")
+SERVICES_DIR = os.path.join(EXAMPLE_DIR, "services")
+# dapr-agents waits for every workflow it starts on a thread of the loop's default executor
+DEFAULT_EXECUTOR_WORKERS = 256
+
+
+async def serve_locally(self, log_level=None) -> None:
+    """Replaces FastAPIServerBase.start, the service is called through the sidecar instead of a port."""
+    # replicas get their own app id, as make_replicas_run_file.py gives them
+    replicas = getattr(self, "replicas", 1)
+    app_id = f"{self.service_name}-{self.replica_index}" if replicas > 1 else self.service_name
+    await get_sidecar().serve(app_id, self.app)
+
+
+def install(components_dir: str = COMPONENTS_DIR, scripted_llm: bool = True) -> LocalSidecar:
+    import dapr.aio.clients
+    import dapr.clients
+    import dapr_agents.llm.openai.chat
+    import dapr_agents.messaging.dapr
+    import dapr_agents.storage.daprstores.statestore
+    import dapr_agents.workflow.agentic
+    import dapr_agents.workflow.base
+    from dapr_agents.service.fastapi.base import FastAPIServerBase
+
+    loop = asyncio.get_running_loop()
+    # as separate processes each service would have its own default executor, here they share
+    # the loop's and the orchestrator's waits mustn't hold up the agents'
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=DEFAULT_EXECUTOR_WORKERS, thread_name_prefix="local-to-thread"))
+    sidecar = LocalSidecar(components_dir)
+    sidecar.workflows.attach(loop)
+    set_sidecar(sidecar)
+
+    # the modules that imported the clients by name keep their own reference
+    dapr.clients.DaprClient = LocalDaprClient
+    dapr.aio.clients.DaprClient = LocalAsyncDaprClient
+    dapr_agents.storage.daprstores.statestore.DaprClient = LocalDaprClient
+    dapr_agents.workflow.agentic.DaprClient = LocalDaprClient
+    dapr_agents.workflow.base.DaprClient = LocalDaprClient
+    dapr_agents.messaging.dapr.DaprClient = LocalAsyncDaprClient
+    dapr_agents.workflow.base.WorkflowRuntime = LocalWorkflowRuntime
+    dapr_agents.workflow.base.DaprWorkflowClient = LocalWorkflowClient
+    FastAPIServerBase.start = serve_locally
+    if scripted_llm:
+        dapr_agents.llm.openai.chat.OpenAIChatClient = ScriptedChatClient
+    return sidecar
+
+
+async def run_replica(main: Callable[[], Awaitable[None]], replicas: int, index: int) -> None:
+    # the service reads its replica settings when main() constructs it, before main() first yields
+    os.environ.update(AGENT_REPLICAS=str(replicas), AGENT_REPLICA_INDEX=str(index))
+    await main()
+
+
+def run_services(names: List[str], replicas: Optional[Dict[str, int]] = None) -> List[asyncio.Task]:
+    """
+    Starts the main() of each services/<name>/app.py as a task on the running loop, replicas
+    gives the number of replicas to start of a service (one by default).
+    """
+    tasks = []
+    for name in names:
+        service_dir = os.path.join(SERVICES_DIR, name)
+        # each app imports its own modules (stock_view, parallel_orchestrator) from its directory
+        sys.path.insert(0, service_dir)
+        spec = importlib.util.spec_from_file_location(f"{name.replace('-', '_')}_app", os.path.join(service_dir, "app.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        count = (replicas or {}).get(name, 1)
+        for index in range(count):
+            tasks.append(asyncio.get_running_loop().create_task(run_replica(module.main, count, index), name=f"{name}-{index}" if count > 1 else name))
+    return tasks
@@ -0,0 +1,149 @@
+"""
+Scripted chat client standing in for Azure OpenAI in the local runtime.
+
+It answers every call the orchestrators and agents make from the prompt alone, with no model
+behind it: a plan of SCRIPTED_LLM_PLAN_STEPS steps, the next step(s) in plan order assigned to
+the listed agents in turn, a progress check marking the steps that just reported back as
+completed, a fixed summary, and for the agents a final answer without tool calls. Every
+workflow therefore takes the same path, which is what a benchmark of the messaging and state
+overhead wants. SCRIPTED_LLM_LATENCY adds a fixed delay to each call, SCRIPTED_LLM_AGENT_LATENCY
+a different one to the agents' calls.
+"""
+
+import collections.abc
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Type, get_args, get_origin
+
+from dapr_agents.llm.chat import ChatClientBase
+from dapr_agents.types.message import ChatCompletion
+from dapr_agents.workflow.orchestrators.llm.schemas import NextStep, ProgressCheckOutput
+from dapr_agents.workflow.orchestrators.llm.state import PlanStep
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+# the plan is formatted into the prompts as a list of dicts
+PLAN_STEP_PATTERN = re.compile(r"""['"]step['"]:\s*(\d+),\s*['"]description['"]:.*?['"]status['"]:\s*['"](\w+)['"]""")
+AGENT_PATTERN = re.compile(r"^- (\S+): ", re.MULTILINE)
+# the step that just ran, as the sequential and the parallel progress checks list it
+CURRENT_STEP_PATTERN = re.compile(r"\*\*Step ID:\*\*\s*(\d+)|\(step (\d+)")
+MAX_PARALLEL_PATTERN = re.compile(r"up to (\d+) of them")
+
+# calls made by every scripted client in the process, by kind of answer
+_calls: Dict[str, int] = collections.defaultdict(int)
+_calls_lock = threading.Lock()
+
+
+def get_stats() -> dict:
+    with _calls_lock:
+        return {"calls": sum(_calls.values()), **_calls}
+
+
+class ScriptedChatClient(ChatClientBase):
+    latency: float = Field(
+        default_factory=lambda: float(os.getenv("SCRIPTED_LLM_LATENCY", "0")),
+        description="Seconds every call takes.",
+    )
+    agent_latency: Optional[float] = Field(
+        default_factory=lambda: float(os.environ["SCRIPTED_LLM_AGENT_LATENCY"]) if os.getenv("SCRIPTED_LLM_AGENT_LATENCY") else None,
+        description="Seconds every call of an agent takes, latency when not set.",
+    )
+    plan_steps: int = Field(
+        default_factory=lambda: int(os.getenv("SCRIPTED_LLM_PLAN_STEPS", "3")),
+        description="Steps in every plan.",
+    )
+
+    @classmethod
+    def from_prompty(cls, prompty_source, timeout=1500) -> "ScriptedChatClient":
+        raise NotImplementedError("The scripted chat client doesn't load prompty files")
+
+    def generate(
+        self,
+        messages: Any = None,
+        input_data: Optional[Dict[str, Any]] = None,
+        model: Optional[str] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        response_format: Optional[Type[BaseModel]] = None,
+        structured_mode: Optional[str] = None,
+        **kwargs,
+    ) -> Any:
+        # the agents pass their tools, the orchestrators don't
+        latency = self.agent_latency if tools is not None and self.agent_latency is not None else self.latency
+        if latency:
+            time.sleep(latency)
+        prompt = self.last_message(messages)
+
+        if get_origin(response_format) in (Iterable, collections.abc.Iterable) and get_args(response_format)[0] is PlanStep:
+            return self.count("plan", self.plan())
+        if response_format is NextStep:
+            return self.count("next_step", self.next_steps(prompt, 1)[0])
+        if response_format is ProgressCheckOutput:
+            return self.count("progress_check", self.progress_check(prompt))
+        if isinstance(response_format, type) and response_format.__name__ == "ParallelNextSteps":
+            max_steps = MAX_PARALLEL_PATTERN.search(prompt)
+            steps = self.next_steps(prompt, int(max_steps.group(1)) if max_steps else 1)
+            return self.count("next_step", response_format(steps=steps))
+        if response_format is not None:
+            raise ValueError(f"The scripted chat client has no answer for {response_format}")
+        if tools is not None:
+            return self.count("agent", self.completion("Scripted answer: the requested information was found."))
+        return self.count("summary", self.completion("Scripted summary: every step of the plan was completed."))
+
+    @staticmethod
+    def count(kind: str, result: Any) -> Any:
+        # activities call the client from several threads
+        with _calls_lock:
+            _calls[kind] += 1
+        return result
+
+    @staticmethod
+    def last_message(messages: Any) -> str:
+        if isinstance(messages, (str, dict, BaseModel)):
+            messages = [messages]
+        last = list(messages or [])[-1] if messages else ""
+        if isinstance(last, BaseModel):
+            return last.content or ""
+        if isinstance(last, dict):
+            return last.get("content") or ""
+        return str(last)
+
+    @staticmethod
+    def completion(content: str) -> ChatCompletion:
+        return ChatCompletion(
+            choices=[{"finish_reason": "stop", "index": 0, "message": {"role": "assistant", "content": content}, "logprobs": None}],
+            created=int(time.time()),
+            model="scripted",
+            usage={},
+        )
+
+    def plan(self) -> List[PlanStep]:
+        return [PlanStep(step=step, description=f"Scripted step {step}", status="not_started") for step in range(1, self.plan_steps + 1)]
+
+    @staticmethod
+    def plan_statuses(prompt: str) -> Dict[int, str]:
+        return {int(step): status for step, status in PLAN_STEP_PATTERN.findall(prompt)}
+
+    def next_steps(self, prompt: str, max_steps: int) -> List[NextStep]:
+        team = prompt.split("### Team of Agents", 1)[-1].split("###", 1)[0]
+        agents = AGENT_PATTERN.findall(team)
+        if not agents:
+            raise ValueError("The scripted chat client found no agents in the prompt")
+        open_steps = [step for step, status in sorted(self.plan_statuses(prompt).items()) if status != "completed"] or [1]
+        return [
+            NextStep(next_agent=agents[(step - 1) % len(agents)], instruction=f"Work on scripted step {step}.", step=step)
+            for step in open_steps[:min(max_steps, len(agents))]
+        ]
+
+    def progress_check(self, prompt: str) -> ProgressCheckOutput:
+        statuses = self.plan_statuses(prompt)
+        current = {int(sequential or parallel) for sequential, parallel in CURRENT_STEP_PATTERN.findall(prompt)}
+        done = {step for step, status in statuses.items() if status == "completed"} | current
+        return ProgressCheckOutput(
+            verdict="completed" if set(statuses) <= done else "continue",
+            plan_needs_update=False,
+            plan_status_update=[{"step": step, "status": "completed"} for step in sorted(current)],
+        )
@@ -0,0 +1,351 @@
+"""
+In-memory state stores and pub/sub standing in for the Dapr sidecar.
+
+The component names and types come from components/*.yaml so the services talk to the same
+`agentstatestore`, `workflowstatestore` and `messagepubsub` they use under Dapr. Messages are
+delivered the way Dapr delivers them: the sidecar reads each app's /dapr/subscribe, wraps the
+published data in a CloudEvent and POSTs it to the route matching the event type, with the
+publish metadata as headers. The apps are called in process through their ASGI app, so no
+ports are opened.
+
+LocalDaprClient and LocalAsyncDaprClient replace dapr.clients.DaprClient and
+dapr.aio.clients.DaprClient, see local_runtime.install.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+from dapr.clients.grpc._response import BulkStateItem, BulkStatesResponse, StateResponse
+
+logger = logging.getLogger(__name__)
+
+# only the event type rules dapr-agents writes are understood
+ROUTE_RULE_PATTERN = re.compile(r"""^\s*event\.type\s*==\s*['"]([^'"]+)['"]\s*$""")
+
+
+def load_components(components_dir: str) -> Dict[str, str]:
+    """Component name to type, e.g. {"messagepubsub": "pubsub.redis"}."""
+    components = {}
+    for path in sorted(glob.glob(os.path.join(components_dir, "*.yaml"))):
+        with open(path) as f:
+            content = f.read()
+        name = re.search(r"^metadata:\s*\n\s+name:\s*(\S+)", content, re.MULTILINE)
+        component_type = re.search(r"^spec:\s*\n\s+type:\s*(\S+)", content, re.MULTILINE)
+        if name and component_type:
+            components[name.group(1)] = component_type.group(1)
+    return components
+
+
+class InMemoryStateStore:
+    """A key value store with the ttlInSeconds expiry of the Dapr state API."""
+
+    def __init__(self, name: str):
+        self.name = name
+        # activities on several threads read and write state
+        self._lock = threading.Lock()
+        self._items: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self.reads = 0
+        self.writes = 0
+        self.deletes = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    def get(self, key: str) -> bytes:
+        with self._lock:
+            self.reads += 1
+            value, expires_at = self._items.get(key, (b"", None))
+            if expires_at is not None and time.monotonic() > expires_at:
+                del self._items[key]
+                value = b""
+            self.bytes_read += len(value)
+            return value
+
+    def set(self, key: str, value: Union[str, bytes], state_metadata: Optional[Dict[str, str]] = None) -> None:
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        ttl = (state_metadata or {}).get("ttlInSeconds")
+        expires_at = time.monotonic() + int(ttl) if ttl is not None and int(ttl) >= 0 else None
+        with self._lock:
+            self.writes += 1
+            self.bytes_written += len(value)
+            self._items[key] = (value, expires_at)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self.deletes += 1
+            self._items.pop(key, None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "keys": len(self._items),
+                "reads": self.reads,
+                "writes": self.writes,
+                "deletes": self.deletes,
+                "bytes_read": self.bytes_read,
+                "bytes_written": self.bytes_written,
+            }
+
+
+class LocalApp:
+    """A service the sidecar delivers messages to, called through its ASGI app."""
+
+    def __init__(self, app_id: str, asgi_app: Any, loop: asyncio.AbstractEventLoop):
+        self.app_id = app_id
+        self.loop = loop
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app), base_url=f"http://{app_id}", timeout=None)
+        self.subscriptions: List[dict] = []
+
+    async def load_subscriptions(self) -> None:
+        response = await self.client.get("/dapr/subscribe")
+        response.raise_for_status()
+        self.subscriptions = response.json()
+
+    def route(self, pubsub_name: str, topic: str, event_type: Optional[str]) -> Optional[str]:
+        for subscription in self.subscriptions:
+            if subscription.get("pubsubname") != pubsub_name or subscription.get("topic") != topic:
+                continue
+            routes = subscription.get("routes") or {}
+            for rule in routes.get("rules", []):
+                match = ROUTE_RULE_PATTERN.match(rule.get("match", ""))
+                if match and match.group(1) == event_type:
+                    return rule["path"]
+            return routes.get("default") or subscription.get("route")
+        return None
+
+
+class InMemoryPubSub:
+    """Delivers every message published on a topic to each app subscribed to it, like Redis streams with one consumer group per app."""
+
+    def __init__(self, name: str, sidecar: "LocalSidecar"):
+        self.name = name
+        self.sidecar = sidecar
+        self._lock = threading.Lock()
+        self.published: Dict[str, int] = defaultdict(int)
+        self.delivered: Dict[str, int] = defaultdict(int)
+        self.failed: Dict[str, int] = defaultdict(int)
+        self.bytes_published = 0
+
+    def publish(self, topic: str, data: Union[str, bytes], data_content_type: Optional[str], publish_metadata: Dict[str, str]) -> None:
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        with self._lock:
+            self.published[topic] += 1
+            self.bytes_published += len(data)
+
+        metadata = dict(publish_metadata or {})
+        event = {
+            "specversion": "1.0",
+            "id": metadata.pop("cloudevent.id", str(uuid.uuid4())),
+            "type": metadata.pop("cloudevent.type", "com.dapr.event.sent"),
+            "source": metadata.pop("cloudevent.source", "local"),
+            "datacontenttype": data_content_type or "text/plain",
+            "topic": topic,
+            "pubsubname": self.name,
+            "time": datetime.now(timezone.utc).isoformat(),
+            "traceid": "",
+            "traceparent": "",
+            "tracestate": "",
+        }
+        for key in list(metadata):
+            if key.startswith("cloudevent."):
+                event[key[len("cloudevent."):]] = metadata.pop(key)
+        event["data"] = json.loads(data) if event["datacontenttype"] == "application/json" else data
+        body = json.dumps(event)
+        # the remaining metadata reaches the app as headers, as it does through Dapr
+        headers = {**metadata, "content-type": "application/cloudevents+json"}
+
+        for app in self.sidecar.apps():
+            path = app.route(self.name, topic, event["type"])
+            if path is not None:
+                # publish returns once the message is accepted, delivery happens on the sidecar's loop
+                asyncio.run_coroutine_threadsafe(self.deliver(app, topic, path, body, headers), app.loop)
+
+    async def deliver(self, app: LocalApp, topic: str, path: str, body: str, headers: Dict[str, str]) -> None:
+        try:
+            response = await app.client.post(path, content=body, headers=headers)
+            ok = response.status_code < 300
+        except Exception as e:
+            logger.error(f"Delivering a message on '{topic}' to {app.app_id} failed: {e}")
+            ok = False
+        with self._lock:
+            if ok:
+                self.delivered[topic] += 1
+            else:
+                # Dapr would redeliver, the stand-in only counts it
+                self.failed[topic] += 1
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "published": sum(self.published.values()),
+                "delivered": sum(self.delivered.values()),
+                "failed": sum(self.failed.values()),
+                "bytes_published": self.bytes_published,
+                "topics": {
+                    topic: {"published": count, "delivered": self.delivered.get(topic, 0), "failed": self.failed.get(topic, 0)}
+                    for topic, count in sorted(self.published.items())
+                },
+            }
+
+
+class LocalSidecar:
+    """One stand-in sidecar shared by every service running in the process."""
+
+    def __init__(self, components_dir: str):
+        from .workflows import LocalWorkflowEngine
+
+        self.components = load_components(components_dir)
+        self.state_stores: Dict[str, InMemoryStateStore] = {}
+        self.pubsubs: Dict[str, InMemoryPubSub] = {}
+        for name, component_type in self.components.items():
+            if component_type.startswith("state."):
+                self.state_stores[name] = InMemoryStateStore(name)
+            elif component_type.startswith("pubsub."):
+                self.pubsubs[name] = InMemoryPubSub(name, self)
+        self.workflows = LocalWorkflowEngine()
+        self._apps: Dict[str, LocalApp] = {}
+        self._apps_lock = threading.Lock()
+        self.stopped = asyncio.Event()
+
+    def state_store(self, store_name: str) -> InMemoryStateStore:
+        if store_name not in self.state_stores:
+            raise ValueError(f"state store {store_name} is not found")
+        return self.state_stores[store_name]
+
+    def pubsub(self, pubsub_name: str) -> InMemoryPubSub:
+        if pubsub_name not in self.pubsubs:
+            raise ValueError(f"pubsub {pubsub_name} not found")
+        return self.pubsubs[pubsub_name]
+
+    def apps(self) -> List[LocalApp]:
+        with self._apps_lock:
+            return list(self._apps.values())
+
+    def get_app(self, app_id: str) -> LocalApp:
+        with self._apps_lock:
+            return self._apps[app_id]
+
+    async def serve(self, app_id: str, asgi_app: Any) -> None:
+        """Runs an app until the sidecar stops, the stand-in for starting its HTTP server."""
+        app = LocalApp(app_id, asgi_app, asyncio.get_running_loop())
+        # the lifespan isn't run, the services only use it to stop the server
+        await app.load_subscriptions()
+        with self._apps_lock:
+            self._apps[app_id] = app
+        logger.info(f"{app_id} subscribed to {[subscription['topic'] for subscription in app.subscriptions]}")
+        try:
+            await self.stopped.wait()
+        finally:
+            await app.client.aclose()
+
+    async def wait_for_apps(self, count: int, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while len(self.apps()) < count:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Only {len(self.apps())} of {count} apps started")
+            await asyncio.sleep(0.05)
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.workflows.shutdown()
+
+    def get_stats(self) -> dict:
+        return {
+            "state": {name: store.get_stats() for name, store in self.state_stores.items()},
+            "pubsub": {name: pubsub.get_stats() for name, pubsub in self.pubsubs.items()},
+            "workflows": self.workflows.get_stats(),
+        }
+
+
+_sidecar: Optional[LocalSidecar] = None
+
+
+def get_sidecar() -> LocalSidecar:
+    if _sidecar is None:
+        raise RuntimeError("The local runtime isn't installed, call local_runtime.install() first")
+    return _sidecar
+
+
+def set_sidecar(sidecar: LocalSidecar) -> None:
+    global _sidecar
+    _sidecar = sidecar
+
+
+class LocalDaprClient:
+    """The state and pub/sub calls of dapr.clients.DaprClient the services make."""
+
+    def __init__(self, address: Optional[str] = None, *args, **kwargs):
+        self._sidecar = get_sidecar()
+
+    def __enter__(self) -> "LocalDaprClient":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def get_state(self, store_name: str, key: str, state_metadata: Optional[Dict[str, str]] = None, metadata=None) -> StateResponse:
+        return StateResponse(data=self._sidecar.state_store(store_name).get(key), etag="")
+
+    def get_bulk_state(self, store_name: str, keys: Sequence[str], parallelism: int = 1, states_metadata: Optional[Dict[str, str]] = None, metadata=None) -> BulkStatesResponse:
+        store = self._sidecar.state_store(store_name)
+        return BulkStatesResponse(items=[BulkStateItem(key=key, data=store.get(key), etag="") for key in keys])
+
+    def save_state(self, store_name: str, key: str, value: Union[bytes, str], etag: Optional[str] = None, options=None, state_metadata: Optional[Dict[str, str]] = None, metadata=None) -> None:
+        self._sidecar.state_store(store_name).set(key, value, state_metadata)
+
+    def save_bulk_state(self, store_name: str, states: Sequence[Any], metadata=None) -> None:
+        store = self._sidecar.state_store(store_name)
+        for state in states:
+            store.set(state.key, state.value, state.metadata)
+
+    def delete_state(self, store_name: str, key: str, etag: Optional[str] = None, options=None, state_metadata: Optional[Dict[str, str]] = None, metadata=None) -> None:
+        self._sidecar.state_store(store_name).delete(key)
+
+    def publish_event(self, pubsub_name: str, topic_name: str, data: Union[bytes, str], publish_metadata: Optional[Dict[str, str]] = None, metadata=None, data_content_type: Optional[str] = None) -> None:
+        self._sidecar.pubsub(pubsub_name).publish(topic_name, data, data_content_type, publish_metadata or {})
+
+
+class LocalAsyncDaprClient(LocalDaprClient):
+    """The async counterpart, dapr.aio.clients.DaprClient."""
+
+    async def __aenter__(self) -> "LocalAsyncDaprClient":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def get_state(self, *args, **kwargs) -> StateResponse:
+        return super().get_state(*args, **kwargs)
+
+    async def get_bulk_state(self, *args, **kwargs) -> BulkStatesResponse:
+        return super().get_bulk_state(*args, **kwargs)
+
+    async def save_state(self, *args, **kwargs) -> None:
+        super().save_state(*args, **kwargs)
+
+    async def save_bulk_state(self, *args, **kwargs) -> None:
+        super().save_bulk_state(*args, **kwargs)
+
+    async def delete_state(self, *args, **kwargs) -> None:
+        super().delete_state(*args, **kwargs)
+
+    async def publish_event(self, *args, **kwargs) -> None:
+        super().publish_event(*args, **kwargs)
@@ -0,0 +1,445 @@
+"""
+In-memory workflow engine standing in for the Dapr workflow runtime.
+
+Workflows and activities are registered through the real dapr.ext.workflow WorkflowRuntime
+(LocalWorkflowRuntime only swaps its gRPC worker for a local registry), so the functions the
+services register run unchanged. Each instance is driven on the sidecar's event loop: the
+orchestrator generator is advanced whenever the task it yielded completes, activities run on a
+thread pool per service sized like the Dapr worker's (LOCAL_WORKFLOW_ACTIVITY_WORKERS), and
+timers and external events complete their tasks from the loop. Inputs and outputs go through the same JSON serialization as durabletask.
+
+There is no history and no replay, an instance runs its generator once from start to end. That
+is enough to measure the messaging and state overhead of the services but a workflow that
+isn't deterministic behaves here as it wouldn't under Dapr.
+
+LocalOrchestrationContext implements the OrchestrationContext of durabletask-dapr 0.17.x, which
+requirements.txt pins, a release that adds abstract members to it needs them added here.
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import traceback
+import uuid
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from types import GeneratorType
+from typing import Any, Callable, Deque, Dict, Optional, Union
+
+import durabletask.internal.orchestrator_service_pb2 as pb
+import durabletask.internal.shared as shared
+from dapr.ext.workflow import DaprWorkflowClient, WorkflowRuntime, WorkflowState
+from dapr.ext.workflow.logger import Logger
+from durabletask import task, worker
+from durabletask.client import OrchestrationState, OrchestrationStatus
+from google.protobuf import wrappers_pb2
+
+logger = logging.getLogger(__name__)
+
+
+# durabletask-dapr 0.17.1 to 0.17.4 pass the activity its task execution id, 0.17.0 doesn't
+ACTIVITY_EXECUTION_IDS = "task_execution_id" in inspect.signature(task.ActivityContext.__init__).parameters
+
+
+class WorkflowTerminated(Exception):
+    pass
+
+
+def round_trip(value: Any) -> Any:
+    """What the other side gets after durabletask serialized the value."""
+    return None if value is None else shared.from_json(shared.to_json(value))
+
+
+def failure(e: Exception) -> pb.TaskFailureDetails:
+    return pb.TaskFailureDetails(
+        errorType=type(e).__name__,
+        errorMessage=str(e),
+        stackTrace=wrappers_pb2.StringValue(value="".join(traceback.format_exception(e))),
+    )
+
+
+def run_on_thread(activity: Callable, context: task.ActivityContext, input: Any) -> Any:
+    """Runs an activity on an executor thread and closes the event loop dapr-agents left set on it."""
+    try:
+        return activity(context, input)
+    finally:
+        try:
+            loop = asyncio.get_event_loop_policy().get_event_loop()
+        except RuntimeError:
+            loop = None
+        if loop is not None and not loop.is_running():
+            loop.close()
+            asyncio.set_event_loop(None)
+
+
+class LocalWorker:
+    """Holds the registry the Dapr WorkflowRuntime registers into, instead of connecting to the sidecar."""
+
+    def __init__(self):
+        self._registry = worker._Registry()
+
+    def start(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class LocalWorkflowRuntime(WorkflowRuntime):
+    def __init__(self, host: Optional[str] = None, port: Optional[str] = None, logger_options=None, **kwargs):
+        self._logger = Logger("WorkflowRuntime", logger_options)
+        self._WorkflowRuntime__worker = LocalWorker()
+
+    @property
+    def registry(self) -> worker._Registry:
+        return self._WorkflowRuntime__worker._registry
+
+    def register_workflow(self, fn: Callable, *, name: Optional[str] = None):
+        super().register_workflow(fn, name=name)
+        from .sidecar import get_sidecar
+
+        get_sidecar().workflows.add_workflow(fn, self.registry)
+
+
+class WorkflowInstance:
+    def __init__(self, instance_id: str, name: str, registry: worker._Registry, serialized_input: Optional[str]):
+        self.instance_id = instance_id
+        self.name = name
+        self.registry = registry
+        self.serialized_input = serialized_input
+        self.serialized_output: Optional[str] = None
+        self.serialized_custom_status: Optional[str] = None
+        self.failure_details: Optional[task.FailureDetails] = None
+        self.status = OrchestrationStatus.PENDING
+        self.created_at = datetime.now(timezone.utc)
+        self.last_updated_at = self.created_at
+        # done is waited on from the services' threads, finished from the benchmark's coroutines
+        self.done = threading.Event()
+        self.finished = asyncio.Event()
+        self.terminate_output: Any = None
+        self.terminated = False
+        # set whenever a task the orchestrator may be waiting on completes
+        self.wakeup = asyncio.Event()
+        self.events: Dict[str, Deque[Any]] = defaultdict(deque)
+        self.waiters: Dict[str, Deque[task.CompletableTask]] = defaultdict(deque)
+        self.timers = []
+        self.next_task_id = 0
+
+    def to_state(self) -> WorkflowState:
+        return WorkflowState(
+            OrchestrationState(
+                instance_id=self.instance_id,
+                name=self.name,
+                runtime_status=self.status,
+                created_at=self.created_at,
+                last_updated_at=self.last_updated_at,
+                serialized_input=self.serialized_input,
+                serialized_output=self.serialized_output,
+                serialized_custom_status=self.serialized_custom_status,
+                failure_details=self.failure_details,
+            )
+        )
+
+
+def activity_context(instance_id: str, task_id: int) -> task.ActivityContext:
+    if ACTIVITY_EXECUTION_IDS:
+        # a new execution id per scheduled activity, as the workflow assigns them
+        return task.ActivityContext(instance_id, task_id, uuid.uuid4().hex)
+    return task.ActivityContext(instance_id, task_id)
+
+
+class LocalOrchestrationContext(task.OrchestrationContext):
+    def __init__(self, engine: "LocalWorkflowEngine", instance: WorkflowInstance):
+        self._engine = engine
+        self._instance = instance
+        self.new_input: Any = None
+        self.continued_as_new = False
+
+    @property
+    def instance_id(self) -> str:
+        return self._instance.instance_id
+
+    @property
+    def current_utc_datetime(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    @property
+    def is_replaying(self) -> bool:
+        return False
+
+    def set_custom_status(self, custom_status: Any) -> None:
+        self._instance.serialized_custom_status = shared.to_json(custom_status) if custom_status is not None else None
+
+    def create_timer(self, fire_at: Union[datetime, timedelta]) -> task.Task:
+        timer = task.TimerTask()
+        if isinstance(fire_at, datetime):
+            delay = (fire_at - self.current_utc_datetime).total_seconds()
+        else:
+            delay = fire_at.total_seconds()
+        self._instance.timers.append(self._engine.loop.call_later(max(delay, 0), self._engine.complete_task, self._instance, timer, None))
+        return timer
+
+    def call_activity(self, activity: Union[Callable, str], *, input: Any = None, retry_policy: Optional[task.RetryPolicy] = None, **kwargs) -> task.Task:
+        name = activity if isinstance(activity, str) else task.get_name(activity)
+        activity_task = task.CompletableTask()
+        self._instance.next_task_id += 1
+        self._engine.loop.create_task(self._engine.run_activity(self._instance, name, round_trip(input), activity_task, self._instance.next_task_id))
+        return activity_task
+
+    def call_sub_orchestrator(self, orchestrator: Union[Callable, str], *, input: Any = None, instance_id: Optional[str] = None, retry_policy=None, **kwargs) -> task.Task:
+        name = orchestrator if isinstance(orchestrator, str) else task.get_name(orchestrator)
+        child_task = task.CompletableTask()
+        child = self._engine.start(name, self._instance.registry, input, instance_id)
+        self._engine.loop.create_task(self._engine.complete_with_child(self._instance, child, child_task))
+        return child_task
+
+    def wait_for_external_event(self, name: str) -> task.Task:
+        event_task = task.CompletableTask()
+        name = name.lower()
+        if self._instance.events[name]:
+            event_task.complete(self._instance.events[name].popleft())
+        else:
+            self._instance.waiters[name].append(event_task)
+        return event_task
+
+    def continue_as_new(self, new_input: Any, *, save_events: bool = False) -> None:
+        self.continued_as_new = True
+        self.new_input = new_input
+        if not save_events:
+            self._instance.events.clear()
+
+    def is_patched(self, patch_name: str) -> bool:
+        return True
+
+
+class LocalWorkflowEngine:
+    """Runs the workflow instances of every service in the process on one event loop."""
+
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._workflows: Dict[Callable, worker._Registry] = {}
+        self._instances: Dict[str, WorkflowInstance] = {}
+        self._lock = threading.Lock()
+        # one pool per service, as each service's Dapr worker runs its activities on its own threads
+        self._executors: Dict[worker._Registry, ThreadPoolExecutor] = {}
+        # durabletask's default worker pool size
+        self.activity_workers = int(os.getenv("LOCAL_WORKFLOW_ACTIVITY_WORKERS", str((os.cpu_count() or 1) + 4)))
+        self.activities_run = 0
+        self.events_raised = 0
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+
+    def add_workflow(self, fn: Callable, registry: worker._Registry) -> None:
+        self._workflows[fn] = registry
+
+    def resolve(self, workflow: Callable) -> tuple:
+        # the services schedule the function the runtime's decorator returned, it wraps the registered one
+        for fn in (workflow, getattr(workflow, "__wrapped__", None)):
+            if fn in self._workflows:
+                return fn.__dict__["_dapr_alternate_name"], self._workflows[fn]
+        raise ValueError(f"Workflow {getattr(workflow, '__name__', workflow)} isn't registered")
+
+    def get(self, instance_id: str) -> Optional[WorkflowInstance]:
+        with self._lock:
+            return self._instances.get(instance_id)
+
+    def executor(self, registry: worker._Registry) -> ThreadPoolExecutor:
+        with self._lock:
+            if registry not in self._executors:
+                self._executors[registry] = ThreadPoolExecutor(max_workers=self.activity_workers, thread_name_prefix="activity")
+            return self._executors[registry]
+
+    def start(self, name: str, registry: worker._Registry, input: Any = None, instance_id: Optional[str] = None) -> WorkflowInstance:
+        instance_id = instance_id or uuid.uuid4().hex
+        serialized_input = shared.to_json(input) if input is not None else None
+        with self._lock:
+            existing = self._instances.get(instance_id)
+            if existing is not None and not existing.done.is_set():
+                raise RuntimeError(f"an active workflow with ID '{instance_id}' already exists")
+            instance = WorkflowInstance(instance_id, name, registry, serialized_input)
+            self._instances[instance_id] = instance
+        self.loop.call_soon_threadsafe(lambda: self.loop.create_task(self.run(instance)))
+        return instance
+
+    async def run(self, instance: WorkflowInstance) -> None:
+        instance.status = OrchestrationStatus.RUNNING
+        try:
+            while True:
+                context = LocalOrchestrationContext(self, instance)
+                orchestrator = instance.registry.orchestrators.get(instance.name)
+                if orchestrator is None:
+                    raise ValueError(f"No orchestrator named '{instance.name}' was registered")
+                input = shared.from_json(instance.serialized_input) if instance.serialized_input is not None else None
+                result = orchestrator(context, input)
+                if isinstance(result, GeneratorType):
+                    result = await self.drive(instance, result)
+                if not context.continued_as_new:
+                    break
+                instance.serialized_input = shared.to_json(context.new_input) if context.new_input is not None else None
+            instance.serialized_output = shared.to_json(result) if result is not None else None
+            instance.status = OrchestrationStatus.COMPLETED
+        except WorkflowTerminated:
+            instance.serialized_output = shared.to_json(instance.terminate_output) if instance.terminate_output is not None else None
+            instance.status = OrchestrationStatus.TERMINATED
+        except Exception as e:
+            logger.error(f"Workflow {instance.name} ({instance.instance_id}) failed: {e}")
+            details = failure(e)
+            instance.failure_details = task.FailureDetails(details.errorMessage, details.errorType, details.stackTrace.value)
+            instance.status = OrchestrationStatus.FAILED
+        finally:
+            for timer in instance.timers:
+                timer.cancel()
+            instance.last_updated_at = datetime.now(timezone.utc)
+            instance.done.set()
+            instance.finished.set()
+
+    async def drive(self, instance: WorkflowInstance, generator) -> Any:
+        value, error = None, None
+        while True:
+            try:
+                pending = generator.throw(error) if error is not None else generator.send(value)
+            except StopIteration as stop:
+                return stop.value
+            while not pending.is_complete:
+                instance.wakeup.clear()
+                if instance.terminated:
+                    generator.close()
+                    raise WorkflowTerminated()
+                await instance.wakeup.wait()
+            if pending.is_failed:
+                value, error = None, pending.get_exception()
+            else:
+                value, error = pending.get_result(), None
+
+    async def run_activity(self, instance: WorkflowInstance, name: str, input: Any, activity_task: task.CompletableTask, task_id: int) -> None:
+        activity = instance.registry.get_activity(name)
+        context = activity_context(instance.instance_id, task_id)
+        try:
+            if activity is None:
+                raise ValueError(f"No activity named '{name}' was registered")
+            result = await self.loop.run_in_executor(self.executor(instance.registry), run_on_thread, activity, context, input)
+            self.complete_task(instance, activity_task, round_trip(result))
+        except Exception as e:
+            logger.error(f"Activity {name} of {instance.instance_id} failed: {e}")
+            self.fail_task(instance, activity_task, f"Activity task #{task_id} failed: {e}", failure(e))
+        finally:
+            with self._lock:
+                self.activities_run += 1
+
+    async def complete_with_child(self, instance: WorkflowInstance, child: WorkflowInstance, child_task: task.CompletableTask) -> None:
+        await child.finished.wait()
+        if child.status == OrchestrationStatus.COMPLETED:
+            self.complete_task(instance, child_task, shared.from_json(child.serialized_output) if child.serialized_output else None)
+        else:
+            self.fail_task(instance, child_task, f"Sub-orchestration {child.instance_id} {child.status.name.lower()}", pb.TaskFailureDetails(errorType="SubOrchestrationFailed", errorMessage=child.status.name))
+
+    def complete_task(self, instance: WorkflowInstance, pending: task.CompletableTask, result: Any) -> None:
+        if not pending.is_complete:
+            pending.complete(result)
+        instance.wakeup.set()
+
+    def fail_task(self, instance: WorkflowInstance, pending: task.CompletableTask, message: str, details: pb.TaskFailureDetails) -> None:
+        if not pending.is_complete:
+            pending.fail(message, details)
+        instance.wakeup.set()
+
+    async def wait_for_completion(self, instance_id: str) -> WorkflowInstance:
+        instance = self.get(instance_id)
+        if instance is None:
+            raise ValueError(f"Workflow {instance_id} not found")
+        await instance.finished.wait()
+        return instance
+
+    def raise_event(self, instance_id: str, event_name: str, data: Any) -> None:
+        def deliver():
+            instance = self.get(instance_id)
+            if instance is None or instance.done.is_set():
+                # Dapr discards events for finished or unknown instances
+                logger.warning(f"Discarded event '{event_name}' for workflow {instance_id}, it isn't running")
+                return
+            name = event_name.lower()
+            if instance.waiters[name]:
+                self.complete_task(instance, instance.waiters[name].popleft(), round_trip(data))
+            else:
+                instance.events[name].append(round_trip(data))
+
+        with self._lock:
+            self.events_raised += 1
+        self.loop.call_soon_threadsafe(deliver)
+
+    def terminate(self, instance_id: str, output: Any = None) -> None:
+        def terminate():
+            instance = self.get(instance_id)
+            if instance is not None and not instance.done.is_set():
+                instance.terminate_output = output
+                instance.terminated = True
+                instance.wakeup.set()
+
+        self.loop.call_soon_threadsafe(terminate)
+
+    def purge(self, instance_id: str) -> None:
+        with self._lock:
+            instance = self._instances.get(instance_id)
+            if instance is not None and instance.done.is_set():
+                del self._instances[instance_id]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executors = list(self._executors.values())
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            statuses: Dict[str, int] = defaultdict(int)
+            for instance in self._instances.values():
+                statuses[instance.status.name] += 1
+            return {"instances": dict(statuses), "activities": self.activities_run, "events_raised": self.events_raised}
+
+
+class LocalWorkflowClient(DaprWorkflowClient):
+    """The DaprWorkflowClient calls the services make, answered by the local engine."""
+
+    def __init__(self, host: Optional[str] = None, port: Optional[str] = None, logger_options=None, **kwargs):
+        from .sidecar import get_sidecar
+
+        self._logger = Logger("DaprWorkflowClient", logger_options)
+        self._engine = get_sidecar().workflows
+
+    def schedule_new_workflow(self, workflow: Callable, *, input: Any = None, instance_id: Optional[str] = None, start_at: Optional[datetime] = None, reuse_id_policy=None) -> str:
+        name, registry = self._engine.resolve(workflow)
+        return self._engine.start(name, registry, input, instance_id).instance_id
+
+    def get_workflow_state(self, instance_id: str, *, fetch_payloads: bool = True) -> Optional[WorkflowState]:
+        instance = self._engine.get(instance_id)
+        return instance.to_state() if instance else None
+
+    def wait_for_workflow_start(self, instance_id: str, *, fetch_payloads: bool = False, timeout_in_seconds: int = 0) -> Optional[WorkflowState]:
+        return self.get_workflow_state(instance_id)
+
+    def wait_for_workflow_completion(self, instance_id: str, *, fetch_payloads: bool = True, timeout_in_seconds: int = 0) -> Optional[WorkflowState]:
+        instance = self._engine.get(instance_id)
+        if instance is None:
+            return None
+        if not instance.done.wait(timeout_in_seconds or None):
+            raise TimeoutError(f"Workflow {instance_id} didn't complete within {timeout_in_seconds}s")
+        return instance.to_state()
+
+    def raise_workflow_event(self, instance_id: str, event_name: str, *, data: Any = None) -> None:
+        self._engine.raise_event(instance_id, event_name, data)
+
+    def terminate_workflow(self, instance_id: str, *, output: Any = None, recursive: bool = True) -> None:
+        self._engine.terminate(instance_id, output)
+
+    def pause_workflow(self, instance_id: str) -> None:
+        raise NotImplementedError("The local workflow engine can't suspend workflows")
+
+    def resume_workflow(self, instance_id: str) -> None:
+        raise NotImplementedError("The local workflow engine can't suspend workflows")
+
+    def purge_workflow(self, instance_id: str, recursive: bool = True) -> None:
+        self._engine.purge(instance_id)
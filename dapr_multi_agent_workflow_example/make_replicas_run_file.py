@@ -0,0 +1,60 @@
+"""
+Writes a Multi-App Run template that runs each agent service as several replicas.
+
+    python3 make_replicas_run_file.py 3
+    dapr run -f dapr-llm-replicas.yaml
+
+Every app of dapr-llm.yaml is kept, and CatalogApp, StockApp and StoresApp are replaced by N
+replicas each: `<appID>-<index>` on the app port plus 100 * index, with AGENT_REPLICAS and
+AGENT_REPLICA_INDEX telling the service which partition of its topic it handles, see
+services/common/partitioning.py. A fixed Dapr HTTP port is only kept for the first replica.
+"""
+
+import argparse
+import copy
+import os
+
+import yaml
+
+EXAMPLE_DIR = os.path.dirname(os.path.abspath(__file__))
+AGENT_APPS = ["CatalogApp", "StockApp", "StoresApp"]
+REPLICA_PORT_STEP = 100
+
+
+def replicate(app: dict, replicas: int) -> list:
+    copies = []
+    for index in range(replicas):
+        # separate copies, yaml would write shared lists as anchors
+        replica = copy.deepcopy(app)
+        replica.update(appID=f"{app['appID']}-{index}", appPort=app["appPort"] + REPLICA_PORT_STEP * index)
+        replica["env"] = {**replica.get("env", {}), "AGENT_REPLICAS": str(replicas), "AGENT_REPLICA_INDEX": str(index)}
+        if index > 0:
+            replica.pop("daprHTTPPort", None)
+        copies.append(replica)
+    return copies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a Multi-App Run template with N replicas of each agent service.")
+    parser.add_argument("replicas", type=int, help="replicas of each agent service")
+    parser.add_argument("--source", default=os.path.join(EXAMPLE_DIR, "dapr-llm.yaml"), help="template to start from")
+    parser.add_argument("--output", default=os.path.join(EXAMPLE_DIR, "dapr-llm-replicas.yaml"), help="template to write")
+    args = parser.parse_args()
+    if args.replicas < 1:
+        parser.error("replicas must be at least 1")
+
+    with open(args.source) as f:
+        template = yaml.safe_load(f)
+    apps = []
+    for app in template["apps"]:
+        apps.extend(replicate(app, args.replicas) if app["appID"] in AGENT_APPS else [app])
+    template["apps"] = apps
+
+    with open(args.output, "w") as f:
+        f.write(f"# generated by make_replicas_run_file.py from {os.path.basename(args.source)}, {args.replicas} replica(s) of each agent\n")
+        yaml.safe_dump(template, f, sort_keys=False)
+    print(f"Wrote {args.output}: {', '.join(app['appID'] for app in apps)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+A stand-in for an Azure OpenAI deployment that enforces requests and tokens per minute.
+
+Answers chat completions with a canned reply after `--latency` seconds, and counts every call
+against the deployment's limits the way Azure does, the prompt's characters / 4 plus its
+`max_tokens`, over 10 second windows of a sixth of the per-minute limits. A call over either
+limit gets a 429 with `retry-after-ms` and `retry-after` until the window ends, a successful one
+the `x-ratelimit-remaining-requests` and `x-ratelimit-remaining-tokens` headers:
+
+    python3 mock_azure_openai.py --rpm 60 --tpm 20000 --port 5099
+
+Point AZURE_OPENAI_ENDPOINT at http://localhost:5099 to run an example against it, or see
+benchmark_llm_rate_limit.py. `GET /stats` returns the calls answered and throttled.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import threading
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+WINDOW_SECONDS = 10
+
+
+class WindowLimits:
+    """Requests and tokens left in the current window, per deployment."""
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests_per_window = max(1, rpm * WINDOW_SECONDS // 60)
+        self.tokens_per_window = max(1, tpm * WINDOW_SECONDS // 60)
+        self.windows = {}
+        self.stats = {"answered": 0, "throttled": 0}
+        self._lock = threading.Lock()
+
+    def admit(self, deployment: str, tokens: int):
+        """None if the call fits the window, else the seconds until the next one."""
+        with self._lock:
+            now = time.monotonic()
+            window = now // WINDOW_SECONDS
+            current, requests, used = self.windows.get(deployment, (window, 0, 0))
+            if current != window:
+                requests, used = 0, 0
+            if requests + 1 > self.requests_per_window or used + tokens > self.tokens_per_window:
+                self.windows[deployment] = (window, requests, used)
+                self.stats["throttled"] += 1
+                return (window + 1) * WINDOW_SECONDS - now
+            self.windows[deployment] = (window, requests + 1, used + tokens)
+            self.stats["answered"] += 1
+            return None
+
+    def remaining(self, deployment: str) -> tuple:
+        with self._lock:
+            _, requests, used = self.windows.get(deployment, (0, 0, 0))
+            return self.requests_per_window - requests, self.tokens_per_window - used
+
+
+def create_app(rpm: int, tpm: int, latency: float) -> FastAPI:
+    app = FastAPI()
+    limits = WindowLimits(rpm, tpm)
+    app.state.limits = limits
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def chat_completions(deployment: str, request: Request) -> JSONResponse:
+        payload = await request.json()
+        prompt = sum(len(json.dumps(message.get("content") or "")) + 16 for message in payload.get("messages", []))
+        tokens = prompt // 4 + (payload.get("max_tokens") or 1000)
+        wait = limits.admit(deployment, tokens)
+        if wait is not None:
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"code": "429", "message": "Requests to the deployment have exceeded the rate limit."}},
+                headers={"retry-after-ms": str(int(wait * 1000)), "retry-after": str(math.ceil(wait))},
+            )
+        await asyncio.sleep(latency)
+        remaining_requests, remaining_tokens = limits.remaining(deployment)
+        return JSONResponse(
+            content={
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": payload.get("model") or deployment,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "Mock answer."}}],
+                "usage": {"prompt_tokens": prompt // 4, "completion_tokens": 3, "total_tokens": prompt // 4 + 3},
+            },
+            headers={"x-ratelimit-remaining-requests": str(remaining_requests), "x-ratelimit-remaining-tokens": str(remaining_tokens)},
+        )
+
+    @app.get("/stats")
+    async def get_stats() -> dict:
+        return dict(limits.stats)
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve a mock Azure OpenAI deployment with rate limits.")
+    parser.add_argument("--rpm", type=int, default=60, help="requests per minute of every deployment")
+    parser.add_argument("--tpm", type=int, default=20000, help="tokens per minute of every deployment")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds every answered call takes")
+    parser.add_argument("--port", type=int, default=5099)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.rpm, args.tpm, args.latency), host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
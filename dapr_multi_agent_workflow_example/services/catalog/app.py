@@ -4,62 +4,95 @@ from dotenv import load_dotenv
 import asyncio
 import logging
 import os
-import requests
+import sys
+import httpx
 from pydantic import BaseModel, Field
 
+# shared modules for the agent services live in services/common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.http_client import get_http_client, run_tool
+from common.tool_cache import get_tool_cache
+from common.activity_memo import MemoizedActivitiesMixin
+from common.backpressure import BoundedWorkQueueMixin
+from common.partitioning import PartitionedConsumerMixin
+from common.registry_cache import CachedAgentRegistryMixin
+from common.sharded_state import ShardedWorkflowStateMixin
+from common.llm_rate_limit import limit_llm_rate
+from common.model_routing import ModelRoutingMixin
+
 BASE_URL = "http://localhost"
 
+# catalog lookups are shared by every agent through the tool cache, see services/common/tool_cache.py
+tool_cache = get_tool_cache()
+CATALOG_CACHE_TTL = int(os.getenv("TOOL_CACHE_TTL_CATALOG", "3600"))
+
 
 # Catalog API Calls
-@tool()
-def call_get_catalog() -> str:
-    """Get the full product catalog information."""
+async def get_catalog() -> str:
     try:
-        response = requests.get(f"{BASE_URL}:5001/catalog/all")
+        response = await get_http_client().get(f"{BASE_URL}:5001/catalog/all")
         response.raise_for_status()
         return f"Full Catalog: {response.json()}"
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         return f"Error getting catalog: {e.response.text}"
 
+@tool()
+@tool_cache.cached(ttl=CATALOG_CACHE_TTL)
+def call_get_catalog() -> str:
+    """Get the full product catalog information."""
+    return run_tool(get_catalog())
+
 
 class ItemCodeSchema(BaseModel):
     item_code: str = Field(description="Code of the item to get description for")
 
-@tool(args_model=ItemCodeSchema)
-def call_get_item_description(item_code: str) -> str:
-    """Get detailed description of a specific item by its code."""
+async def get_item_description(item_code: str) -> str:
     try:
-        response = requests.get(f"{BASE_URL}:5001/catalog/item/{item_code}")
+        response = await get_http_client().get(f"{BASE_URL}:5001/catalog/item/{item_code}")
         response.raise_for_status()
         return f"Item {item_code}: {response.json()}"
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         return f"Error getting item description: {e.response.text}"
 
+@tool(args_model=ItemCodeSchema)
+@tool_cache.cached(ttl=CATALOG_CACHE_TTL)
+def call_get_item_description(item_code: str) -> str:
+    """Get detailed description of a specific item by its code."""
+    return run_tool(get_item_description(item_code))
+
 
 class QuerySchema(BaseModel):
     query: str = Field(description="Search query to find items in catalog")
 
-@tool(args_model=QuerySchema)
-def call_find_item(query: str) -> str:
-    """Find items in the catalog matching a search query."""
+async def find_item(query: str) -> str:
     try:
-        response = requests.get(f"{BASE_URL}:5001/catalog/search/{query}")
+        response = await get_http_client().get(f"{BASE_URL}:5001/catalog/search/{query}")
         response.raise_for_status()
         return f"Search Results for '{query}': {response.json()}"
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         return f"Error finding item: {e.response.text}"
 
+@tool(args_model=QuerySchema)
+@tool_cache.cached(ttl=CATALOG_CACHE_TTL)
+def call_find_item(query: str) -> str:
+    """Find items in the catalog matching a search query."""
+    return run_tool(find_item(query))
+
+
+class CatalogService(PartitionedConsumerMixin, BoundedWorkQueueMixin, MemoizedActivitiesMixin, ModelRoutingMixin, CachedAgentRegistryMixin, ShardedWorkflowStateMixin, AssistantAgent):
+    """AssistantAgent with a cached agents registry, its workflow state saved per instance, its LLM and tool calls recorded per activity and routed by role, its topic partitioned over the replicas and its triggers queued behind a concurrency limit, see services/common"""
+
 
 async def main():
     try:
-        llm = OpenAIChatClient(
+        llm = limit_llm_rate(OpenAIChatClient(
             api_key=os.getenv("AZURE_OPENAI_API_KEY"),
             azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
             azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
             api_version=os.getenv("AZURE_OPENAI_API_VERSION")
-        )
+        ))
         
-        catalog_service = AssistantAgent(
+        catalog_service = CatalogService(
             name="CatalogAgent",
             role="CatalogManager",
             goal="Provide product catalog information including item descriptions and item codes.",
@@ -80,7 +113,8 @@ async def main():
             state_key="workflow_state",
             agents_registry_store_name="agentstatestore",
             agents_registry_key="agents_registry",
-            service_port=8001,
+            # replicas each get their own port, see make_replicas_run_file.py
+            service_port=int(os.getenv("APP_PORT", "8001")),
         )
 
         await catalog_service.start()
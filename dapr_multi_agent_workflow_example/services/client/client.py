@@ -1,32 +1,170 @@
-import requests
-import time
+"""
+Workflow client and load generator.
+
+Starts workflows through the orchestrator's /RunWorkflow endpoint and follows every instance to
+completion by polling the Dapr workflow API on the orchestrator's sidecar. With the defaults it
+runs the single example task, as before; with `--workflows` and `--rate` it becomes a load test:
+
+    python3 client.py --workflows 50 --rate 2 --concurrency 20
+
+Workflows are started on a fixed schedule (`--rate` per second) so a slow system doesn't slow
+the arrivals down, and `--concurrency` caps how many are in flight. A workflow's latency counts
+from its scheduled start, so the time it waits for one of those slots is part of it. At the end
+it reports the throughput, the end-to-end latency percentiles and how many failed to start,
+failed, were terminated or timed out.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
 import sys
+import time
+from dataclasses import dataclass
+from typing import List, Optional
 
-if __name__ == "__main__":
-    workflow_url = "http://localhost:8004/RunWorkflow"
-    task_payload = {"task": "Find information about the Ryobi One Plus 18V Drill and check which stores have it in stock."}
+import httpx
 
-    attempt = 1
+WORKFLOW_URL = os.getenv("WORKFLOW_URL", "http://localhost:8004/RunWorkflow")
+# the WorkflowApp sidecar's HTTP port is fixed in dapr-llm.yaml
+WORKFLOW_STATUS_URL = os.getenv("WORKFLOW_STATUS_URL", "http://localhost:3504/v1.0/workflows/dapr")
+DEFAULT_TASK = "Find information about the Ryobi One Plus 18V Drill and check which stores have it in stock."
 
-    while attempt <= 2:
-        try:
-            print(f"Attempt {attempt}...")
-            response = requests.post(workflow_url, json=task_payload, timeout=5)
+TERMINAL_STATUSES = {"COMPLETED", "FAILED", "TERMINATED"}
 
+
+@dataclass
+class WorkflowRun:
+    index: int
+    instance_id: Optional[str] = None
+    status: str = "PENDING"
+    start_attempts: int = 0
+    # when the run was scheduled, its latency counts from here
+    submitted_at: float = 0.0
+    # when the orchestrator accepted it, its timeout counts from here
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+    @property
+    def latency(self) -> Optional[float]:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.submitted_at
+
+
+async def start_workflow(client: httpx.AsyncClient, run: WorkflowRun, task: str, attempts: int) -> bool:
+    """Posts the task to /RunWorkflow, retrying while the orchestrator isn't up yet."""
+    for attempt in range(1, attempts + 1):
+        run.start_attempts = attempt
+        try:
+            response = await client.post(WORKFLOW_URL, json={"task": task})
             if response.status_code == 202:
-                print("Workflow started successfully!")
-                sys.exit(0)
-            else:
-                print(f"Received status code {response.status_code}: {response.text}")
+                run.instance_id = response.json()["workflow_instance_id"]
+                run.started_at = time.perf_counter()
+                return True
+            run.error = f"Received status code {response.status_code}: {response.text}"
+        except httpx.HTTPError as e:
+            run.error = f"Request failed: {e!r}"
+        if attempt < attempts:
+            await asyncio.sleep(1)
+    run.status = "START_FAILED"
+    return False
+
+
+async def wait_for_completion(client: httpx.AsyncClient, run: WorkflowRun, poll_interval: float, timeout: float) -> None:
+    # not from submitted_at, a run that waited longer than the timeout for a slot is still followed
+    deadline = run.started_at + timeout
+    while time.perf_counter() < deadline:
+        await asyncio.sleep(poll_interval)
+        try:
+            response = await client.get(f"{WORKFLOW_STATUS_URL}/{run.instance_id}")
+            if response.status_code != 200:
+                # the instance can take a moment to show up after it was scheduled
+                continue
+            status = response.json().get("runtimeStatus", "UNKNOWN")
+        except httpx.HTTPError as e:
+            run.error = f"Status request failed: {e!r}"
+            continue
+        run.status = status
+        if status in TERMINAL_STATUSES:
+            run.finished_at = time.perf_counter()
+            return
+    run.status = "TIMED_OUT"
+
+
+async def run_workflow(client: httpx.AsyncClient, semaphore: asyncio.Semaphore, run: WorkflowRun, args: argparse.Namespace) -> None:
+    async with semaphore:
+        if await start_workflow(client, run, args.task, args.start_attempts):
+            await wait_for_completion(client, run, args.poll_interval, args.timeout)
+        if args.verbose:
+            latency = f"{run.latency:.1f}s" if run.latency is not None else "-"
+            print(f"[{run.index}] {run.instance_id or '-'} {run.status} {latency}{' ' + run.error if run.error and run.status != 'COMPLETED' else ''}")
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[max(0, int(round(len(ordered) * fraction)) - 1)]
+
+
+def report(runs: List[WorkflowRun], elapsed: float) -> None:
+    completed = [run for run in runs if run.status == "COMPLETED"]
+    counts = {}
+    for run in runs:
+        counts[run.status] = counts.get(run.status, 0) + 1
+
+    print(f"\n{len(runs)} workflows in {elapsed:.1f}s, {len(completed) / elapsed:.2f} completed/s")
+    print("  " + " | ".join(f"{status.lower()} {count}" for status, count in sorted(counts.items())))
 
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
+    latencies = sorted(run.latency for run in completed)
+    if latencies:
+        print(
+            f"  end-to-end latency: mean {statistics.mean(latencies):.1f}s | p50 {percentile(latencies, 0.5):.1f}s | "
+            f"p90 {percentile(latencies, 0.9):.1f}s | p95 {percentile(latencies, 0.95):.1f}s | "
+            f"p99 {percentile(latencies, 0.99):.1f}s | max {latencies[-1]:.1f}s"
+        )
 
-        attempt += 1
-        print(f"Waiting 1s seconds before next attempt...")
-        time.sleep(1)
+    for run in runs:
+        if run.status != "COMPLETED" and run.error:
+            print(f"  first error: {run.error}")
+            break
 
-    print(f"Maximum attempts (10) reached without success.")
 
-    print("Failed to get successful response")
-    sys.exit(1)
+async def main(args: argparse.Namespace) -> int:
+    runs = [WorkflowRun(index=i) for i in range(args.workflows)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=2.0), limits=limits) as client:
+        start = time.perf_counter()
+        tasks = []
+        for run in runs:
+            # open loop: start times follow the schedule whatever the system's latency is, and a
+            # run's latency counts from its scheduled time, not from when it got a concurrency slot
+            run.submitted_at = start + run.index / args.rate if args.rate > 0 else start
+            await asyncio.sleep(max(0.0, run.submitted_at - time.perf_counter()))
+            tasks.append(asyncio.create_task(run_workflow(client, semaphore, run, args)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    report(runs, elapsed)
+    return 0 if all(run.status == "COMPLETED" for run in runs) else 1
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Start workflows on the orchestrator and track them to completion.")
+    parser.add_argument("--workflows", type=int, default=1, help="number of workflows to run")
+    parser.add_argument("--rate", type=float, default=0, help="workflows started per second, 0 starts them all at once")
+    parser.add_argument("--concurrency", type=int, default=10, help="maximum workflows in flight")
+    parser.add_argument("--task", default=DEFAULT_TASK, help="task sent to every workflow")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for each workflow to finish")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between status checks")
+    parser.add_argument("--start-attempts", type=int, default=2, help="attempts to start each workflow")
+    parser.add_argument("--verbose", action="store_true", help="print every workflow as it finishes")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.workflows == 1:
+        args.verbose = True
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,185 @@
+"""
+Recorded LLM completions and tool results for the activities of a workflow instance.
+
+Dapr replays a workflow from its history and doesn't run an activity that completed again, but
+an activity whose completion didn't reach the history (the service or its sidecar restarted
+while it ran, the result couldn't be delivered, a retry) is run from the start once more, and
+with it the LLM call and the tool calls it makes. MemoizedActivitiesMixin saves the result of
+every LLM call and tool call made inside an activity in the service's state store, keyed by:
+
+- the workflow instance id
+- the activity's task execution id, which the workflow assigns when it schedules the activity
+  and keeps across replays and redeliveries (a new generation started with continue_as_new
+  schedules its activities with new ids)
+- the position of the call within the activity
+
+When the activity runs again it gets the recorded results back instead of calling the model or
+the tool. A recorded result is only used for the same kind of call (the same response format,
+the same tool and arguments), an activity that takes another path calls through. Records
+expire with `ACTIVITY_MEMO_TTL` and `GET /GetActivityMemoStats` returns how many calls were
+recorded and replayed. Calls made outside an activity, or on a workflow runtime that doesn't
+pass task execution ids, aren't recorded.
+
+Usage:
+    class StockService(MemoizedActivitiesMixin, ShardedWorkflowStateMixin, AssistantAgent):
+        ...
+"""
+
+import collections.abc
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Iterable, List, Optional, get_args, get_origin
+
+from dapr_agents.types.message import ChatCompletion
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, PrivateAttr, TypeAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityScope:
+    """The activity a call is made from, set for the duration of the activity."""
+
+    def __init__(self, instance_id: str, execution_id: str):
+        self.instance_id = instance_id
+        self.execution_id = execution_id
+        self.calls = 0
+
+    def next_key(self) -> str:
+        self.calls += 1
+        return f"activity_memo:{self.instance_id}:{self.execution_id}:{self.calls}"
+
+
+current_activity: contextvars.ContextVar[Optional[ActivityScope]] = contextvars.ContextVar("current_activity", default=None)
+
+
+def digest(value: Any) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def llm_result_type(response_format: Any) -> Any:
+    """The type generate returns for a response format, an Iterable[Model] comes back as a list."""
+    if response_format is None:
+        return ChatCompletion
+    if get_origin(response_format) in (Iterable, collections.abc.Iterable):
+        return List[get_args(response_format)[0]]
+    return response_format
+
+
+class MemoizedActivitiesMixin(BaseModel):
+    """
+    Records the LLM and tool calls of an AgenticWorkflowService's activities, put it first in
+    the bases.
+    """
+
+    activity_memo_enabled: bool = Field(
+        default_factory=lambda: os.getenv("ACTIVITY_MEMO_ENABLED", "true").lower() == "true",
+        description="Whether LLM and tool calls made in activities are recorded and replayed.",
+    )
+    activity_memo_ttl: int = Field(
+        default_factory=lambda: int(os.getenv("ACTIVITY_MEMO_TTL", "86400")),
+        description="Seconds a recorded call is kept in the state store.",
+    )
+
+    _memo_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _memo_stats: dict = PrivateAttr(default_factory=lambda: {"recorded": 0, "replayed": 0})
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        self.app.add_api_route("/GetActivityMemoStats", self.get_activity_memo_stats, methods=["GET"])
+        if not self.activity_memo_enabled:
+            return
+        # instance attributes, the llm client and the tool executor are only used by this service
+        if self.llm is not None:
+            object.__setattr__(self.llm, "generate", self.memoized_generate(self.llm.generate))
+        tool_executor = getattr(self, "tool_executor", None)
+        if tool_executor is not None:
+            object.__setattr__(tool_executor, "execute", self.memoized_execute(tool_executor.execute))
+
+    def register_all_tasks(self) -> None:
+        if not self.activity_memo_enabled:
+            return super().register_all_tasks()
+        # every activity runs in the scope of its instance and task execution id
+        register = self.wf_runtime.activity
+        self.wf_runtime.activity = lambda name=None: lambda fn: register(name=name)(self.scoped_activity(fn))
+        try:
+            super().register_all_tasks()
+        finally:
+            del self.wf_runtime.activity
+
+    @staticmethod
+    def scoped_activity(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def activity(ctx, *args, **kwargs):
+            execution_id = getattr(ctx.get_inner_context(), "task_execution_id", "")
+            if not execution_id:
+                return fn(ctx, *args, **kwargs)
+            token = current_activity.set(ActivityScope(ctx.workflow_id, execution_id))
+            try:
+                return fn(ctx, *args, **kwargs)
+            finally:
+                current_activity.reset(token)
+
+        return activity
+
+    def memoized_generate(self, generate: Callable) -> Callable:
+        @functools.wraps(generate)
+        def memoized(*args, **kwargs):
+            scope = current_activity.get()
+            if scope is None or kwargs.get("stream"):
+                return generate(*args, **kwargs)
+            result_type = TypeAdapter(llm_result_type(kwargs.get("response_format")))
+            call = f"llm:{kwargs.get('response_format')}"
+            return self.recorded_call(scope, call, lambda: generate(*args, **kwargs), result_type)
+
+        return memoized
+
+    def memoized_execute(self, execute: Callable) -> Callable:
+        @functools.wraps(execute)
+        def memoized(tool_name: str, *args, **kwargs):
+            scope = current_activity.get()
+            if scope is None:
+                return execute(tool_name, *args, **kwargs)
+            call = f"tool:{tool_name}:{digest([args, kwargs])}"
+            return self.recorded_call(scope, call, lambda: execute(tool_name, *args, **kwargs))
+
+        return memoized
+
+    def recorded_call(self, scope: ActivityScope, call: str, make_call: Callable[[], Any], result_type: Optional[TypeAdapter] = None) -> Any:
+        key = scope.next_key()
+        try:
+            has_record, record = self.state_store_client.try_get_state(key)
+        except Exception as e:
+            logger.warning(f"Failed to read the recorded call {key}, making it: {e}")
+            has_record, record = False, None
+
+        if has_record and record and record.get("call") == call:
+            logger.info(f"Replaying the recorded result of {key}")
+            self.count_memo("replayed")
+            return result_type.validate_python(record["result"]) if result_type else record["result"]
+
+        result = make_call()
+        try:
+            value = result_type.dump_python(result, mode="json") if result_type else result
+            self.state_store_client.save_state(
+                key,
+                json.dumps({"call": call, "result": value}, default=str),
+                state_metadata={"ttlInSeconds": str(self.activity_memo_ttl)},
+            )
+            self.count_memo("recorded")
+        except Exception as e:
+            logger.warning(f"Failed to record the result of {key}, it is made again if the activity reruns: {e}")
+        return result
+
+    def count_memo(self, counter: str) -> None:
+        with self._memo_lock:
+            self._memo_stats[counter] += 1
+
+    async def get_activity_memo_stats(self) -> JSONResponse:
+        with self._memo_lock:
+            return JSONResponse(content=dict(self._memo_stats))
@@ -0,0 +1,289 @@
+"""
+Bounded work queue for the triggers of an agent service.
+
+dapr-agents starts a workflow for every trigger it receives and returns, so a burst of
+orchestrator workflows turns into as many agent workflows making LLM and provider calls at the
+same time. BoundedWorkQueueMixin admits triggers into a queue in front of the workflow start:
+
+- at most `AGENT_MAX_CONCURRENT_TASKS` agent workflows run at once, a slot is freed when the
+  workflow completes, fails or its monitoring times out
+- triggers wait for a slot in a queue of at most `AGENT_MAX_QUEUED_TASKS`, the pub/sub delivery
+  is held until then so the backlog stays in the broker
+- the queue is ordered by the start time of the orchestrator workflow a trigger belongs to, which
+  the orchestrators send with every trigger (WorkflowStartHeaderMixin), so the steps of workflows
+  that are already running go before the first steps of new ones and running workflows finish
+  instead of every workflow slowing down
+- a trigger that finds the queue full, or waits longer than `AGENT_QUEUE_TIMEOUT` seconds, is
+  shed: the orchestrator gets a task response saying the agent is overloaded and the message is
+  dropped
+
+The iterations of a running agent workflow aren't queued. `GET /GetWorkQueueStats` returns the
+queue depth, the admitted and shed triggers and the time spent waiting. The queue should stay
+below the `concurrency` of the pub/sub component (components/pubsub.yaml), which bounds the
+deliveries Dapr holds open.
+
+Usage:
+    class StockService(BoundedWorkQueueMixin, AssistantAgent):
+        ...
+
+    class LLMOrchestratorService(WorkflowStartHeaderMixin, LLMOrchestrator):
+        ...
+"""
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Optional
+
+from dapr_agents.workflow.agents.assistant.schemas import AgentTaskResponse
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# the orchestrator workflow a trigger belongs to and its start time, pub/sub metadata the orchestrators send
+SOURCE_INSTANCE_HEADER = "workflow_instance_id"
+STARTED_AT_HEADER = "workflow_started_at"
+# first-seen times of orchestrator workflows that don't send their start time, oldest forgotten first
+MAX_KNOWN_WORKFLOWS = 4096
+
+
+class Overloaded(Exception):
+    """A trigger shed by the work queue."""
+
+
+class Slot:
+    """A running agent workflow's place in the work queue, freed once."""
+
+    def __init__(self, queue: "BoundedWorkQueueMixin"):
+        self.queue = queue
+        self.instance_id: Optional[str] = None
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.queue.release_slot()
+
+
+current_slot: contextvars.ContextVar[Optional[Slot]] = contextvars.ContextVar("current_slot", default=None)
+
+
+class BoundedWorkQueueMixin(BaseModel):
+    """
+    Queues the triggers of an agent service behind a concurrency limit, put it after
+    PartitionedConsumerMixin in the bases.
+    """
+
+    max_concurrent_tasks: int = Field(
+        default_factory=lambda: int(os.getenv("AGENT_MAX_CONCURRENT_TASKS", "4")),
+        description="Agent workflows running at once.",
+    )
+    max_queued_tasks: int = Field(
+        default_factory=lambda: int(os.getenv("AGENT_MAX_QUEUED_TASKS", "16")),
+        description="Triggers waiting for a running workflow to finish before they are shed.",
+    )
+    queue_timeout: float = Field(
+        default_factory=lambda: float(os.getenv("AGENT_QUEUE_TIMEOUT", "60")),
+        description="Seconds a trigger waits in the queue before it is shed.",
+    )
+
+    _running: int = PrivateAttr(default=0)
+    _waiters: list = PrivateAttr(default_factory=list)
+    _sequence: Any = PrivateAttr(default_factory=itertools.count)
+    _known_workflows: OrderedDict = PrivateAttr(default_factory=OrderedDict)
+    _trigger_routes: set = PrivateAttr(default_factory=set)
+    _queue_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _queue_stats: dict = PrivateAttr(
+        default_factory=lambda: {"admitted": 0, "reordered": 0, "shed_full": 0, "shed_timeout": 0, "peak_queued": 0, "wait_seconds": 0.0}
+    )
+
+    def model_post_init(self, __context: Any) -> None:
+        if self.max_concurrent_tasks < 1 or self.max_queued_tasks < 0:
+            raise ValueError("AGENT_MAX_CONCURRENT_TASKS must be at least 1 and AGENT_MAX_QUEUED_TASKS at least 0")
+        super().model_post_init(__context)
+        # the routes dapr-agents registers for the message handlers that start a workflow
+        for name in dir(type(self)):
+            handler = getattr(type(self), name, None)
+            if hasattr(handler, "_is_message_handler") and hasattr(handler, "_is_workflow"):
+                router_data = handler._message_router_data
+                pubsub_name = router_data.get("pubsub") or self.message_bus_name
+                topic_name = router_data.get("topic") or self.name
+                self._trigger_routes.add(router_data.get("route") or f"/events/{pubsub_name}/{topic_name}/{name}")
+        self.app.middleware("http")(self.queue_triggers)
+        self.app.add_api_route("/GetWorkQueueStats", self.get_work_queue_stats, methods=["GET"])
+
+    async def queue_triggers(self, request: Request, call_next) -> Response:
+        if request.method != "POST" or request.url.path not in self._trigger_routes:
+            return await call_next(request)
+        source_instance_id = request.headers.get(SOURCE_INSTANCE_HEADER)
+        try:
+            slot = await self.acquire_slot(self.workflow_start_of(source_instance_id, request.headers.get(STARTED_AT_HEADER)))
+        except Overloaded as e:
+            return await self.shed(request, source_instance_id, str(e))
+
+        token = current_slot.set(slot)
+        try:
+            response = await call_next(request)
+        except BaseException:
+            slot.release()
+            raise
+        finally:
+            current_slot.reset(token)
+        if slot.instance_id is None:
+            # no workflow was started, nothing will free the slot
+            slot.release()
+        return response
+
+    async def acquire_slot(self, started_at: float) -> Slot:
+        with self._queue_lock:
+            if self._running < self.max_concurrent_tasks and not self._waiters:
+                self._running += 1
+                self.count_admitted(0.0)
+                return Slot(self)
+            if len(self._waiters) >= self.max_queued_tasks:
+                self._queue_stats["shed_full"] += 1
+                raise Overloaded(f"{len(self._waiters)} tasks already queued behind {self._running} running")
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (started_at, next(self._sequence), waiter))
+            self._queue_stats["peak_queued"] = max(self._queue_stats["peak_queued"], len(self._waiters))
+
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            with self._queue_lock:
+                if not waiter.done():
+                    self.drop_waiter(waiter)
+                    self._queue_stats["shed_timeout"] += 1
+                    raise Overloaded(f"no task finished within {self.queue_timeout:g}s")
+            # the slot was handed over as the wait timed out
+        except BaseException:
+            # the delivery was cancelled, give back the slot if it was already handed over
+            with self._queue_lock:
+                handed_over = waiter.done() and not waiter.cancelled()
+                self.drop_waiter(waiter)
+            if handed_over:
+                self.release_slot()
+            raise
+        with self._queue_lock:
+            self.count_admitted(time.monotonic() - started)
+        return Slot(self)
+
+    def drop_waiter(self, waiter: asyncio.Future) -> None:
+        waiter.cancel()
+        self._waiters = [entry for entry in self._waiters if entry[-1] is not waiter]
+        heapq.heapify(self._waiters)
+
+    def workflow_start_of(self, source_instance_id: Optional[str], started_at: Optional[str]) -> float:
+        """When the orchestrator workflow started, or when this service first saw it if it isn't sent."""
+        if started_at:
+            try:
+                return datetime.fromisoformat(started_at).timestamp()
+            except ValueError:
+                logger.debug(f"Ignoring the start time {started_at!r} of workflow {source_instance_id}")
+        if not source_instance_id:
+            return time.time()
+        with self._queue_lock:
+            first_seen = self._known_workflows.setdefault(source_instance_id, time.time())
+            self._known_workflows.move_to_end(source_instance_id)
+            if len(self._known_workflows) > MAX_KNOWN_WORKFLOWS:
+                self._known_workflows.popitem(last=False)
+        return first_seen
+
+    def count_admitted(self, waited: float) -> None:
+        self._queue_stats["admitted"] += 1
+        self._queue_stats["wait_seconds"] += waited
+
+    def release_slot(self) -> None:
+        with self._queue_lock:
+            while self._waiters:
+                _, sequence, waiter = heapq.heappop(self._waiters)
+                if not waiter.done():
+                    if any(entry[1] < sequence for entry in self._waiters):
+                        # an older workflow's trigger goes ahead of one that arrived before it
+                        self._queue_stats["reordered"] += 1
+                    # the slot passes to the waiter, the running count stays
+                    waiter.get_loop().call_soon_threadsafe(self.hand_over, waiter)
+                    return
+            self._running -= 1
+
+    def hand_over(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # timed out before it got the slot, pass it on
+            self.release_slot()
+        else:
+            waiter.set_result(None)
+
+    async def shed(self, request: Request, source_instance_id: Optional[str], reason: str) -> Response:
+        logger.warning(f"{self.name} is overloaded, shedding a task of workflow {source_instance_id}: {reason}")
+        try:
+            source_agent = json.loads(await request.body()).get("source")
+        except ValueError:
+            source_agent = None
+        if source_agent and source_instance_id:
+            # answer the step so the orchestrator doesn't wait for it
+            response = AgentTaskResponse(
+                name=self.name,
+                role="user",
+                content=f"{self.name} is overloaded and didn't run this task ({reason}). Retry it later.",
+            )
+            try:
+                await self.send_message_to_agent(
+                    name=source_agent, message=response, event_name="AgentTaskResponse", workflow_instance_id=source_instance_id
+                )
+            except Exception as e:
+                logger.error(f"Failed to tell {source_agent} that the task of workflow {source_instance_id} was shed: {e}")
+        # DROP has Dapr discard the message instead of redelivering it
+        return JSONResponse(content={"status": "DROP"}, status_code=200)
+
+    def run_workflow(self, workflow: Any, input: Any = None) -> str:
+        instance_id = super().run_workflow(workflow, input=input)
+        slot = current_slot.get()
+        if slot is not None and slot.instance_id is None:
+            slot.instance_id = instance_id
+        return instance_id
+
+    async def monitor_workflow_completion(self, instance_id: str) -> None:
+        slot = current_slot.get()
+        try:
+            await super().monitor_workflow_completion(instance_id)
+        finally:
+            if slot is not None and slot.instance_id == instance_id:
+                slot.release()
+
+    async def get_work_queue_stats(self) -> JSONResponse:
+        with self._queue_lock:
+            stats = dict(self._queue_stats)
+            stats.update(
+                running=self._running,
+                queued=len(self._waiters),
+                max_concurrent_tasks=self.max_concurrent_tasks,
+                max_queued_tasks=self.max_queued_tasks,
+                wait_seconds=round(stats["wait_seconds"], 3),
+            )
+        return JSONResponse(content=stats)
+
+
+class WorkflowStartHeaderMixin(BaseModel):
+    """
+    Sends the start time of the orchestrator workflow with every trigger, so the agents' work
+    queues serve the steps of older workflows first.
+    """
+
+    async def send_message_to_agent(self, name: str, message: Any, **kwargs) -> None:
+        instance_id = kwargs.get(SOURCE_INSTANCE_HEADER)
+        entry = self.state.get("instances", {}).get(instance_id) if instance_id else None
+        if entry and entry.get("start_time") and STARTED_AT_HEADER not in kwargs:
+            started_at = entry["start_time"]
+            kwargs[STARTED_AT_HEADER] = started_at.isoformat() if isinstance(started_at, datetime) else str(started_at)
+        await super().send_message_to_agent(name, message, **kwargs)
@@ -0,0 +1,111 @@
+"""
+Shared pooled async HTTP client for the agent tools.
+
+dapr-agents calls @tool functions synchronously, from the workflow activity threads or from
+the actor's invoke_task, so a tool can't simply be a coroutine. Instead the tools are written
+as coroutines against a single httpx.AsyncClient that lives on its own background event loop,
+and the @tool function hands the coroutine to that loop with run_tool:
+
+- every tool call in the service shares one keep-alive connection pool
+- every request has a connect and read timeout and every tool call has an overall deadline,
+  so a slow knowledge provider can't hang an activity thread forever
+- a tool can fan out several requests at once with asyncio.gather
+
+Usage:
+    async def get_all_stores() -> str:
+        response = await get_http_client().get(f"{BASE_URL}:5000/stores/all")
+        ...
+
+    @tool()
+    def call_get_all_stores() -> str:
+        return run_tool(get_all_stores())
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Coroutine, Optional
+
+import httpx
+
+
+class BackgroundHttpClient:
+    """An httpx.AsyncClient running on a dedicated event loop thread."""
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        connect_timeout: float = 2.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        tool_timeout: float = 30.0,
+    ):
+        self.tool_timeout = tool_timeout
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="tools-http-client", daemon=True)
+        self._thread.start()
+
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+
+    def run(self, coroutine: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+        """Runs a coroutine on the client's loop and waits for its result from any other thread."""
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            raise RuntimeError("run() can't be called from the HTTP client's own event loop, await the coroutine instead")
+
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._loop)
+        try:
+            return future.result(timeout or self.tool_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError(f"Tool call did not complete within {timeout or self.tool_timeout}s")
+
+    def close(self) -> None:
+        if self._loop.is_closed():
+            return
+        self.run(self.client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+
+_http_client: Optional[BackgroundHttpClient] = None
+_http_client_lock = threading.Lock()
+
+
+def create_http_client_from_env() -> BackgroundHttpClient:
+    return BackgroundHttpClient(
+        timeout=float(os.getenv("HTTP_TIMEOUT", "10")),
+        connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "2")),
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")),
+        tool_timeout=float(os.getenv("TOOL_TIMEOUT", "30")),
+    )
+
+
+def get_background_client() -> BackgroundHttpClient:
+    """Returns the shared client, creating it on first use from whichever thread gets there first."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = create_http_client_from_env()
+            atexit.register(_http_client.close)
+        return _http_client
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared httpx.AsyncClient, only use it from coroutines passed to run_tool."""
+    return get_background_client().client
+
+
+def run_tool(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """Runs an async tool implementation on the shared client's loop and returns its result."""
+    return get_background_client().run(coroutine)
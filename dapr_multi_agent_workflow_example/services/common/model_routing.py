@@ -0,0 +1,192 @@
+"""
+Routing of a service's LLM calls to a deployment per role.
+
+Not every call needs the large model. Picking the next step and checking progress are short
+structured answers, the agents mostly turn an instruction into tool arguments, while the plan
+and the final summary are where a stronger model pays off. ModelRoutingMixin sends each call of
+the service's chat client to the deployment of its role:
+
+- `planner`: the orchestrator's plan (generate_plan)
+- `selector`: the orchestrator's choice of the next steps and its progress checks
+  (generate_next_step, generate_parallel_steps, check_progress, check_parallel_progress)
+- `synthesis`: the orchestrator's final summary (generate_summary)
+- `tool`: the agents' calls, which pick and fill in their tools and answer from the results
+
+The orchestrator's activities are told apart by the structured output they ask for, the
+summary asks for none. `AZURE_OPENAI_DEPLOYMENT_<ROLE>` sets the deployment of a role (i.e.
+AZURE_OPENAI_DEPLOYMENT_SELECTOR=gpt-4o-mini), a role without one stays on the service's
+AZURE_OPENAI_DEPLOYMENT, so nothing changes until a role is configured.
+
+A call that fails on the deployment of its role, an error from the API once the client's own
+retries are spent or a structured output that doesn't validate, is made again on the escalation
+deployment, `AZURE_OPENAI_ESCALATION_DEPLOYMENT` or else the service's deployment. A call
+already on that deployment isn't escalated. `GET /GetModelRoutingStats` returns, per role, the
+deployment, the calls, the escalations, the calls that failed after them and the latency
+percentiles of the last 500 calls. `MODEL_ROUTING_ENABLED=false` turns the routing off.
+
+Usage:
+    class StockService(MemoizedActivitiesMixin, ModelRoutingMixin, AssistantAgent):
+        ...
+"""
+
+import collections.abc
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional, get_args, get_origin
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, PrivateAttr
+
+from common.llm_rate_limit import limit_llm_rate
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("planner", "selector", "tool", "synthesis")
+
+# the role of an orchestrator activity by the structured output it asks for
+ORCHESTRATOR_RESPONSE_ROLES = {
+    "PlanStep": "planner",
+    "NextStep": "selector",
+    "ParallelNextSteps": "selector",
+    "ProgressCheckOutput": "selector",
+}
+
+# settings of the chat client a client for another deployment is created with
+CLIENT_SETTINGS = {"api_key", "azure_endpoint", "api_version", "organization", "project", "azure_ad_token", "azure_client_id", "timeout"}
+
+LATENCY_WINDOW = 500
+
+
+def model_routing_enabled() -> bool:
+    return os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+
+
+def response_format_name(response_format: Any) -> Optional[str]:
+    """The model name of a response format, an Iterable[Model] counts as the model."""
+    if get_origin(response_format) in (Iterable, collections.abc.Iterable):
+        response_format = get_args(response_format)[0]
+    return getattr(response_format, "__name__", None)
+
+
+def percentile(values: list, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class RoleMetrics:
+    """Calls, escalations and latencies of one role."""
+
+    def __init__(self, deployment: str):
+        self.deployment = deployment
+        self.calls = 0
+        self.escalations = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, escalated: bool, failed: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.escalations += escalated
+            self.failed += failed
+            self.latencies.append(seconds)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            latencies = list(self.latencies)
+            stats = {"deployment": self.deployment, "calls": self.calls, "escalations": self.escalations, "failed": self.failed}
+        for name, value in (("p50_ms", percentile(latencies, 0.5)), ("p95_ms", percentile(latencies, 0.95))):
+            stats[name] = round(value * 1000, 1) if value is not None else None
+        return stats
+
+
+class ModelRouter:
+    """Sends the calls of a chat client to the deployment of their role."""
+
+    def __init__(self, llm: Any, role: str, response_roles: Dict[str, str]):
+        self.default_deployment = llm.azure_deployment
+        self.role = role
+        self.response_roles = response_roles
+        self.escalation = os.getenv("AZURE_OPENAI_ESCALATION_DEPLOYMENT") or self.default_deployment
+        self.deployments = {name: os.getenv(f"AZURE_OPENAI_DEPLOYMENT_{name.upper()}") or self.default_deployment for name in ROLES}
+        # the roles the service makes calls as
+        used = {role, *response_roles.values()}
+        self.metrics = {name: RoleMetrics(self.deployments[name]) for name in ROLES if name in used}
+        self._llm = llm
+        # the client's own generate, before anything wraps it
+        self._generates: Dict[str, Callable] = {self.default_deployment: llm.generate}
+        self._lock = threading.Lock()
+
+    def role_for(self, response_format: Any) -> str:
+        return self.response_roles.get(response_format_name(response_format), self.role)
+
+    def client_generate(self, deployment: str) -> Callable:
+        with self._lock:
+            generate = self._generates.get(deployment)
+            if generate is None:
+                settings = self._llm.model_dump(include=CLIENT_SETTINGS, exclude_none=True)
+                llm = limit_llm_rate(type(self._llm)(**settings, azure_deployment=deployment))
+                generate = self._generates[deployment] = llm.generate
+            return generate
+
+    def generate(self, *args, **kwargs) -> Any:
+        role = self.role_for(kwargs.get("response_format"))
+        deployment = self.deployments[role]
+        escalated = failed = False
+        started = time.perf_counter()
+        try:
+            try:
+                return self.client_generate(deployment)(*args, **kwargs)
+            except Exception as e:
+                if deployment == self.escalation or kwargs.get("stream"):
+                    raise
+                logger.warning(f"The {role} call failed on {deployment}, escalating it to {self.escalation}: {e}")
+                escalated = True
+                return self.client_generate(self.escalation)(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.metrics[role].record(time.perf_counter() - started, escalated, failed)
+
+    def get_stats(self) -> dict:
+        return {
+            "escalation_deployment": self.escalation,
+            "roles": {role: metrics.get_stats() for role, metrics in self.metrics.items()},
+        }
+
+
+class ModelRoutingMixin(BaseModel):
+    """
+    Routes the LLM calls of an agent service or orchestrator by role, put it after
+    MemoizedActivitiesMixin in the bases so the recorded calls are the routed ones.
+    """
+
+    llm_role: str = Field(default="tool", description="The role of the service's LLM calls.")
+    llm_response_roles: Dict[str, str] = Field(
+        default_factory=dict,
+        description="The role of the calls asking for a structured output, by the output's model name.",
+    )
+
+    _model_router: Optional[ModelRouter] = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        super().model_post_init(__context)
+        self.app.add_api_route("/GetModelRoutingStats", self.get_model_routing_stats, methods=["GET"])
+        # the chat client of a workflow service, or of the agent an actor service hosts
+        llm = getattr(self, "llm", None) or getattr(getattr(self, "agent", None), "llm", None)
+        if not model_routing_enabled() or getattr(llm, "azure_deployment", None) is None:
+            return
+        self._model_router = ModelRouter(llm, self.llm_role, self.llm_response_roles)
+        # an instance attribute, the llm client is only used by this service
+        object.__setattr__(llm, "generate", self._model_router.generate)
+
+    async def get_model_routing_stats(self) -> JSONResponse:
+        if self._model_router is None:
+            return JSONResponse(content={"enabled": False})
+        return JSONResponse(content={"enabled": True, **self._model_router.get_stats()})
@@ -0,0 +1,98 @@
+"""
+Partitioned consumption of an agent's topic by several replicas of the agent service.
+
+dapr-agents keeps the conversation of a workflow in the process that runs it (the agent's
+memory, its tool history and the instance entries in `self.state`), and Dapr runs a workflow's
+activities on any replica of an app id. Replicas of an agent service therefore run under their
+own app ids (`CatalogApp-0`, `CatalogApp-1`, ...) with the same agent name, see
+make_replicas_run_file.py. Each app id is its own consumer group, so every replica receives every
+message on the agent's topic, and PartitionedConsumerMixin has each replica take only the
+messages of its partition:
+
+- the partition of a message is the orchestrator workflow instance it belongs to (the
+  `workflow_instance_id` the orchestrator sends with every trigger), hashed over the replicas,
+  so all steps of one orchestrator workflow go to the same replica and find its conversation
+- the other replicas acknowledge the message without handling it
+- messages without a workflow instance (broadcasts, stock changes) are handled by every replica
+
+This isn't a competing consumer group and failover is static: the partitions are fixed by
+`AGENT_REPLICAS` and no replica takes over another's. While a replica is down the triggers of
+its partition wait in its consumer group and their orchestrator workflows stall, until a replica
+with the same `AGENT_REPLICA_INDEX` is started, anywhere, and resumes them from the workflow
+state kept under its app id.
+
+Usage:
+    class StockService(PartitionedConsumerMixin, AssistantAgent):
+        ...
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# the pub/sub metadata the orchestrators send with each trigger, delivered as a header
+PARTITION_HEADER = "workflow_instance_id"
+
+
+def partition_of(key: str, partitions: int) -> int:
+    return int(hashlib.sha1(key.encode()).hexdigest()[:8], 16) % partitions
+
+
+class PartitionedConsumerMixin(BaseModel):
+    """
+    Skips the pub/sub messages of the other replicas' partitions, put it first in the bases.
+    """
+
+    replicas: int = Field(
+        default_factory=lambda: int(os.getenv("AGENT_REPLICAS", "1")),
+        description="Replicas of the agent service sharing its topic.",
+    )
+    replica_index: int = Field(
+        default_factory=lambda: int(os.getenv("AGENT_REPLICA_INDEX", "0")),
+        description="Partition this replica handles, from 0 to replicas - 1.",
+    )
+
+    _partition_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _partition_stats: dict = PrivateAttr(default_factory=lambda: {"handled": 0, "skipped": 0, "unpartitioned": 0})
+
+    def model_post_init(self, __context: Any) -> None:
+        if not 0 <= self.replica_index < self.replicas:
+            raise ValueError(f"AGENT_REPLICA_INDEX must be between 0 and {self.replicas - 1}, got {self.replica_index}")
+        super().model_post_init(__context)
+        self.app.middleware("http")(self.skip_other_partitions)
+        self.app.add_api_route("/GetPartitionStats", self.get_partition_stats, methods=["GET"])
+
+    def owns(self, key: str) -> bool:
+        return partition_of(key, self.replicas) == self.replica_index
+
+    async def skip_other_partitions(self, request: Request, call_next) -> Response:
+        # Dapr delivers the subscriptions dapr-agents registers under /events/
+        if request.method != "POST" or not request.url.path.startswith("/events/"):
+            return await call_next(request)
+        key = request.headers.get(PARTITION_HEADER)
+        if not key:
+            self.count_partition("unpartitioned")
+            return await call_next(request)
+        if self.replicas > 1 and not self.owns(key):
+            self.count_partition("skipped")
+            logger.debug(f"Skipped a message of workflow {key}, partition {partition_of(key, self.replicas)} isn't ours.")
+            # 200 acknowledges the message for this replica's consumer group, the owner has its own copy
+            return Response(status_code=200)
+        self.count_partition("handled")
+        return await call_next(request)
+
+    def count_partition(self, counter: str) -> None:
+        with self._partition_lock:
+            self._partition_stats[counter] += 1
+
+    async def get_partition_stats(self) -> JSONResponse:
+        with self._partition_lock:
+            return JSONResponse(content={"replica_index": self.replica_index, "replicas": self.replicas, **self._partition_stats})
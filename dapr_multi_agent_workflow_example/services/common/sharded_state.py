@@ -0,0 +1,153 @@
+"""
+Per-instance workflow state for the agentic workflow services.
+
+dapr-agents keeps every workflow instance a service has ever run in one dict saved under a
+single `state_key`, so each save (after every message, plan update and tool call) rewrites
+an ever-growing blob and a restart loads the whole history back. ShardedWorkflowStateMixin keeps
+the same in-memory `self.state` the library works with but persists it as:
+
+- `<state_key>`: a small index with the ids of the instances still running
+- `<state_key>:<instance_id>`: one key per instance, only rewritten when that instance changed
+
+Finished instances are saved once more with a TTL (`ttlInSeconds`) so the state store expires
+them, with their message and tool histories compacted to the last few entries, and are dropped
+from memory after a grace period. Load and save cost therefore depend on the number of
+instances in flight rather than on how many have ever run.
+
+Usage:
+    class StockService(ShardedWorkflowStateMixin, AssistantAgent):
+        ...
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Union
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+# the history fields of LLMWorkflowEntry and AssistantWorkflowEntry
+HISTORY_FIELDS = ["messages", "tool_history", "task_history"]
+
+
+class ShardedWorkflowStateMixin(BaseModel):
+    """
+    Overrides load_state and save_state of an AgenticWorkflowService, put it first in the bases.
+    """
+
+    finished_state_ttl: int = Field(
+        default_factory=lambda: int(os.getenv("WORKFLOW_STATE_TTL", "86400")),
+        description="Seconds a finished instance is kept in the state store.",
+    )
+    finished_retention: int = Field(
+        default_factory=lambda: int(os.getenv("WORKFLOW_STATE_RETENTION", "300")),
+        description="Seconds a finished instance is kept in memory, a workflow replays once more after its last activity.",
+    )
+    max_persisted_history: int = Field(
+        default_factory=lambda: int(os.getenv("WORKFLOW_STATE_MAX_HISTORY", "20")),
+        description="Entries of each history kept when a finished instance is compacted.",
+    )
+
+    # activities run on several threads and all of them save state
+    _state_save_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _saved_digests: Dict[str, str] = PrivateAttr(default_factory=dict)
+    _saved_index: Optional[dict] = PrivateAttr(default=None)
+    _finished_at: Dict[str, float] = PrivateAttr(default_factory=dict)
+
+    def model_post_init(self, __context: Any) -> None:
+        # without this pydantic gives the mixin a post init that only sets up the private
+        # attributes and doesn't continue to the service's own post init
+        super().model_post_init(__context)
+
+    def instance_state_key(self, instance_id: str) -> str:
+        return f"{self.state_key}:{instance_id}"
+
+    def load_state(self) -> dict:
+        """Loads the index and the instances that are still running."""
+        if self.state:
+            return self.state
+
+        has_state, index = self.state_store_client.try_get_state(self.state_key)
+        if not has_state or not index:
+            logger.info(f"No existing state found for key '{self.state_key}'. Initializing empty state.")
+            return {}
+
+        if isinstance(index.get("instances"), dict):
+            # a single blob saved before the state was sharded, the next save splits it up
+            logger.info(f"Migrating the state under '{self.state_key}' to one key per instance.")
+            return index
+
+        instance_ids = index.pop("instance_ids", [])
+        instances = {}
+        if instance_ids:
+            items = self.state_store_client.get_bulk_state([self.instance_state_key(instance_id) for instance_id in instance_ids])
+            for instance_id, item in zip(instance_ids, items):
+                if item.data:
+                    instances[instance_id] = json.loads(item.data)
+
+        self._saved_index = {**index, "instance_ids": instance_ids}
+        logger.info(f"Loaded {len(instances)} running workflow instance(s) for '{self.state_key}'.")
+        return {**index, "instances": instances}
+
+    def save_state(self, state: Optional[Union[dict, BaseModel, str]] = None, force_reload: bool = False) -> None:
+        """Saves the instances that changed since the last save and the index if the running set changed."""
+        if isinstance(state, BaseModel):
+            state = state.model_dump(mode="json")
+        elif isinstance(state, str):
+            state = json.loads(state)
+        self.state = state or self.state
+        if not self.state:
+            logger.warning("Skipping state save: Empty state.")
+            return
+
+        with self._state_save_lock:
+            now = time.monotonic()
+            instances = self.state.setdefault("instances", {})
+
+            for instance_id, entry in list(instances.items()):
+                finished = entry.get("end_time") is not None
+                if finished:
+                    self._finished_at.setdefault(instance_id, now)
+                    entry_to_save = self.compact_entry(entry)
+                    state_metadata = {"ttlInSeconds": str(self.finished_state_ttl)}
+                else:
+                    entry_to_save = entry
+                    state_metadata = {}
+
+                value = json.dumps(entry_to_save, default=str)
+                digest = hashlib.sha1(value.encode()).hexdigest()
+                if self._saved_digests.get(instance_id) != digest:
+                    self.state_store_client.save_state(self.instance_state_key(instance_id), value, state_metadata=state_metadata)
+                    self._saved_digests[instance_id] = digest
+
+                if finished and now - self._finished_at[instance_id] > self.finished_retention:
+                    instances.pop(instance_id, None)
+                    self._saved_digests.pop(instance_id, None)
+                    self._finished_at.pop(instance_id, None)
+
+            index = {key: value for key, value in self.state.items() if key != "instances"}
+            index["instance_ids"] = sorted(
+                instance_id for instance_id, entry in list(instances.items()) if entry.get("end_time") is None
+            )
+            if index != self._saved_index:
+                self.state_store_client.save_state(self.state_key, json.dumps(index, default=str))
+                self._saved_index = index
+
+        if force_reload:
+            self.state = None
+            self.state = self.load_state()
+
+    def compact_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Keeps the last max_persisted_history entries of each history of a finished instance."""
+        compacted = dict(entry)
+        for field in HISTORY_FIELDS:
+            history = entry.get(field)
+            if isinstance(history, list) and len(history) > self.max_persisted_history:
+                compacted[field] = history[-self.max_persisted_history:]
+                compacted[f"{field}_compacted"] = len(history) - self.max_persisted_history
+        return compacted
@@ -0,0 +1,148 @@
+"""
+Tool result cache shared by every agent service and replica, kept in a Dapr state store.
+
+The agents call the same knowledge provider endpoints for every workflow (the full catalog, the
+store list, an item's stock), so each tool result is saved in the `toolcachestore` component
+(components/toolcache.yaml, on the same Redis with `keyPrefix: name` so every app reads the same
+keys) with a TTL (`ttlInSeconds`) chosen per tool. A lookup any replica of any service made is
+then answered from the store until it expires:
+
+- the key is the tool name and its arguments as canonical JSON (defaults applied, keys sorted),
+  so the same call made with keyword or positional arguments hits the same entry
+- results the tools return as an error message aren't cached
+- get_many and set_many read and save several entries in one state store call
+- delete removes entries whose data changed, the stock agent does so on StockChanged events
+
+The cache is best effort: when the state store can't be reached the tool calls the provider as
+if there were no cache. An entry saved by a call that was in flight while its data changed can
+survive the invalidation, the TTL bounds how long.
+
+Usage:
+    tool_cache = get_tool_cache()
+
+    @tool()
+    @tool_cache.cached(ttl=3600)
+    def call_get_catalog() -> str:
+        ...
+"""
+
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from dapr.clients import DaprClient
+from dapr.clients.grpc._state import StateItem
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_args(args: Dict[str, Any]) -> str:
+    return json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def is_cacheable(result: Any) -> bool:
+    # the tools report provider errors as a message starting with "Error"
+    return result is not None and not (isinstance(result, str) and result.startswith("Error"))
+
+
+class ToolResultCache:
+    def __init__(self, store_name: str, enabled: bool = True):
+        self.store_name = store_name
+        self.enabled = enabled
+        # tools run on several threads, they share one client and its gRPC channel
+        self._lock = threading.Lock()
+        self._client: Optional[DaprClient] = None
+
+    def get_client(self) -> DaprClient:
+        with self._lock:
+            if self._client is None:
+                self._client = DaprClient()
+            return self._client
+
+    @staticmethod
+    def key(tool_name: str, args: Optional[Dict[str, Any]] = None) -> str:
+        return f"tool:{tool_name}:{canonical_args(args or {})}"
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """The cached values of the keys that have one."""
+        if not self.enabled or not keys:
+            return {}
+        try:
+            response = self.get_client().get_bulk_state(store_name=self.store_name, keys=keys)
+        except Exception as e:
+            logger.warning(f"Tool cache lookup failed, calling the tool: {e}")
+            return {}
+        return {item.key: json.loads(item.data) for item in response.items if item.data}
+
+    def set(self, key: str, value: Any, ttl: int) -> None:
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, values: Dict[str, Any], ttl: int) -> None:
+        if not self.enabled or not values:
+            return
+        states = [
+            StateItem(key=key, value=json.dumps(value), metadata={"ttlInSeconds": str(ttl)})
+            for key, value in values.items()
+        ]
+        try:
+            self.get_client().save_bulk_state(store_name=self.store_name, states=states)
+        except Exception as e:
+            logger.warning(f"Failed to save {len(states)} tool result(s) in the cache: {e}")
+
+    def delete(self, keys: List[str]) -> None:
+        if not self.enabled:
+            return
+        client = self.get_client()
+        for key in keys:
+            try:
+                client.delete_state(store_name=self.store_name, key=key)
+            except Exception as e:
+                logger.warning(f"Failed to invalidate the cached tool result {key}, it expires with its TTL: {e}")
+
+    def cached(self, ttl: int, cache_if: Callable[[Any], bool] = is_cacheable) -> Callable:
+        """Caches a synchronous tool function's results for ttl seconds, put it under @tool."""
+
+        def decorator(fn: Callable) -> Callable:
+            signature = inspect.signature(fn)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = self.key(fn.__name__, dict(bound.arguments))
+                result = self.get(key)
+                if result is not None:
+                    logger.debug(f"Tool cache hit for {key}")
+                    return result
+                result = fn(*args, **kwargs)
+                if cache_if(result):
+                    self.set(key, result, ttl)
+                return result
+
+            return wrapper
+
+        return decorator
+
+
+_tool_cache: Optional[ToolResultCache] = None
+_tool_cache_lock = threading.Lock()
+
+
+def get_tool_cache() -> ToolResultCache:
+    global _tool_cache
+    with _tool_cache_lock:
+        if _tool_cache is None:
+            _tool_cache = ToolResultCache(
+                store_name=os.getenv("TOOL_CACHE_STORE", "toolcachestore"),
+                enabled=os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true",
+            )
+        return _tool_cache
@@ -0,0 +1,97 @@
+"""
+Local materialised view of stock availability, kept fresh by the StockChanged events the stock
+API publishes on the `stock-changes` topic.
+
+An item is only answered from memory once the view holds all of its stores, which happens the
+first time it's fetched over HTTP (a cache miss). From then on every change to that item arrives
+as an event, so the tools don't need to call the stock API again until the item expires.
+
+Publishing is best effort, so an item is fetched again `ttl` seconds after it was loaded, which
+bounds how long a lost event can leave it stale. Events carry the stock API's epoch, its start
+time, with the version: an event from a newer epoch means the API restarted with fresh stock,
+and the view drops everything it holds, while events from an older epoch are discarded.
+"""
+
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class StockView:
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        # tools run on workflow worker threads while events arrive on the app's event loop
+        self._lock = threading.Lock()
+        self._by_item: Dict[str, Dict[str, dict]] = {}
+        self._versions: Dict[Tuple[str, str], int] = {}
+        # item -> when it was loaded over HTTP
+        self._complete_items: Dict[str, float] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.events = 0
+        self.expired = 0
+        self.resets = 0
+
+    def get_available(self, item_code: str) -> Optional[List[dict]]:
+        """Stores with the item in stock, or None when the view doesn't hold the item (anymore)."""
+        with self._lock:
+            loaded_at = self._complete_items.get(item_code)
+            if loaded_at is not None and time.monotonic() - loaded_at >= self.ttl:
+                # fetched again from scratch, as on the first miss
+                self.expired += 1
+                self._drop_item(item_code)
+                loaded_at = None
+            if loaded_at is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [record for record in self._by_item.get(item_code, {}).values() if record["qty"] > 0]
+
+    def load_item(self, item_code: str, records: List[dict]) -> None:
+        """Loads every store's stock for an item fetched over HTTP, marking the item complete."""
+        with self._lock:
+            for record in records:
+                key = (record["store_id"], record["item_code"])
+                # an event that arrived while we were fetching is newer than this snapshot
+                if key not in self._versions:
+                    self._by_item.setdefault(item_code, {})[record["store_id"]] = record
+            self._complete_items[item_code] = time.monotonic()
+
+    def apply_changes(self, changes: List[dict], version: int, epoch: int = 0) -> None:
+        with self._lock:
+            self.events += 1
+            if epoch < self._epoch:
+                # from before the stock API restarted
+                return
+            if epoch > self._epoch:
+                # the stock API restarted, what the view holds may not be its stock anymore
+                if self._epoch:
+                    self.resets += 1
+                self._epoch = epoch
+                self._by_item.clear()
+                self._versions.clear()
+                self._complete_items.clear()
+            for change in changes:
+                key = (change["store_id"], change["item_code"])
+                if version <= self._versions.get(key, 0):
+                    # stale or duplicate delivery
+                    continue
+                self._versions[key] = version
+                self._by_item.setdefault(change["item_code"], {})[change["store_id"]] = change
+
+    def _drop_item(self, item_code: str) -> None:
+        for store_id in self._by_item.pop(item_code, {}):
+            self._versions.pop((store_id, item_code), None)
+        self._complete_items.pop(item_code, None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "events": self.events,
+                "expired": self.expired,
+                "resets": self.resets,
+                "items": len(self._complete_items),
+            }
@@ -4,63 +4,96 @@ from dotenv import load_dotenv
 import asyncio
 import logging
 import os
-import requests
+import sys
+import httpx
 from pydantic import BaseModel, Field
 
+# shared modules for the agent services live in services/common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.http_client import get_http_client, run_tool
+from common.tool_cache import get_tool_cache
+from common.activity_memo import MemoizedActivitiesMixin
+from common.backpressure import BoundedWorkQueueMixin
+from common.partitioning import PartitionedConsumerMixin
+from common.registry_cache import CachedAgentRegistryMixin
+from common.sharded_state import ShardedWorkflowStateMixin
+from common.llm_rate_limit import limit_llm_rate
+from common.model_routing import ModelRoutingMixin
+
 BASE_URL = "http://localhost"
 
+# store lookups are shared by every agent through the tool cache, see services/common/tool_cache.py
+tool_cache = get_tool_cache()
+STORES_CACHE_TTL = int(os.getenv("TOOL_CACHE_TTL_STORES", "3600"))
+
 
 # Stores API Calls
-@tool()
-def call_get_all_stores() -> str:
-    """Get information about all available stores."""
+async def get_all_stores() -> str:
     try:
-        response = requests.get(f"{BASE_URL}:5000/stores/all")
+        response = await get_http_client().get(f"{BASE_URL}:5000/stores/all")
         response.raise_for_status()
         return f"All Stores: {response.json()}"
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         return f"Error getting all stores: {e.response.text}"
 
+@tool()
+@tool_cache.cached(ttl=STORES_CACHE_TTL)
+def call_get_all_stores() -> str:
+    """Get information about all available stores."""
+    return run_tool(get_all_stores())
+
 
 class StoreIdSchema(BaseModel):
     store_id: str = Field(description="Store ID of the store to find")
 
-@tool(args_model=StoreIdSchema)
-def call_find_store_by_id(store_id: str) -> str:
-    """Find a specific store by its ID."""
+async def find_store_by_id(store_id: str) -> str:
     try:
-        response = requests.get(f"{BASE_URL}:5000/stores/store/{store_id}")
+        response = await get_http_client().get(f"{BASE_URL}:5000/stores/store/{store_id}")
         response.raise_for_status()
         return f"Store {store_id}: {response.json()}"
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         return f"Error finding store by ID {store_id}: {e.response.text}"
 
+@tool(args_model=StoreIdSchema)
+@tool_cache.cached(ttl=STORES_CACHE_TTL)
+def call_find_store_by_id(store_id: str) -> str:
+    """Find a specific store by its ID."""
+    return run_tool(find_store_by_id(store_id))
+
 
 class LocationSchema(BaseModel):
     location: str = Field(description="Location to find stores near to")
 
-@tool(args_model=LocationSchema)
-def call_find_closest_stores(location: str) -> str:
-    """Find stores closest to a specified location."""
+async def find_closest_stores(location: str) -> str:
     try:
-        response = requests.get(
+        response = await get_http_client().get(
             f"{BASE_URL}:5000/stores/closest", params={"location": location}
         )
         response.raise_for_status()
         return f"Closest Stores to {location}: {response.json()}"
-    except requests.HTTPError as e:
+    except httpx.HTTPStatusError as e:
         return f"Error finding closest stores: {e.response.text}"
 
+@tool(args_model=LocationSchema)
+@tool_cache.cached(ttl=STORES_CACHE_TTL)
+def call_find_closest_stores(location: str) -> str:
+    """Find stores closest to a specified location."""
+    return run_tool(find_closest_stores(location))
+
+class StoresService(PartitionedConsumerMixin, BoundedWorkQueueMixin, MemoizedActivitiesMixin, ModelRoutingMixin, CachedAgentRegistryMixin, ShardedWorkflowStateMixin, AssistantAgent):
+    """AssistantAgent with a cached agents registry, its workflow state saved per instance, its LLM and tool calls recorded per activity and routed by role, its topic partitioned over the replicas and its triggers queued behind a concurrency limit, see services/common"""
+
+
 async def main():
     try:
-        llm = OpenAIChatClient(
+        llm = limit_llm_rate(OpenAIChatClient(
             api_key=os.getenv("AZURE_OPENAI_API_KEY"),
             azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
             azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
             api_version=os.getenv("AZURE_OPENAI_API_VERSION")
-        )
+        ))
 
-        stores_service = AssistantAgent(
+        stores_service = StoresService(
             name="StoresAgent",
             role="StoresManager",
             goal="Provide store information like store name and address.",
@@ -81,7 +114,8 @@ async def main():
             state_key="workflow_state",
             agents_registry_store_name="agentstatestore",
             agents_registry_key="agents_registry",
-            service_port=8003,
+            # replicas each get their own port, see make_replicas_run_file.py
+            service_port=int(os.getenv("APP_PORT", "8003")),
         )
 
         await stores_service.start()
@@ -1,20 +1,48 @@
 from dapr_agents import LLMOrchestrator
 from dapr_agents.llm.openai.chat import OpenAIChatClient
 from dotenv import load_dotenv
+from pydantic import Field
+from typing import Dict
 import asyncio
 import logging
 import os
+import sys
+from parallel_orchestrator import ParallelLLMOrchestrator
+
+# shared modules for the agent services live in services/common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.activity_memo import MemoizedActivitiesMixin
+from common.backpressure import WorkflowStartHeaderMixin
+from common.registry_cache import CachedAgentRegistryMixin
+from common.sharded_state import ShardedWorkflowStateMixin
+from common.llm_rate_limit import limit_llm_rate
+from common.model_routing import ORCHESTRATOR_RESPONSE_ROLES, ModelRoutingMixin
+
+
+class LLMOrchestratorService(WorkflowStartHeaderMixin, MemoizedActivitiesMixin, ModelRoutingMixin, CachedAgentRegistryMixin, ShardedWorkflowStateMixin, LLMOrchestrator):
+    """LLMOrchestrator with a cached agents registry, its workflow state saved per instance, its LLM and tool calls recorded per activity and routed by role, its start time sent with every trigger, see services/common"""
+    llm_role: str = "synthesis"
+    llm_response_roles: Dict[str, str] = Field(default_factory=lambda: dict(ORCHESTRATOR_RESPONSE_ROLES))
+
+class ParallelLLMOrchestratorService(WorkflowStartHeaderMixin, MemoizedActivitiesMixin, ModelRoutingMixin, CachedAgentRegistryMixin, ShardedWorkflowStateMixin, ParallelLLMOrchestrator):
+    """ParallelLLMOrchestrator with a cached agents registry, its workflow state saved per instance, its LLM and tool calls recorded per activity and routed by role, its start time sent with every trigger, see services/common"""
+    llm_role: str = "synthesis"
+    llm_response_roles: Dict[str, str] = Field(default_factory=lambda: dict(ORCHESTRATOR_RESPONSE_ROLES))
 
 
 async def main():
     try:
-        llm = OpenAIChatClient(
+        llm = limit_llm_rate(OpenAIChatClient(
             api_key=os.getenv("AZURE_OPENAI_API_KEY"), # or add AZURE_OPENAI_API_KEY environment variable to .env file
             azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"), # or add AZURE_OPENAI_ENDPOINT environment variable to .env file
             azure_deployment=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
             api_version=os.getenv("AZURE_OPENAI_API_VERSION")
-        )
-        workflow_service = LLMOrchestrator(
+        ))
+        # parallel dispatches every independent step of an iteration at once, sequential one agent per iteration
+        parallel = os.getenv("ORCHESTRATOR_MODE", "sequential").lower() == "parallel"
+        orchestrator_options = {"max_parallel_tasks": int(os.getenv("ORCHESTRATOR_MAX_PARALLEL_TASKS", "3"))} if parallel else {}
+
+        workflow_service = (ParallelLLMOrchestratorService if parallel else LLMOrchestratorService)(
             name="LLMOrchestrator",
             message_bus_name="messagepubsub",
             state_store_name="workflowstatestore",
@@ -32,7 +60,8 @@ async def main():
             - Stock Manager: For inventory information, stock quantities, and product availability
 
             Select the most appropriate agent to handle each task step.
-            """
+            """,
+            **orchestrator_options,
         )
 
         await workflow_service.start()
@@ -20,7 +20,6 @@ import streamlit as st
 from termcolor import colored
 from langchain_experimental.plan_and_execute import (
     PlanAndExecute,
-    load_agent_executor,
     load_chat_planner,
 )
 from langchain import SerpAPIWrapper
@@ -32,12 +31,18 @@ from langchain.prompts import MessagesPlaceholder
 from common import get_llm
 from dotenv import find_dotenv, load_dotenv
 import json
+import os
 
 from catalog import get_catalog
+from run_metrics import RunMetricsCallbackHandler, load_run_percentiles
+from single_flight import get_single_flight_stats
+from model_routing import get_model_routing_stats
+from tool_retrieval import ToolRetrievalExecutor
 
 usePlanAndExecuteAgentType = True
 useBuiltInSearchAndCalculatorTools = False
 useUserInputTool = True
+useRunMetrics = True
 
 if 'user_input_history' not in st.session_state:
     st.session_state['user_input_history'] = []
@@ -76,9 +81,12 @@ def setup_agent():
     memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
 
     llm = get_llm()
+    # plan and answer on the planner and synthesis deployments, the tool steps on the tool one, see model_routing.py
+    planner_llm = get_llm(role="planner")
+    tool_llm = get_llm(role="tool")
 
     search = SerpAPIWrapper()
-    llm_math_chain = LLMMathChain.from_llm(llm=llm, verbose=True)
+    llm_math_chain = LLMMathChain.from_llm(llm=tool_llm, verbose=True)
 
     tools = []
 
@@ -124,8 +132,11 @@ def setup_agent():
 
     if usePlanAndExecuteAgentType:
         # plan and execute - https://python.langchain.com/docs/modules/agents/agent_types/plan_and_execute
-        planner = load_chat_planner(llm)
-        executor = load_agent_executor(llm, tools, verbose=True)
+        planner = load_chat_planner(planner_llm)
+        # each step's executor only gets the knowledge provider tools that match the step, see tool_retrieval.py
+        executor = ToolRetrievalExecutor.from_tools(
+            tool_llm, tools, catalog_tools=knowledge_tools, top_k=int(os.getenv("TOOL_RETRIEVAL_TOP_K", "3")), verbose=True
+        )
         agent = PlanAndExecute(planner=planner, executor=executor, verbose=True)
     else :
         # structured tool - https://python.langchain.com/docs/modules/agents/agent_types/structured_chat.html
@@ -144,10 +155,36 @@ agent = setup_agent()
 def generate_response(input_text):
 
     with st.spinner(text="Generating... Please check the agent backend to see if it requires further user input."):
-        response = agent({"input": input_text})
+        # a new handler per run so tokens and latency are aggregated per agent({"input": ...}) call
+        callbacks = []
+        if useRunMetrics:
+            run_metrics = RunMetricsCallbackHandler(jsonl_path=os.getenv("RUN_METRICS_JSONL_PATH"))
+            callbacks.append(run_metrics)
+
+        response = agent({"input": input_text}, callbacks=callbacks)
 
         st.info(response["output"], icon="🤖")
 
+        if useRunMetrics:
+            st.divider()
+            st.caption("Token And Latency Breakdown Per Step")
+            st.dataframe(run_metrics.get_step_rows())
+            st.json(run_metrics.get_totals(), expanded=False)
+
+            if run_metrics.jsonl_path:
+                st.caption("Latency And Token Percentiles Across Recorded Runs")
+                st.json(load_run_percentiles(run_metrics.jsonl_path), expanded=False)
+
+            st.caption("LLM Calls Shared With Concurrent Sessions")
+            st.json(get_single_flight_stats(), expanded=False)
+
+            st.caption("LLM Calls And Latency Per Role")
+            st.json(get_model_routing_stats(), expanded=False)
+
+            if isinstance(getattr(agent, "executor", None), ToolRetrievalExecutor):
+                st.caption("Tools Offered Per Step")
+                st.json(agent.executor.get_stats(), expanded=False)
+
         st.divider()
         st.caption("Additional User Input Used During Run")
         user_input_used = json.dumps(user_input_history)
@@ -0,0 +1,116 @@
+"""
+Request coalescing and a micro-cache for the knowledge provider endpoints.
+
+The plan and execute agents of several users ask a provider for the same result at about the
+same time, the store list, the availability of a popular item. The Flask server handles every
+request in its own thread, and a function wrapped with coalesce(name, ttl) computes each
+distinct request once:
+
+- concurrent calls with the same action input share one computation and all get its result, or
+  its error
+- the result is then answered from memory for `ttl` seconds, the micro-cache window, errors
+  aren't kept
+- the window is set per endpoint with PROVIDER_CACHE_TTL_<NAME> (i.e. PROVIDER_CACHE_TTL_FIND_AVAILABLE_STOCK),
+  0 coalesces without caching, and PROVIDER_COALESCING_ENABLED=false turns it off everywhere
+
+get_stats() returns the calls, computations, coalesced calls and cache hits of every endpoint.
+
+Usage:
+    @coalesce("find_item", ttl=5)
+    def find_item(action_input: dict) -> str:
+        ...
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+# distinct requests kept per endpoint, expired ones are dropped first
+MAX_ENTRIES = 1024
+
+
+def coalescing_enabled() -> bool:
+    return os.getenv("PROVIDER_COALESCING_ENABLED", "true").lower() == "true"
+
+
+class EndpointCache:
+    """The computations in flight and the results cached for one endpoint, shared by the request threads."""
+
+    def __init__(self, name: str, ttl: float):
+        self.name = name
+        self.ttl = ttl
+        self.results: Dict[str, Tuple[float, Any]] = {}
+        self.in_flight: Dict[str, Future] = {}
+        self.stats = {"calls": 0, "computed": 0, "coalesced": 0, "cache_hits": 0}
+        self._lock = threading.Lock()
+
+    def get(self, key: str, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.stats["calls"] += 1
+            cached = self.results.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self.stats["cache_hits"] += 1
+                return cached[1]
+            future = self.in_flight.get(key)
+            coalesced = future is not None
+            if coalesced:
+                self.stats["coalesced"] += 1
+            else:
+                self.stats["computed"] += 1
+                future = self.in_flight[key] = Future()
+        if coalesced:
+            return future.result()
+
+        try:
+            result = compute()
+        except BaseException as e:
+            with self._lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self.in_flight[key]
+            if self.ttl > 0:
+                self.store(key, result)
+        future.set_result(result)
+        return result
+
+    def store(self, key: str, result: Any) -> None:
+        now = time.monotonic()
+        if len(self.results) >= MAX_ENTRIES:
+            self.results = {k: entry for k, entry in self.results.items() if entry[0] > now}
+            if len(self.results) >= MAX_ENTRIES:
+                self.results.clear()
+        self.results[key] = (now + self.ttl, result)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "ttl": self.ttl, "cached": len(self.results), "in_flight": len(self.in_flight)}
+
+
+_endpoints: Dict[str, EndpointCache] = {}
+
+
+def coalesce(name: str, ttl: float) -> Callable:
+    """Coalesces the calls of a provider function and caches its results for PROVIDER_CACHE_TTL_<NAME> or ttl seconds."""
+    cache = _endpoints[name] = EndpointCache(name, float(os.getenv(f"PROVIDER_CACHE_TTL_{name.upper()}", str(ttl))))
+
+    def decorator(function: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(function)
+        def coalesced(*args, **kwargs):
+            if not coalescing_enabled():
+                return function(*args, **kwargs)
+            key = json.dumps([args, kwargs], sort_keys=True, default=str)
+            return cache.get(key, lambda: function(*args, **kwargs))
+
+        return coalesced
+
+    return decorator
+
+
+def get_stats() -> dict:
+    return {name: endpoint.get_stats() for name, endpoint in _endpoints.items()}
@@ -5,12 +5,20 @@ import dotenv
 from langchain.llms import AzureOpenAI
 from langchain.chat_models import ChatOpenAI
 
+from llm_rate_limit import limit_llm_rate, rate_limit_enabled
+from single_flight import SingleFlightChatOpenAI
+from model_routing import route_llm
+
 from typing import Any, Optional
 
-def get_llm(temperature=0.0, top_p=1, max_tokens=2000, deployment=None, model=None):
+def get_llm(temperature=0.0, top_p=1, max_tokens=2000, deployment=None, model=None, role=None):
     # load environment variables using dotenv
     dotenv.load_dotenv()
 
+    if role is not None:
+        # the llm of a role on its own deployment, escalating failed calls, see model_routing.py
+        return route_llm(role, lambda role_deployment, role_model: get_llm(temperature, top_p, max_tokens, role_deployment, role_model))
+
     print(f"AZURE_OPENAI_ENDPOINT={os.getenv('AZURE_OPENAI_ENDPOINT')}")
 
     AZURE_OPENAI_ENABLED = os.getenv("AZURE_OPENAI_ENABLED").lower() == "true"
@@ -40,12 +48,19 @@ def get_llm(temperature=0.0, top_p=1, max_tokens=2000, deployment=None, model=No
 
     # url = openai.api_base + "/openai/deployments?api-version=2022-12-01"
 
+    # every call of the process goes through the shared rate limiter, see llm_rate_limit.py, which
+    # retries the throttled calls, langchain retrying them as well would multiply the attempts
+    limit_llm_rate()
+    max_retries = 0 if rate_limit_enabled() else 6
+
     if not AZURE_OPENAI_ENABLED:
-        llm = ChatOpenAI(model_name=AZURE_OPENAI_MODEL_NAME,
-                         temperature=temperature, top_p=top_p)
+        llm = SingleFlightChatOpenAI(model_name=AZURE_OPENAI_MODEL_NAME,
+                                     temperature=temperature, top_p=top_p,
+                                     max_retries=max_retries)
     else:
-        llm = ChatOpenAI(model=AZURE_OPENAI_MODEL_NAME,
+        llm = SingleFlightChatOpenAI(model=AZURE_OPENAI_MODEL_NAME,
                             temperature=temperature,
+                            max_retries=max_retries,
                             max_tokens=max_tokens if max_tokens != -1
                             else None,
                             openai_api_base=openai.api_base,
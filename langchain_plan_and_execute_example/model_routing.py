@@ -0,0 +1,162 @@
+"""
+A deployment per role for the calls of the plan and execute agent.
+
+Not every call needs the large model. Most of the executor's steps pick a knowledge provider
+tool and fill in its input, while the plan and the answer to the user are where a stronger model
+pays off. get_llm(role=...) gives each role its own llm:
+
+- `planner`: the chat planner, which writes the plan
+- `tool`: the executor's steps and the math chain
+- `synthesis`: the executor's final step, the planner's "Given the above steps taken, please
+  respond to the users original question", which writes the answer
+
+`AZURE_OPENAI_DEPLOYMENT_NAME_<ROLE>` and `AZURE_OPENAI_MODEL_NAME_<ROLE>` set the deployment of
+a role (i.e. AZURE_OPENAI_DEPLOYMENT_NAME_TOOL=gpt-35-turbo), a role without one stays on
+AZURE_OPENAI_DEPLOYMENT_NAME, so nothing changes until a role is configured.
+
+A call that fails on the deployment of its role, once the client's own retries are spent, is
+made again on the escalation deployment, `AZURE_OPENAI_ESCALATION_DEPLOYMENT_NAME` (and
+`AZURE_OPENAI_ESCALATION_MODEL_NAME`) or else AZURE_OPENAI_DEPLOYMENT_NAME. A call already on
+that deployment isn't escalated. get_model_routing_stats() returns, per role, the deployment,
+the calls, the escalations, the calls that failed after them and the latency percentiles of the
+last 500 calls. `MODEL_ROUTING_ENABLED=false` puts every role on the default deployment.
+
+Usage:
+    planner = load_chat_planner(get_llm(role="planner"))
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import BaseMessage, ChatResult
+
+ROLES = ("planner", "tool", "synthesis")
+
+# how the executor's prompt starts the planner's final step
+FINAL_STEP = "Current objective: Given the above steps taken"
+
+LATENCY_WINDOW = 500
+
+
+def model_routing_enabled() -> bool:
+    return os.getenv("MODEL_ROUTING_ENABLED", "true").lower() == "true"
+
+
+def percentile(values: list, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class RoleMetrics:
+    """Calls, escalations and latencies of one role, shared by the session threads."""
+
+    def __init__(self, deployment: str):
+        self.deployment = deployment
+        self.calls = 0
+        self.escalations = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, escalated: bool, failed: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            self.escalations += escalated
+            self.failed += failed
+            self.latencies.append(seconds)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            latencies = list(self.latencies)
+            stats = {"deployment": self.deployment, "calls": self.calls, "escalations": self.escalations, "failed": self.failed}
+        for name, value in (("p50_ms", percentile(latencies, 0.5)), ("p95_ms", percentile(latencies, 0.95))):
+            stats[name] = round(value * 1000, 1) if value is not None else None
+        return stats
+
+
+_metrics: Dict[str, RoleMetrics] = {}
+
+
+def get_model_routing_stats() -> dict:
+    return {role: metrics.get_stats() for role, metrics in _metrics.items()}
+
+
+def is_final_step(messages: List[BaseMessage]) -> bool:
+    return bool(messages) and FINAL_STEP in messages[-1].content
+
+
+class RoutedChatModel(BaseChatModel):
+    """The llm of one role, escalates a failed call to the escalation llm."""
+
+    role: str
+    deployment: str
+    llm: BaseChatModel
+    # None when the role is on the escalation deployment already
+    escalation: Optional[BaseChatModel] = None
+    # the llm of the synthesis role, for the executor's final step
+    final_step: Optional[BaseChatModel] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return self.llm._llm_type
+
+    def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
+        # the token usage of the calls, added up by the llm the way it reports it
+        return self.llm._combine_llm_outputs(llm_outputs)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.final_step is not None and is_final_step(messages):
+            return self.final_step._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        escalated = failed = False
+        started = time.perf_counter()
+        try:
+            try:
+                return self.llm._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except Exception as e:
+                if self.escalation is None:
+                    raise
+                print(f"The {self.role} call failed on {self.deployment}, escalating it: {e}")
+                escalated = True
+                return self.escalation._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            _metrics[self.role].record(time.perf_counter() - started, escalated, failed)
+
+
+def route_llm(role: str, create_llm: Callable[[str, str], BaseChatModel]) -> BaseChatModel:
+    """The llm of a role, create_llm(deployment, model) creates the llm of a deployment."""
+    default = (os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME"), os.getenv("AZURE_OPENAI_MODEL_NAME"))
+    if not model_routing_enabled():
+        return create_llm(*default)
+    deployment: Tuple[str, str] = (
+        os.getenv(f"AZURE_OPENAI_DEPLOYMENT_NAME_{role.upper()}") or default[0],
+        os.getenv(f"AZURE_OPENAI_MODEL_NAME_{role.upper()}") or default[1],
+    )
+    escalation = (
+        os.getenv("AZURE_OPENAI_ESCALATION_DEPLOYMENT_NAME") or default[0],
+        os.getenv("AZURE_OPENAI_ESCALATION_MODEL_NAME") or default[1],
+    )
+    if role not in _metrics:
+        _metrics[role] = RoleMetrics(deployment[0])
+    return RoutedChatModel(
+        role=role,
+        deployment=deployment[0],
+        llm=create_llm(*deployment),
+        escalation=create_llm(*escalation) if escalation != deployment else None,
+        final_step=route_llm("synthesis", create_llm) if role == "tool" else None,
+    )
@@ -0,0 +1,239 @@
+import json
+import sys
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.schema import LLMResult
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    # nearest-rank percentile, good enough for a handful of runs
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def load_run_percentiles(jsonl_path: str, pcts=(50, 90, 95, 99)) -> dict:
+    """
+    Reads the runs recorded in a JSONL sink and returns latency and token percentiles across them.
+    """
+    run_latencies = []
+    llm_latencies = []
+    tool_latencies = []
+    total_tokens = []
+
+    try:
+        with open(jsonl_path, "r") as sink:
+            for line in sink:
+                if not line.strip():
+                    continue
+                run = json.loads(line)
+                run_latencies.append(run["totals"]["run_latency_s"])
+                total_tokens.append(run["totals"]["total_tokens"])
+                llm_latencies.extend(step["llm_latency_s"] for step in run["steps"] if step["llm_calls"])
+                tool_latencies.extend(step["tool_latency_s"] for step in run["steps"] if step["tool_calls"])
+    except FileNotFoundError:
+        return {"runs": 0}
+
+    def summarise(values):
+        return {f"p{pct}": percentile(values, pct) for pct in pcts}
+
+    return {
+        "runs": len(run_latencies),
+        "run_latency_s": summarise(run_latencies),
+        "step_llm_latency_s": summarise(llm_latencies),
+        "step_tool_latency_s": summarise(tool_latencies),
+        "total_tokens": summarise(total_tokens),
+    }
+
+
+class RunMetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records prompt/completion tokens, LLM latency and tool latency for each planner and executor
+    step of a single agent run, and optionally appends the run to a JSONL file when it finishes.
+
+    Pass a new instance per run, i.e. agent({"input": ...}, callbacks=[RunMetricsCallbackHandler()]).
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = None):
+        self.jsonl_path = jsonl_path
+        self.steps: Dict[UUID, dict] = {}
+        self.run_latency_s: Optional[float] = None
+        self.run_input: Optional[str] = None
+
+        self._root_run_id: Optional[UUID] = None
+        self._root_name: Optional[str] = None
+        self._run_started_at: Optional[float] = None
+        self._chain_parents: Dict[UUID, Optional[UUID]] = {}
+        self._llm_started_at: Dict[UUID, float] = {}
+        self._tool_started_at: Dict[UUID, float] = {}
+
+    ### chain tracking ###
+
+    def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any], *, run_id: UUID,
+                       parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        name = (serialized or {}).get("id", ["chain"])[-1]
+        self._chain_parents[run_id] = parent_run_id
+
+        if parent_run_id is None:
+            self._root_run_id = run_id
+            self._root_name = name
+            self._run_started_at = time.perf_counter()
+            self.run_input = inputs.get("input") if isinstance(inputs, dict) else str(inputs)
+            return
+
+        if parent_run_id == self._root_run_id:
+            # direct children of the root chain are the planner / executor steps
+            if name == "AgentExecutor" and isinstance(inputs, dict) and "current_step" in inputs:
+                phase, label = "executor", str(inputs["current_step"])
+            elif self._root_name == "PlanAndExecute":
+                phase, label = "planner", "Generate plan"
+            else:
+                phase, label = name, name
+            self._new_step(run_id, phase, label)
+
+    def on_chain_end(self, outputs: Dict[str, Any], *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id == self._root_run_id:
+            self._finish_run()
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        if run_id == self._root_run_id:
+            self._finish_run(error=str(error))
+
+    ### llm tracking ###
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID,
+                     parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._llm_started_at[run_id] = time.perf_counter()
+        step = self._step_for(parent_run_id)
+        step["llm_calls"] += 1
+        step["prompt_chars"] += sum(len(prompt) for prompt in prompts)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                   **kwargs: Any) -> None:
+        step = self._step_for(parent_run_id)
+        step["llm_latency_s"] += time.perf_counter() - self._llm_started_at.pop(run_id, time.perf_counter())
+
+        token_usage = (response.llm_output or {}).get("token_usage", {})
+        step["prompt_tokens"] += token_usage.get("prompt_tokens", 0)
+        step["completion_tokens"] += token_usage.get("completion_tokens", 0)
+        step["total_tokens"] += token_usage.get("total_tokens", 0)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                     **kwargs: Any) -> None:
+        step = self._step_for(parent_run_id)
+        step["llm_latency_s"] += time.perf_counter() - self._llm_started_at.pop(run_id, time.perf_counter())
+        step["errors"] += 1
+
+    ### tool tracking ###
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      parent_run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._tool_started_at[run_id] = time.perf_counter()
+        step = self._step_for(parent_run_id)
+        step["tool_calls"] += 1
+        step["tools"].append((serialized or {}).get("name", "tool"))
+
+    def on_tool_end(self, output: str, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                    **kwargs: Any) -> None:
+        step = self._step_for(parent_run_id)
+        step["tool_latency_s"] += time.perf_counter() - self._tool_started_at.pop(run_id, time.perf_counter())
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+                      **kwargs: Any) -> None:
+        step = self._step_for(parent_run_id)
+        step["tool_latency_s"] += time.perf_counter() - self._tool_started_at.pop(run_id, time.perf_counter())
+        step["errors"] += 1
+
+    ### aggregation ###
+
+    def get_step_rows(self) -> List[dict]:
+        """One row per planner / executor step, in execution order."""
+        rows = []
+        for step in self.steps.values():
+            row = dict(step)
+            row["llm_latency_s"] = round(row["llm_latency_s"], 3)
+            row["tool_latency_s"] = round(row["tool_latency_s"], 3)
+            row["tools"] = ", ".join(row["tools"])
+            rows.append(row)
+        return rows
+
+    def get_totals(self) -> dict:
+        steps = list(self.steps.values())
+        return {
+            "steps": len(steps),
+            "llm_calls": sum(step["llm_calls"] for step in steps),
+            "tool_calls": sum(step["tool_calls"] for step in steps),
+            "prompt_tokens": sum(step["prompt_tokens"] for step in steps),
+            "completion_tokens": sum(step["completion_tokens"] for step in steps),
+            "total_tokens": sum(step["total_tokens"] for step in steps),
+            "llm_latency_s": round(sum(step["llm_latency_s"] for step in steps), 3),
+            "tool_latency_s": round(sum(step["tool_latency_s"] for step in steps), 3),
+            "run_latency_s": round(self.run_latency_s, 3) if self.run_latency_s is not None else None,
+        }
+
+    ### helpers ###
+
+    def _new_step(self, run_id: UUID, phase: str, label: str) -> dict:
+        step = {
+            "step": len(self.steps) + 1,
+            "phase": phase,
+            "label": label,
+            "llm_calls": 0,
+            "prompt_chars": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0,
+            "llm_latency_s": 0.0,
+            "tool_calls": 0,
+            "tool_latency_s": 0.0,
+            "tools": [],
+            "errors": 0,
+        }
+        self.steps[run_id] = step
+        return step
+
+    def _step_for(self, parent_run_id: Optional[UUID]) -> dict:
+        # walk up the chain tree until we reach the step that is a direct child of the root chain
+        run_id = parent_run_id
+        while run_id is not None and run_id not in self.steps:
+            parent = self._chain_parents.get(run_id)
+            if parent is None or run_id == self._root_run_id:
+                break
+            run_id = parent
+
+        if run_id in self.steps:
+            return self.steps[run_id]
+
+        # events attached directly to the root chain (i.e. the structured chat agent)
+        key = self._root_run_id or parent_run_id
+        if key not in self.steps:
+            self._new_step(key, "agent", self._root_name or "agent")
+        return self.steps[key]
+
+    def _finish_run(self, error: Optional[str] = None) -> None:
+        if self._run_started_at is not None:
+            self.run_latency_s = time.perf_counter() - self._run_started_at
+
+        if not self.jsonl_path:
+            return
+
+        record = {
+            "timestamp": time.time(),
+            "agent": self._root_name,
+            "input": self.run_input,
+            "error": error,
+            "totals": self.get_totals(),
+            "steps": self.get_step_rows(),
+        }
+        with open(self.jsonl_path, "a") as sink:
+            sink.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    # python3 run_metrics.py run_metrics.jsonl
+    print(json.dumps(load_run_percentiles(sys.argv[1] if len(sys.argv) > 1 else "run_metrics.jsonl"), indent=2))
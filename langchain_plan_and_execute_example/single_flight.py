@@ -0,0 +1,114 @@
+"""
+Single-flight for identical chat completions made at the same time.
+
+Streamlit runs every browser session in its own thread against the one agent setup_agent
+caches, so users asking the same popular question have the planner send the same prompt to the
+model at the same moment. SingleFlightChatOpenAI shares one completion between those calls:
+
+- the first call goes to the model, the calls with the same messages and parameters that arrive
+  while it is in flight wait for it and get a copy of its result, or its error
+- only calls at temperature 0 are shared, a sampled completion isn't a stand-in for another
+- a coalesced result has no `token_usage`, so the run metrics only count the tokens spent once
+- nothing is kept once the call completes, it's not a cache
+
+Streaming calls go to the model unchanged. get_single_flight_stats() returns the calls, the ones
+that went to the model and the ones that were coalesced. `LLM_SINGLE_FLIGHT_ENABLED=false` turns
+it off.
+
+Usage:
+    llm = SingleFlightChatOpenAI(temperature=0, ...)  # common.get_llm does this
+"""
+
+import functools
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain.callbacks.manager import CallbackManagerForLLMRun
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import BaseMessage, ChatResult
+
+
+class SingleFlight:
+    """Runs one call per key at a time, the callers that come while it runs share its result."""
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "model_calls": 0, "coalesced": 0, "not_deterministic": 0}
+
+    def count(self, *counters: str) -> None:
+        with self._lock:
+            for counter in counters:
+                self.stats[counter] += 1
+
+    def do(self, key: str, call: Callable[[], Any]) -> Tuple[Any, bool]:
+        """The result of the call and whether it came from another caller's call."""
+        with self._lock:
+            self.stats["calls"] += 1
+            future = self._calls.get(key)
+            coalesced = future is not None
+            if coalesced:
+                self.stats["coalesced"] += 1
+            else:
+                self.stats["model_calls"] += 1
+                future = self._calls[key] = Future()
+        if coalesced:
+            return future.result(), True
+        try:
+            result = call()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._calls)}
+
+
+_single_flight = SingleFlight()
+
+
+def get_single_flight_stats() -> dict:
+    return _single_flight.get_stats()
+
+
+def single_flight_enabled() -> bool:
+    return os.getenv("LLM_SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+
+class SingleFlightChatOpenAI(ChatOpenAI):
+    """ChatOpenAI that shares one completion between concurrent identical calls, in every thread of the process."""
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        generate = functools.partial(super()._generate, messages, stop=stop, run_manager=run_manager, **kwargs)
+        if not single_flight_enabled():
+            return generate()
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {**params, **kwargs}
+        if self.streaming or params.get("temperature") != 0:
+            _single_flight.count("calls", "model_calls", "not_deterministic")
+            return generate()
+
+        key = hashlib.sha256(json.dumps([message_dicts, params], sort_keys=True, default=str).encode()).hexdigest()
+        result, coalesced = _single_flight.do(key, generate)
+        if not coalesced:
+            return result
+        result = result.copy(deep=True)
+        result.llm_output = {**(result.llm_output or {}), "token_usage": {}}
+        return result
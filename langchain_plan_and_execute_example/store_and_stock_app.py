@@ -2,6 +2,8 @@ from flask import Flask, request, jsonify
 import json
 import copy
 
+from coalescing import coalesce, get_stats
+
 app = Flask(__name__)
 
 all_stores = [
@@ -30,6 +32,7 @@ stock_qty = [
     {"store_id": "105", "item_code": "ORG-FERT", "qty": 0}
 ]
 
+@coalesce("get_all_stores", ttl=5)
 def get_all_stores(action_input: dict) -> str:
     result = json.dumps(all_stores)
     return f"""
@@ -42,6 +45,7 @@ i.e. Hardy Bayswater (ID:101), Hardy Ringwood (ID:102), etc.
 {result}
 """
 
+@coalesce("find_closest_store", ttl=5)
 def find_closest_store(action_input: dict) -> str:
     # mock distances
     stores = copy.deepcopy(all_stores)
@@ -59,6 +63,7 @@ i.e. Hardy Bayswater (ID:101), Hardy Ringwood (ID:102), etc.
 {result}
 """
 
+@coalesce("find_available_stock", ttl=1)
 def find_available_stock(action_input: dict) -> str:
     store = action_input["store_id"] if "store_id" in action_input else None
     item_code = action_input["item_code"]
@@ -79,6 +84,7 @@ def find_available_stock(action_input: dict) -> str:
 
     return f"Sorry, {item_code} is not available in any store."
 
+@coalesce("find_item", ttl=5)
 def find_item(action_input: dict) -> str:
     query: str = action_input["query"].lower()
     results = [item for item in all_stock_items if item["item_code"].lower() == query or
@@ -155,5 +161,9 @@ def process_find_item():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/coalescing/stats', methods=['GET'])
+def process_coalescing_stats():
+    return jsonify(get_stats())
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=50002, debug=True)
@@ -0,0 +1,189 @@
+"""
+Only the tools relevant to a plan step in the executor's prompt.
+
+The executor's prompt describes every tool it can use, and each knowledge provider adds its
+description and input format from catalog.json. That's fine for a handful of providers, but the
+prompt grows with the catalog and every step pays for it. ToolRetrievalExecutor keeps a BM25
+index over the catalog tools' names and descriptions, built once when the agent is set up, and
+gives the executor of each step only the `TOOL_RETRIEVAL_TOP_K` catalog tools that best match the
+step:
+
+- a tool's name counts twice, split into words (`closest_store_finder` matches "closest store")
+- words are lowercased and lose a plural `s`, and words every tool has (the input format's
+  `request_payload`, `metadata`) weigh next to nothing
+- tools that score the same keep their catalog order, so a step that matches nothing still gets
+  the first tools of the catalog
+
+The tools that aren't from the catalog, `UserInput` and the built-in search and calculator, are
+offered on every step, a step rarely says that it needs to ask the user.
+
+An executor is set up per set of tools and reused by every step and session that gets the same
+set. get_stats() returns the steps, the tools offered and the characters of tool descriptions in
+the prompt against those of every tool. `TOOL_RETRIEVAL_ENABLED=false` offers every tool on
+every step.
+
+    python3 tool_retrieval.py "Find the closest store to Ringwood"
+
+prints the catalog.json tools a step would get and their scores.
+
+Usage:
+    executor = ToolRetrievalExecutor.from_tools(llm, tools, catalog_tools=knowledge_tools, top_k=3, verbose=True)
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+from langchain.callbacks.manager import Callbacks
+from langchain.schema.language_model import BaseLanguageModel
+from langchain.tools import BaseTool
+from langchain_experimental.plan_and_execute import load_agent_executor
+from langchain_experimental.plan_and_execute.executors.base import BaseExecutor, ChainExecutor
+from langchain_experimental.plan_and_execute.schema import StepResponse
+from langchain_experimental.pydantic_v1 import PrivateAttr
+
+# executors kept for the tool sets seen last
+MAX_EXECUTORS = 64
+
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def tool_retrieval_enabled() -> bool:
+    return os.getenv("TOOL_RETRIEVAL_ENABLED", "true").lower() == "true"
+
+
+def tokenize(text: str) -> List[str]:
+    words = WORD.findall(text.lower().replace("_", " "))
+    return [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word for word in words]
+
+
+class BM25Index:
+    """Okapi BM25 over the (name, description) of each tool."""
+
+    def __init__(self, documents: Sequence[Tuple[str, str]], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.terms = [Counter(tokenize(name) * 2 + tokenize(description)) for name, description in documents]
+        self.lengths = [sum(terms.values()) for terms in self.terms]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        frequencies = Counter(term for terms in self.terms for term in terms)
+        count = len(self.terms)
+        self.idf = {term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5)) for term, frequency in frequencies.items()}
+
+    def scores(self, query: str) -> List[float]:
+        query_terms = set(tokenize(query))
+        scores = []
+        for terms, length in zip(self.terms, self.lengths):
+            score = 0.0
+            for term in query_terms:
+                frequency = terms.get(term, 0)
+                if frequency:
+                    norm = self.k1 * (1 - self.b + self.b * length / self.average_length)
+                    score += self.idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+    def search(self, query: str, top_k: int) -> List[int]:
+        """The positions of the top_k best matching documents, best first."""
+        scores = self.scores(query)
+        return sorted(range(len(scores)), key=lambda index: (-scores[index], index))[:top_k]
+
+
+class ToolRetrievalExecutor(BaseExecutor):
+    """Runs each step with an agent executor that has only the catalog tools matching the step."""
+
+    llm: BaseLanguageModel
+    tools: List[BaseTool]
+    # the tools top_k applies to, the others are offered on every step
+    catalog_tools: List[BaseTool]
+    top_k: int
+    verbose: bool = False
+    index: BM25Index
+
+    _executors: "OrderedDict[Tuple[str, ...], ChainExecutor]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _stats: Dict[str, int] = PrivateAttr(
+        default_factory=lambda: {"steps": 0, "tools_offered": 0, "description_chars_offered": 0, "executors_built": 0}
+    )
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @classmethod
+    def from_tools(
+        cls, llm: BaseLanguageModel, tools: List[BaseTool], catalog_tools: List[BaseTool], top_k: int, verbose: bool = False
+    ) -> "ToolRetrievalExecutor":
+        index = BM25Index([(tool.name, tool.description) for tool in catalog_tools])
+        return cls(llm=llm, tools=tools, catalog_tools=catalog_tools, top_k=top_k, verbose=verbose, index=index)
+
+    def select_tools(self, step: str) -> List[BaseTool]:
+        if not tool_retrieval_enabled():
+            return self.tools
+        catalog = {tool.name for tool in self.catalog_tools}
+        selected = {self.catalog_tools[index].name for index in self.index.search(step, self.top_k)}
+        # in the order of tools, the agent's prompt lists them as given
+        return [tool for tool in self.tools if tool.name not in catalog or tool.name in selected]
+
+    def executor_for(self, tools: List[BaseTool]) -> ChainExecutor:
+        key = tuple(tool.name for tool in tools)
+        with self._lock:
+            self._stats["steps"] += 1
+            self._stats["tools_offered"] += len(tools)
+            self._stats["description_chars_offered"] += sum(len(tool.description) for tool in tools)
+            executor = self._executors.get(key)
+            if executor is not None:
+                self._executors.move_to_end(key)
+                return executor
+            self._stats["executors_built"] += 1
+            executor = self._executors[key] = load_agent_executor(self.llm, tools, verbose=self.verbose)
+            if len(self._executors) > MAX_EXECUTORS:
+                self._executors.popitem(last=False)
+            return executor
+
+    def step(self, inputs: dict, callbacks: Callbacks = None, **kwargs: Any) -> StepResponse:
+        return self.executor_for(self.select_tools(inputs["current_step"])).step(inputs, callbacks=callbacks, **kwargs)
+
+    async def astep(self, inputs: dict, callbacks: Callbacks = None, **kwargs: Any) -> StepResponse:
+        return await self.executor_for(self.select_tools(inputs["current_step"])).astep(inputs, callbacks=callbacks, **kwargs)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        steps = stats["steps"] or 1
+        return {
+            "enabled": tool_retrieval_enabled(),
+            "top_k": self.top_k,
+            "tools": len(self.tools),
+            "catalog_tools": len(self.catalog_tools),
+            "description_chars": sum(len(tool.description) for tool in self.tools),
+            "steps": stats["steps"],
+            "mean_tools_offered": round(stats["tools_offered"] / steps, 2),
+            "mean_description_chars_offered": round(stats["description_chars_offered"] / steps),
+            "executors_built": stats["executors_built"],
+        }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Print the catalog.json tools a plan step would be given, besides the tools offered on every step.")
+    parser.add_argument("step", help="the plan step, i.e. \"Find the closest store to Ringwood\"")
+    parser.add_argument("--top-k", type=int, default=int(os.getenv("TOOL_RETRIEVAL_TOP_K", "3")), help="catalog tools given to the step")
+    parser.add_argument("--catalog", default="catalog.json", help="the knowledge provider catalog")
+    args = parser.parse_args()
+
+    with open(args.catalog, "r") as catalog_file:
+        documents = [(config["name"], config["description"]) for config in json.load(catalog_file)]
+    index = BM25Index(documents)
+    scores = index.scores(args.step)
+    for position in index.search(args.step, args.top_k):
+        print(f"{scores[position]:6.2f}  {documents[position][0]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
 from flask import Flask, request, jsonify
 
+from coalescing import coalesce, get_stats
+
 app = Flask(__name__)
 
 def weather_data(where: str = None, when: str = None) -> str:
@@ -27,6 +29,7 @@ def weather_data(where: str = None, when: str = None) -> str:
     else:
         return 'I don\'t know'
 
+@coalesce("weather", ttl=5)
 def weather(action_input: dict) -> str:
     where = action_input["location"]
     when = action_input["date"]
@@ -48,5 +51,9 @@ def process_request():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/coalescing/stats', methods=['GET'])
+def process_coalescing_stats():
+    return jsonify(get_stats())
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=50001, debug=True)